@@ -1,42 +1,27 @@
-import serial
+# -*- coding: utf-8 -*-
 import time
 
-def parse_gprmc(data):
-    try:
-        if not data.startswith('$GPRMC'):
-            return None
-        parts = data.split(',')
-        if len(parts) < 10 or parts[2] != 'A':
-            return None
-        lat = float(parts[3][:2]) + float(parts[3][2:])/60
-        lon = float(parts[5][:3]) + float(parts[5][3:])/60
-        if parts[4] == 'S': lat = -lat
-        if parts[6] == 'W': lon = -lon
-        return (lat, lon)
-    except Exception as e:
-        print("解析错误:", e)
-        return None
+import hal
+import gps
 
-# 使用未被系统占用的串口（如 /dev/ttyS3）
+# 串口（如 /dev/ttyS3）由硬件后端打开；RUNSIGHT_BACKEND=sim 时回放模拟轨迹
 try:
-    uart = serial.Serial('/dev/ttyS3', baudrate=9600, timeout=1)
+    uart = hal.create_backend().gps_uart()
     print("串口已连接，等待数据...")
 except Exception as e:
     print(f"串口连接失败: {e}")
     exit()
 
+receiver = gps.GpsReceiver(uart)
+receiver.subscribe(lambda fix: print(
+    f"纬度: {fix.lat:.6f}, 经度: {fix.lon:.6f}, 速度: {fix.speed:.2f}m/s, "
+    f"卫星: {fix.satellites}, HDOP: {fix.hdop:.1f}" if fix.valid else "等待定位..."))
+receiver.start()
+
 try:
     while True:
-        if uart.in_waiting > 0:
-            raw_data = uart.read(uart.in_waiting())
-            lines = raw_data.decode('utf-8', errors='ignore').split('\r\n')
-            for line in lines:
-                line = line.strip()
-                if line:
-                    print("原始数据:", line)
-                    pos = parse_gprmc(line)
-                    if pos:
-                        print(f"纬度: {pos[0]:.6f}, 经度: {pos[1]:.6f}")
-        time.sleep(0.1)
+        time.sleep(5)
+        print("统计:", receiver.stats())
 except KeyboardInterrupt:
+    receiver.stop()
     uart.close()
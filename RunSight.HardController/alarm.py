@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+非阻塞报警模式引擎
+
+报警以声明式的脉冲序列描述，由独立的调度线程按时间表驱动马达/蜂鸣器/指示灯，
+触发方（监控循环）只投递请求、立即返回，不会因为报警而停止采样。
+
+重叠报警的处理规则：
+    - 优先级更高的报警立即抢占当前报警；
+    - 与当前报警相同的模式合并为一次待播放（不会无限排队）；
+    - 其余报警进入唯一的待播放槽，只保留优先级最高的一个。
+"""
+import collections
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import hal
+import metrics
+
+ALL_OUTPUTS = (hal.MOTOR, hal.BUZZER, hal.STATUS_LED)
+
+
+class Pulse(NamedTuple):
+    """一个脉冲：outputs 同时拉高 on 秒，再全部拉低 off 秒"""
+    outputs: Sequence[str]
+    on: float
+    off: float = 0.0
+
+
+class Pattern(NamedTuple):
+    """报警模式"""
+    name: str
+    pulses: Sequence[Pulse]
+    priority: int = 0
+
+    @property
+    def duration(self) -> float:
+        return sum(p.on + p.off for p in self.pulses)
+
+
+# 急停：3 次震动 + 蜂鸣
+STOP_ALARM = Pattern("stop", [Pulse(ALL_OUTPUTS, 0.3, 0.2)] * 3, priority=1)
+# 跌倒：5 次长震动 + 蜂鸣，优先级高于急停
+FALL_ALARM = Pattern("fall", [Pulse(ALL_OUTPUTS, 0.8, 0.2)] * 5, priority=2)
+
+# 报警的语音提示（按模式名），语音服务可用时与震动同时播报；tts_cache 会预合成这些短语
+SPOKEN_ALERTS = {
+    STOP_ALARM.name: "注意，检测到急停，请注意安全。",
+    FALL_ALARM.name: "检测到跌倒，你还好吗？",
+}
+
+LATENCY = metrics.histogram("alarm_latency_seconds", "检测到事件到首个执行器上升沿的延迟", metrics.LATENCY_BUCKETS)
+
+
+class _Playback:
+    """一次报警播放：按时间排好的电平变化序列"""
+
+    def __init__(self, pattern: Pattern, start: float, detected_at: Optional[float]):
+        self.pattern = pattern
+        self.detected_at = detected_at
+        self.edges = collections.deque()
+        t = start
+        for pulse in pattern.pulses:
+            self.edges.append((t, pulse.outputs, 1))
+            t += pulse.on
+            self.edges.append((t, pulse.outputs, 0))
+            t += pulse.off
+        self.first_edge = True
+
+
+class AlarmEngine:
+    """报警调度线程"""
+
+    def __init__(self, outputs: Dict[str, "hal.OutputPin"], clock=time.monotonic, history: int = 100):
+        self.outputs = outputs
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._current = None   # type: Optional[_Playback]
+        self._pending = None   # type: Optional[tuple]
+        self._running = False
+        self._thread = None
+
+        # 统计信息
+        self.played = 0
+        self.preempted = 0
+        self.merged = 0
+        self.latencies = collections.deque(maxlen=history)  # 检测到首个执行器上升沿的延迟（秒）
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="alarm", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止调度线程并关闭所有输出"""
+        with self._cond:
+            self._running = False
+            self._current = None
+            self._pending = None
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._all_off()
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None
+
+    def trigger(self, pattern: Pattern, detected_at: Optional[float] = None):
+        """
+        请求播放报警（不阻塞）
+
+        Args:
+            pattern: 报警模式
+            detected_at: 检测到事件的单调时间，用于统计检测到报警的延迟
+        """
+        with self._cond:
+            current = self._current
+            if current is None:
+                self._current = _Playback(pattern, self._clock(), detected_at)
+            elif pattern.priority > current.pattern.priority:
+                self.preempted += 1
+                self._current = None
+                self._pending = (pattern, detected_at)
+            elif pattern.name == current.pattern.name:
+                self.merged += 1
+                if self._pending is None:
+                    self._pending = (pattern, detected_at)
+            elif self._pending is None or pattern.priority > self._pending[0].priority:
+                self._pending = (pattern, detected_at)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "played": self.played,
+            "preempted": self.preempted,
+            "merged": self.merged,
+            "latency_p50_ms": 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_max_ms": 1000 * latencies[-1] if latencies else 0.0,
+        }
+
+    def _all_off(self):
+        for pin in self.outputs.values():
+            pin.write_digital(0)
+
+    def _write(self, names: Sequence[str], value: int):
+        for name in names:
+            pin = self.outputs.get(name)
+            if pin is not None:
+                pin.write_digital(value)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                reset, edge, playback = self._next()
+            # 引脚写入（GPIO/I2C）可能较慢，在锁外执行，触发方和 stop() 不会被阻塞
+            if reset:
+                self._all_off()
+            if edge is not None:
+                names, value = edge
+                self._write(names, value)
+                if value and playback.first_edge:
+                    playback.first_edge = False
+                    if playback.detected_at is not None:
+                        latency = self._clock() - playback.detected_at
+                        self.latencies.append(latency)
+                        LATENCY.observe(latency)
+
+    def _next(self) -> tuple:
+        """
+        持有 _cond 时调用：推进调度状态，返回 (是否先复位所有输出, 待写入的电平变化, 所属播放)
+
+        没有到期的电平变化时在条件变量上等待，返回后由 _run 重新检查。
+        """
+        playback = self._current
+        if playback is None or not playback.edges:
+            # 被抢占的报警可能停在高电平，开始下一个报警前先复位
+            reset = playback is None and self._pending is not None
+            if playback is not None:
+                self.played += 1
+            self._current = None
+            if self._pending is not None:
+                pattern, detected_at = self._pending
+                self._pending = None
+                self._current = _Playback(pattern, self._clock(), detected_at)
+            else:
+                self._cond.wait()
+            return reset, None, None
+
+        t, names, value = playback.edges[0]
+        delay = t - self._clock()
+        if delay > 0:
+            # 等待期间可能被抢占，醒来后重新检查
+            self._cond.wait(delay)
+            return False, None, None
+        playback.edges.popleft()
+        return False, (names, value), playback
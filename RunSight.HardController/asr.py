@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+流式语音识别
+
+录音过程中 voice_interact 把 VAD 判定为人声后的每一帧交给识别器，识别器在用户说话的同时
+产生部分识别结果（partial），说完后给出最终结果（final）。这样“结束运动”之类的指令可以在
+静默超时之前就被执行。
+
+StreamingRecognizer 是接口：支持流式输入的 ASR 后端可以直接实现 feed/finish；
+对只支持整段转写的 Whisper 接口，WindowedRecognizer 对不断增长的录音窗口周期性地重新转写。
+"""
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+import audio_codec
+import logs
+
+log = logs.get("识别")
+
+
+class Hypothesis(NamedTuple):
+    """识别结果"""
+    text: str
+    final: bool
+    audio_seconds: float   # 本结果覆盖的录音时长
+    latency: float         # 从覆盖的最后一个采样到结果可用的耗时（秒）
+
+
+class StreamingRecognizer:
+    """流式识别接口"""
+
+    def __init__(self, on_partial: Optional[Callable[[Hypothesis], None]] = None):
+        self.on_partial = on_partial
+
+    def start(self):
+        """开始新的一段语音"""
+
+    def feed(self, pcm: np.ndarray):
+        """送入一帧 int16 PCM（在音频回调线程中调用，必须尽快返回）"""
+        raise NotImplementedError
+
+    def finish(self, utterance) -> Hypothesis:
+        """语音结束，返回最终结果"""
+        raise NotImplementedError
+
+    def end(self):
+        """
+        语音结束（在音频回调线程中调用，必须尽快返回），之后送入的帧属于下一段语音
+
+        返回交给 resolve 的识别状态；录音结束时立即调用 end，较慢的 resolve 放到回合线程中，
+        回合处理期间开始的新语音不会影响这一段的结果。
+        """
+        return None
+
+    def resolve(self, utterance, state) -> Hypothesis:
+        """由 end() 的返回值得到最终结果（可能较慢）"""
+        return self.finish(utterance)
+
+    def cancel(self):
+        """放弃当前语音（不需要最终结果）"""
+
+
+class WindowedRecognizer(StreamingRecognizer):
+    """
+    增长窗口式识别：说话过程中每新增 interval 秒录音，就把目前为止的完整录音送去转写一次。
+    同一时间最多只有一个请求在途，慢网络下会自动拉长实际间隔而不是堆积请求。
+    """
+
+    def __init__(self, transcribe: Callable[[audio_codec.EncodedAudio], str],
+                 on_partial: Optional[Callable[[Hypothesis], None]] = None,
+                 sample_rate: int = 16000, interval: float = 0.8, min_audio: float = 0.6,
+                 max_seconds: float = 30.0, codec: str = audio_codec.DEFAULT_CODEC):
+        super().__init__(on_partial)
+        self.transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.interval = int(interval * sample_rate)
+        self.min_audio = int(min_audio * sample_rate)
+        self.codec = codec
+        self._pcm = np.zeros(int(max_seconds * sample_rate), dtype=np.int16)
+        self._samples = 0       # 当前语音已送入的采样数
+        self._sent = 0          # 最近一次部分识别覆盖的采样数
+        self._last = None       # type: Optional[Hypothesis]
+        self._generation = 0    # 每段语音递增，丢弃上一段迟到的结果
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="asr-partial", daemon=True)
+        self._thread.start()
+
+    def start(self):
+        with self._cond:
+            self._generation += 1
+            self._samples = 0
+            self._sent = 0
+            self._last = None
+
+    def cancel(self):
+        self.start()
+
+    def feed(self, pcm: np.ndarray):
+        n = min(len(pcm), len(self._pcm) - self._samples)
+        if n <= 0:
+            return
+        self._pcm[self._samples:self._samples + n] = pcm[:n]
+        self._samples += n
+        if self._samples - self._sent >= self.interval and self._samples >= self.min_audio:
+            with self._cond:
+                self._cond.notify()
+
+    @property
+    def last(self) -> Optional[Hypothesis]:
+        """最近一次部分识别结果"""
+        return self._last
+
+    def finish(self, utterance, reuse_tail: float = 0.7) -> Hypothesis:
+        """
+        返回最终结果
+
+        如果最近一次部分识别已覆盖到语音结尾（只差静默拖尾 reuse_tail 秒以内），直接复用，
+        省掉一次完整转写。
+        """
+        return self.resolve(utterance, self.end(), reuse_tail)
+
+    def end(self) -> Optional[Hypothesis]:
+        """结束当前语音，返回最近一次部分识别结果"""
+        with self._cond:
+            self._generation += 1
+            self._samples = 0
+            self._sent = 0
+            last, self._last = self._last, None
+        return last
+
+    def resolve(self, utterance, last: Optional[Hypothesis], reuse_tail: float = 0.7) -> Hypothesis:
+        """部分识别结果已覆盖到语音结尾时直接复用，否则完整转写一次"""
+        total = utterance.duration
+        if last is not None and total - last.audio_seconds <= reuse_tail:
+            return Hypothesis(last.text, True, last.audio_seconds, 0.0)
+        started = time.monotonic()
+        text = self.transcribe(utterance.encode(self.codec))
+        return Hypothesis(text, True, total, time.monotonic() - started)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._samples - self._sent < self.interval or self._samples < self.min_audio:
+                    self._cond.wait()
+                generation = self._generation
+                n = self._samples
+                self._sent = n
+                pcm = self._pcm[:n].copy()
+            captured = time.monotonic()
+            try:
+                text = self.transcribe(audio_codec.encode(pcm, self.sample_rate, self.codec))
+            except Exception as e:
+                log.warning("部分识别失败：%s", e)
+                continue
+            hypothesis = Hypothesis(text, False, n / self.sample_rate, time.monotonic() - captured)
+            with self._cond:
+                if generation != self._generation:
+                    continue
+                self._last = hypothesis
+            if self.on_partial is not None:
+                self.on_partial(hypothesis)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+内存中的音频编码
+
+录音以 int16 PCM 的 NumPy 数组在线程间传递，上传前在内存中编码为 WAV/FLAC/Opus，
+全程不落盘（不写 SD 卡）。FLAC/Opus 依赖可选的 soundfile（libsndfile），
+不可用时自动退回 WAV。
+"""
+import io
+import os
+import wave
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+try:
+    import soundfile
+except (ImportError, OSError):
+    soundfile = None
+
+import logs
+
+log = logs.get("音频")
+
+WAV = "wav"
+FLAC = "flac"
+OPUS = "opus"
+
+# 编解码 -> (文件扩展名, MIME 类型, soundfile 格式, soundfile 子类型)
+_FORMATS = {
+    WAV: ("wav", "audio/wav", "WAV", "PCM_16"),
+    FLAC: ("flac", "audio/flac", "FLAC", "PCM_16"),
+    OPUS: ("ogg", "audio/ogg", "OGG", "OPUS"),
+}
+
+# 默认编码（RUNSIGHT_AUDIO_CODEC 环境变量）：未配置时有 soundfile 用 FLAC，否则 WAV
+DEFAULT_CODEC = os.getenv("RUNSIGHT_AUDIO_CODEC") or (FLAC if soundfile is not None else WAV)
+
+
+class EncodedAudio(NamedTuple):
+    """编码后的音频，可直接作为 openai/requests 的文件参数"""
+    filename: str
+    data: bytes
+    mimetype: str
+
+    def as_file(self) -> Tuple[str, bytes, str]:
+        return self.filename, self.data, self.mimetype
+
+
+def encode_wav(pcm: np.ndarray, sample_rate: int, channels: int = 1) -> bytes:
+    """用标准库把 int16 PCM 编码为 WAV"""
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(np.ascontiguousarray(pcm, dtype=np.int16).tobytes())
+    return out.getvalue()
+
+
+def encode(pcm: np.ndarray, sample_rate: int, codec: str = DEFAULT_CODEC, name: str = "speech") -> EncodedAudio:
+    """
+    编码 int16 PCM
+
+    Args:
+        pcm: 单声道 int16 采样
+        sample_rate: 采样率
+        codec: wav / flac / opus
+        name: 文件名（不含扩展名），仅用于上传时的 multipart 字段
+    """
+    if codec not in _FORMATS:
+        raise ValueError(f"不支持的音频编码：{codec}")
+    if codec != WAV and soundfile is None:
+        log.warning("soundfile 不可用，%s 编码退回 WAV", codec)
+        codec = WAV
+    ext, mimetype, fmt, subtype = _FORMATS[codec]
+    if codec == WAV:
+        data = encode_wav(pcm, sample_rate)
+    else:
+        out = io.BytesIO()
+        soundfile.write(out, pcm, sample_rate, format=fmt, subtype=subtype)
+        data = out.getvalue()
+    return EncodedAudio(f"{name}.{ext}", data, mimetype)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+重力基准在线估计
+
+急停检测比较的是 Z 轴去掉重力分量后的加速度，重力在 Z 轴上的分量取决于设备的佩戴姿态。
+原先启动时要求静止 1 秒取均值，之后整场运动固定不变；设备在身上移位后基准偏离，误报随之漂移。
+
+GravityBaseline 挂在检测流水线上，把样本按 1 秒分窗，每个窗口给出一次 Z 轴重力分量的观测：
+    静止窗口（合成幅值波动小且接近 g）：Z 轴均值，噪声按样本方差估计，收敛快
+    运动窗口：Z 轴中位数（步伐振动上下对称，中位数不受单次急停冲击影响），噪声大，收敛慢
+观测经过标量卡尔曼滤波合并，方差随时间按姿态漂移增长；偏离过大的观测视为冲击直接丢弃。
+估计方差换算为 0–1 的置信度。最近一次结果保存在数据目录，开机即可使用，不再阻塞启动。
+"""
+import json
+import math
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+import logs
+import storage
+from detectors import Detector, Batch, GRAVITY
+
+log = logs.get("校准")
+
+FILE_NAME = "calibration.json"
+WINDOW = 1.0               # 观测窗口 (s)
+STILL_STD = 0.5            # 合成幅值标准差低于该值视为静止 (m/s²)
+STILL_TOLERANCE = 1.0      # 静止时合成幅值与 g 的最大偏差 (m/s²)
+STILL_FLOOR = 0.05         # 静止观测的最小噪声 (m/s²)
+MOVING_NOISE = 0.8         # 运动窗口中位数的观测噪声 (m/s²)
+DRIFT = 0.02               # 佩戴姿态变化引起的基准漂移 (m/s²/√s)
+GATE = 3.0                 # 新息超过 GATE 倍标准差的观测丢弃
+UNCERTAIN = 1.0            # 估计标准差达到该值时置信度为 0 (m/s²)
+BOOT_STD = 0.3             # 从文件恢复时的最小标准差（重新佩戴后姿态可能不同）
+SAVE_INTERVAL = 60.0       # 自动保存间隔 (s)
+RESET_AFTER = 5            # 连续丢弃的观测数达到该值时重新收敛（设备已明显换了姿态）
+
+
+class BaselineEvent(NamedTuple):
+    """重力基准更新（每个观测窗口发布一次）"""
+    t: float
+    detector: str
+    base_z: float      # Z 轴重力分量 (m/s²)
+    confidence: float  # 0–1
+    still: bool        # 本窗口是否静止
+
+
+class GravityBaseline(Detector):
+    """Z 轴重力分量的在线估计"""
+
+    name = "baseline"
+
+    def __init__(self, rate: float, path: Optional[str] = None, window: float = WINDOW):
+        super().__init__()
+        self.path = path or storage.data_path(FILE_NAME)
+        self.window = max(2, int(round(window * rate)))
+        self.base_z = GRAVITY
+        self.variance = UNCERTAIN * UNCERTAIN
+        self.updates = 0
+        self.rejected = 0
+        self._rejected_run = 0
+        self._z = np.empty(self.window)
+        self._mag = np.empty(self.window)
+        self._filled = 0
+        self._last_t = None  # type: Optional[float]
+        self._saved_at = time.monotonic()
+        self._saving = False
+        self.load()
+
+    @property
+    def confidence(self) -> float:
+        return max(0.0, 1.0 - math.sqrt(self.variance) / UNCERTAIN)
+
+    def load(self) -> bool:
+        """读取上次保存的基准，返回是否成功"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            base_z = float(data["base_z"])
+            std = max(BOOT_STD, math.sqrt(float(data["variance"])))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("读取校准文件失败：%s", e)
+            return False
+        self.base_z = base_z
+        self.variance = min(std * std, UNCERTAIN * UNCERTAIN)
+        return True
+
+    def save(self):
+        """原子写入当前基准（可在任意线程中调用）"""
+        data = {"base_z": self.base_z, "variance": self.variance, "saved": time.time()}
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("保存校准文件失败：%s", e)
+
+    def process(self, batch: Batch):
+        start = len(batch.samples) - batch.new
+        z = batch.z[start:]
+        mag = batch.magnitude[start:]
+        t = batch.t[start:]
+        pos = 0
+        while pos < len(z):
+            n = min(len(z) - pos, self.window - self._filled)
+            self._z[self._filled:self._filled + n] = z[pos:pos + n]
+            self._mag[self._filled:self._filled + n] = mag[pos:pos + n]
+            self._filled += n
+            pos += n
+            if self._filled == self.window:
+                self._filled = 0
+                self._observe(float(t[pos - 1]))
+        if not self._saving and self.updates and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self._saving = True
+            threading.Thread(target=self._save_background, name="baseline-save", daemon=True).start()
+
+    def _observe(self, t: float):
+        # 方差随时间增长：姿态可能已经改变
+        if self._last_t is not None:
+            self.variance = min(self.variance + DRIFT * DRIFT * (t - self._last_t), UNCERTAIN * UNCERTAIN)
+        self._last_t = t
+        still = (float(np.std(self._mag)) < STILL_STD
+                 and abs(float(np.mean(self._mag)) - GRAVITY) < STILL_TOLERANCE)
+        if still:
+            value = float(np.mean(self._z))
+            noise = float(np.var(self._z)) / self.window + STILL_FLOOR * STILL_FLOOR
+        else:
+            value = float(np.median(self._z))
+            noise = MOVING_NOISE * MOVING_NOISE
+        innovation = value - self.base_z
+        s = self.variance + noise
+        if innovation * innovation > GATE * GATE * s:
+            self.rejected += 1
+            self._rejected_run += 1
+            if self._rejected_run < RESET_AFTER:
+                return
+            self.variance = UNCERTAIN * UNCERTAIN
+            s = self.variance + noise
+        self._rejected_run = 0
+        k = self.variance / s
+        self.base_z += k * innovation
+        self.variance *= 1.0 - k
+        self.updates += 1
+        self.emit(BaselineEvent(t, self.name, self.base_z, self.confidence, still))
+
+    def _save_background(self):
+        try:
+            self.save()
+        finally:
+            self._saved_at = time.monotonic()
+            self._saving = False
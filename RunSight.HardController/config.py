@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+运行配置
+
+配置以不可变快照（Settings）发布：每次更新在锁内校验、生成新快照并递增版本号，
+再整体替换 ConfigStore.current 这一个引用。读取方（包括 20–100Hz 的监控循环）直接读这个属性，
+拿到的总是某个完整的快照，不需要加锁；比较版本号即可知道是否有变化。
+
+各子系统通过 subscribe 注册变更回调（可以只关心部分字段）。每次更新都先原子写入磁盘
+（临时文件 + fsync + rename），开机时直接读取上次的配置。配置文件含 WiFi 密码，只允许属主读写（0600）。
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import logs
+import storage
+
+log = logs.get("配置")
+
+FILE_NAME = "config.json"
+FILE_MODE = 0o600          # 配置文件含 WiFi 密码
+
+
+class Settings(NamedTuple):
+    """配置快照（字段名与 Web 接口一致）"""
+    SpeedThreshold: float = -5.5   # 急停阈值：去重力后的 Z 轴加速度 (m/s²)，推荐 -3.5 ~ -5.5，负值越小灵敏度越低
+    TriggerTime: float = 0.15      # 连续低于阈值的持续时间 (s)，推荐 0.1 ~ 0.3，越大抗干扰能力越强
+    DebounceTime: float = 2.0      # 两次急停报警的最小间隔 (s)，推荐 1.5 ~ 3.0，越大误报率越低
+    BufferSeconds: float = 10.0    # 采样环形缓冲区时长 (s)，重启后生效
+    DecelThreshold: float = -3.0   # 融合速度下的急减速阈值：前进方向平滑加速度 (m/s²)
+    MinStopSpeed: float = 1.5      # 急减速前的最低速度 (m/s)，低于该速度的减速不算急停
+    ForwardAxis: str = "+Y"        # 佩戴时朝向跑步方向的加速度计轴及其正负
+    WifiSSID: str = ""
+    WifiPassword: str = ""
+    UID: int = 0
+    version: int = 0               # 每次更新加一
+    updated: float = 0.0           # 最近更新的时间（Unix 时间戳）
+
+
+# 数值字段的取值范围
+LIMITS = {
+    "SpeedThreshold": (-20.0, -1.0),
+    "TriggerTime": (0.02, 1.0),
+    "DebounceTime": (0.0, 10.0),
+    "BufferSeconds": (2.0, 60.0),
+    "DecelThreshold": (-15.0, -0.5),
+    "MinStopSpeed": (0.0, 10.0),
+}
+
+# 字符串字段的可选值
+CHOICES = {
+    "ForwardAxis": ("+X", "-X", "+Y", "-Y"),
+}
+
+# 不能通过 update 修改的字段
+_INTERNAL = ("version", "updated")
+# 可以修改的字段
+FIELDS = tuple(name for name in Settings._fields if name not in _INTERNAL)
+
+Callback = Callable[[Settings, Settings], None]
+
+
+def _coerce(name: str, value):
+    """按字段默认值的类型转换并检查范围，不合法时抛出 ValueError"""
+    kind = type(Settings._field_defaults[name])
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(f"{name} 必须是字符串，收到：{type(value).__name__}")
+        if name in CHOICES and value not in CHOICES[name]:
+            raise ValueError(f"{name} 只能是 {'/'.join(CHOICES[name])}，收到：{value}")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} 必须是数字类型，收到：{type(value).__name__}")
+    if kind is int:
+        if value != int(value):
+            raise ValueError(f"{name} 必须是整数，收到：{value}")
+        value = int(value)
+    else:
+        value = float(value)
+    if name in LIMITS:
+        low, high = LIMITS[name]
+        if not low <= value <= high:
+            raise ValueError(f"{name} 超出范围 [{low}, {high}]：{value}")
+    return value
+
+
+def diff(old: Settings, new: Settings) -> Dict[str, object]:
+    """两个快照之间变化的字段 -> 新值"""
+    return {name: getattr(new, name) for name in FIELDS if getattr(old, name) != getattr(new, name)}
+
+
+class ConfigStore:
+    """带版本号的配置存储"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or storage.data_path(FILE_NAME)
+        self._lock = threading.Lock()
+        self._listeners = []  # type: List[Tuple[Optional[frozenset], Callback]]
+        self.current = self._load()
+
+    def _load(self) -> Settings:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return Settings()
+        except (OSError, ValueError) as e:
+            log.warning("读取配置文件失败，使用默认配置：%s", e)
+            return Settings()
+        try:
+            # 早先版本按默认权限写入的配置文件同样收紧
+            os.chmod(self.path, FILE_MODE)
+        except OSError as e:
+            log.warning("无法修改配置文件权限：%s", e)
+        values = {}
+        for name, value in data.items():
+            if name not in Settings._fields:
+                continue
+            try:
+                values[name] = value if name in _INTERNAL else _coerce(name, value)
+            except ValueError as e:
+                log.warning("忽略配置项：%s", e)
+        return Settings(**values)
+
+    def subscribe(self, callback: Callback, keys: Optional[Iterable[str]] = None):
+        """
+        注册变更回调 callback(旧快照, 新快照)
+
+        keys 为关心的字段，None 表示任意字段；回调在执行 update 的线程中同步调用，应尽快返回。
+        """
+        self._listeners.append((None if keys is None else frozenset(keys), callback))
+
+    def update(self, **changes) -> Settings:
+        """
+        修改部分字段，返回新的快照；值为 None 的字段保持不变
+
+        Raises:
+            ValueError: 字段不存在或取值不合法（此时配置不变）
+        """
+        with self._lock:
+            old = self.current
+            values = {}
+            for name, value in changes.items():
+                if name not in Settings._fields or name in _INTERNAL:
+                    raise ValueError(f"未知的配置项：{name}")
+                if value is None:
+                    continue
+                value = _coerce(name, value)
+                if value != getattr(old, name):
+                    values[name] = value
+            if not values:
+                return old
+            new = old._replace(version=old.version + 1, updated=time.time(), **values)
+            self._save(new)
+            self.current = new
+        changed = frozenset(values)
+        for keys, callback in self._listeners:
+            if keys is None or keys & changed:
+                try:
+                    callback(old, new)
+                except Exception as e:
+                    log.exception("变更回调失败：%s", e)
+        return new
+
+    def _save(self, settings: Settings):
+        """原子写入：其他进程或断电后读到的要么是旧文件，要么是完整的新文件"""
+        tmp = self.path + ".tmp"
+        # 临时文件按 0600 创建，rename 后配置文件沿用该权限（umask 只会更严格）
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, FILE_MODE)
+        os.chmod(tmp, FILE_MODE)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(settings._asdict(), f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+_shared = None  # type: Optional[ConfigStore]
+_shared_lock = threading.Lock()
+
+
+def shared() -> ConfigStore:
+    """进程内共享的配置存储（Web、gRPC 和控制器使用同一份）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ConfigStore()
+        return _shared
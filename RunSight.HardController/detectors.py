@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+"""
+多检测器流水线
+
+采样线程写入环形缓冲区后，流水线每批只读取一次新样本，构造共享的 Batch 窗口
+（幅值等公共特征按需计算一次并缓存），再分发给所有注册的检测器。
+检测器用向量化的 NumPy 窗口运算（EMA、合成幅值、连续超阈值、动态阈值、滑动 DFT）处理整批数据，
+并把类型化事件发布给订阅者。
+"""
+import collections
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Type
+
+import numpy as np
+
+import metrics
+from sampler import RingBuffer, COL_T, COL_X, COL_Z
+
+GRAVITY = 9.81
+
+BATCH_TIME = metrics.histogram("pipeline_batch_seconds", "流水线处理一批样本的耗时", metrics.FAST_BUCKETS)
+DROPPED = metrics.counter("pipeline_dropped_samples_total", "处理不及时被覆盖而丢失的样本数")
+
+
+# ---------------------------------------------------------------------------
+# 事件
+# ---------------------------------------------------------------------------
+
+class StopEvent(NamedTuple):
+    """急停：Z 轴（去重力后）持续低于阈值"""
+    t: float          # 触发样本的单调时间
+    detector: str
+    value: float      # 触发时的 Z 轴加速度 (m/s²)
+
+
+class RunningEvent(NamedTuple):
+    """跑步状态变化"""
+    t: float
+    detector: str
+    running: bool
+    magnitude: float  # 触发时的合成加速度 (m/s²)
+
+
+class FallEvent(NamedTuple):
+    """跌倒：失重后紧接着冲击"""
+    t: float
+    detector: str
+    impact: float     # 冲击峰值 (m/s²)
+
+
+class CadenceEvent(NamedTuple):
+    """步频估计（每个跳步周期发布一次）"""
+    t: float
+    detector: str
+    cadence: float     # 步频（步/分钟），未检测到跑动时为 0
+    confidence: float  # 峰值能量占步频频带总能量的比例；0 表示加速度几乎没有变化（静止）
+    steps: float       # 累计步数
+    speed: float       # 步长模型估计的速度 (m/s)
+
+
+# ---------------------------------------------------------------------------
+# 向量化窗口运算
+# ---------------------------------------------------------------------------
+
+def ema(x: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """
+    指数滑动平均 y[i] = alpha * x[i] + (1 - alpha) * y[i-1]，y[-1] = initial
+
+    用 (1-alpha)^i 的闭式展开一次算完整个窗口；适用于批量较小（数百以内）的场景。
+    """
+    n = len(x)
+    if n == 0:
+        return np.empty(0)
+    decay = (1.0 - alpha) ** np.arange(1, n + 1)
+    return decay * (initial + np.cumsum(alpha * x / decay))
+
+
+def magnitude(xyz: np.ndarray) -> np.ndarray:
+    """三轴合成幅值"""
+    return np.sqrt(np.einsum("ij,ij->i", xyz, xyz))
+
+
+def run_ends(mask: np.ndarray, n: int) -> np.ndarray:
+    """返回所有“以此处结尾恰好满 n 个连续 True”的下标"""
+    if n <= 0 or len(mask) < n:
+        return np.empty(0, dtype=np.intp)
+    sums = np.concatenate(([0], np.cumsum(mask, dtype=np.intp)))
+    return np.flatnonzero(sums[n:] - sums[:-n] == n) + n - 1
+
+
+def alpha_for_rate(alpha: float, rate: float, reference_rate: float = 20.0) -> float:
+    """把在 reference_rate 下调好的平滑系数换算到 rate 采样率，保持相同的时间常数"""
+    return 1.0 - (1.0 - alpha) ** (reference_rate / rate)
+
+
+def dynamic_threshold(base: float, reference: np.ndarray, gain: float) -> np.ndarray:
+    """动态阈值：base + gain * |reference|"""
+    return base + gain * np.abs(reference)
+
+
+# ---------------------------------------------------------------------------
+# 流水线
+# ---------------------------------------------------------------------------
+
+class Batch:
+    """一次分发的数据：新样本及其之前的历史样本（零拷贝视图），公共特征懒计算并缓存"""
+
+    def __init__(self, samples: np.ndarray, new: int):
+        self.samples = samples
+        self.new = new
+        self._magnitude = None
+
+    @property
+    def t(self) -> np.ndarray:
+        return self.samples[:, COL_T]
+
+    @property
+    def xyz(self) -> np.ndarray:
+        return self.samples[:, COL_X:COL_Z + 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.samples[:, COL_Z]
+
+    @property
+    def magnitude(self) -> np.ndarray:
+        return self.tail_magnitude(len(self.samples))
+
+    def tail_magnitude(self, count: int) -> np.ndarray:
+        """最近 count 个样本的合成幅值；各检测器共享缓存，只计算被请求过的最长后缀"""
+        count = min(count, len(self.samples))
+        if self._magnitude is None or len(self._magnitude) < count:
+            self._magnitude = magnitude(self.xyz[len(self.samples) - count:])
+        return self._magnitude[len(self._magnitude) - count:]
+
+    def tail(self, history: int) -> slice:
+        """新样本加上之前 history 个样本在本批中的范围"""
+        return slice(max(0, len(self.samples) - self.new - history), len(self.samples))
+
+
+class Detector:
+    """检测器基类"""
+
+    name = "detector"
+    history = 0        # 除新样本外还需要的历史样本数
+    cooldown = 0.0     # 两次事件之间的最小间隔（秒，按样本时间）
+
+    def __init__(self):
+        self._pipeline = None
+        self._last_event = float("-inf")
+
+    def process(self, batch: Batch):
+        raise NotImplementedError
+
+    def emit(self, event):
+        """发布事件（受 cooldown 限制）"""
+        if event.t - self._last_event < self.cooldown:
+            return
+        self._last_event = event.t
+        if self._pipeline is not None:
+            self._pipeline.publish(event)
+
+
+class DetectorPipeline:
+    """从环形缓冲区读取新样本并分发给各检测器"""
+
+    def __init__(self, buffer: RingBuffer):
+        self.buffer = buffer
+        self.detectors = []  # type: List[Detector]
+        self._timings = []   # type: List[metrics.Histogram]  与 detectors 一一对应
+        self._subscribers = collections.defaultdict(list)  # type: Dict[type, List[Callable]]
+        self.seq = buffer.count
+        self.dropped = 0     # 处理不及时被覆盖而丢失的样本数
+
+    def register(self, detector: Detector) -> Detector:
+        detector._pipeline = self
+        self.detectors.append(detector)
+        self._timings.append(metrics.histogram("detector_seconds", "单个检测器处理一批样本的耗时",
+                                               metrics.FAST_BUCKETS, detector=detector.name))
+        return detector
+
+    def subscribe(self, event_type: Type, callback: Callable):
+        """订阅某类事件；回调在监控线程中同步执行，应尽快返回"""
+        self._subscribers[event_type].append(callback)
+
+    def publish(self, event):
+        for callback in self._subscribers.get(type(event), ()):
+            callback(event)
+
+    def process(self, count: Optional[int] = None):
+        """处理截至序号 count（默认最新）的所有新样本"""
+        count = self.buffer.count if count is None else count
+        new = count - self.seq
+        if new <= 0:
+            return
+        if new > self.buffer.capacity:
+            self.dropped += new - self.buffer.capacity
+            DROPPED.inc(new - self.buffer.capacity)
+            new = self.buffer.capacity
+        history = max((d.history for d in self.detectors), default=0)
+        samples = self.buffer.window(new + history, end=count)
+        batch = Batch(samples, min(new, len(samples)))
+        self.seq = count
+        clock = time.perf_counter
+        start = end = clock()
+        for detector, timing in zip(self.detectors, self._timings):
+            detector.process(batch)
+            now = clock()
+            timing.observe(now - end)
+            end = now
+        BATCH_TIME.observe(end - start)
+
+
+# ---------------------------------------------------------------------------
+# 检测器
+# ---------------------------------------------------------------------------
+
+class StopDetector(Detector):
+    """急停检测：去重力后的 Z 轴连续 trigger_samples 个样本低于阈值"""
+
+    name = "stop"
+
+    def __init__(self, threshold: float = -5.5, trigger_samples: int = 3, cooldown: float = 2.0,
+                 base_z: float = GRAVITY):
+        super().__init__()
+        self.threshold = threshold
+        self.trigger_samples = trigger_samples
+        self.history = trigger_samples - 1
+        self.cooldown = cooldown
+        self.base_z = base_z
+
+    def process(self, batch: Batch):
+        part = batch.tail(self.history)
+        z = batch.z[part]
+        ends = run_ends(z < self.threshold + self.base_z, self.trigger_samples)
+        if len(ends):
+            i = ends[0]
+            self.emit(StopEvent(batch.t[part][i], self.name, z[i] - self.base_z))
+
+
+class SmoothedStopDetector(StopDetector):
+    """急停检测（EMA 平滑版）：对去重力后的 Z 轴做指数平滑后再判断连续超阈值"""
+
+    name = "smoothed_stop"
+
+    def __init__(self, threshold: float = -4.5, trigger_samples: int = 3, alpha: float = 0.3,
+                 cooldown: float = 2.0, base_z: float = GRAVITY):
+        super().__init__(threshold, trigger_samples, cooldown, base_z)
+        self.alpha = alpha
+        # 平滑值逐批延续，跨批次判断所需的末尾平滑值自己保存，不需要缓冲区里的历史样本
+        self.history = 0
+        self._state = 0.0
+        self._recent = np.zeros(0)
+
+    def process(self, batch: Batch):
+        start = len(batch.samples) - batch.new
+        smoothed = ema(batch.z[start:] - self.base_z, self.alpha, self._state)
+        self._state = smoothed[-1]
+        offset = len(self._recent)
+        values = np.concatenate((self._recent, smoothed))
+        self._recent = values[max(0, len(values) - (self.trigger_samples - 1)):]
+        ends = run_ends(values < self.threshold, self.trigger_samples)
+        ends = ends[ends >= offset]
+        if len(ends):
+            i = ends[0]
+            self.emit(StopEvent(batch.t[start + i - offset], self.name, values[i]))
+
+
+class RunningDetector(Detector):
+    """
+    跑步检测：三轴 EMA 平滑后的合成加速度（去重力）连续超过动态阈值
+
+    同时维护最近 average_samples 个合成加速度的移动平均（average）和最新的动态阈值（current_threshold），
+    供实时显示使用，不参与触发判断。
+    """
+
+    name = "running"
+
+    def __init__(self, threshold: float = 6.2, trigger_samples: int = 3, alpha: float = 0.2,
+                 gain: float = 0.3, release_samples: int = 10, average_samples: int = 10):
+        super().__init__()
+        self.threshold = threshold
+        self.trigger_samples = trigger_samples
+        self.release_samples = release_samples
+        self.average_samples = max(1, average_samples)
+        self.alpha = alpha
+        self.gain = gain
+        self.running = False
+        self.average = 0.0
+        self.current_threshold = threshold
+        self._net = np.zeros(0)                  # 最近 average_samples 个合成加速度
+        self._state = np.array([0.0, 0.0, GRAVITY])
+        self._recent = np.zeros(0, dtype=bool)   # 上一批末尾的超阈值掩码
+        self._below = 0                          # 连续未超阈值的样本数
+
+    def process(self, batch: Batch):
+        start = len(batch.samples) - batch.new
+        xyz = batch.xyz[start:]
+        t = batch.t[start:]
+        smoothed = np.empty_like(xyz)
+        for axis in range(3):
+            smoothed[:, axis] = ema(xyz[:, axis], self.alpha, self._state[axis])
+        self._state[:] = smoothed[-1]
+
+        vertical = smoothed[:, 2] - GRAVITY
+        net = np.sqrt(smoothed[:, 0] ** 2 + smoothed[:, 1] ** 2 + vertical ** 2)
+        thresholds = dynamic_threshold(self.threshold, vertical, self.gain)
+        above = net > thresholds
+        self._net = np.concatenate((self._net, net))[-self.average_samples:]
+        self.average = float(self._net.mean())
+        self.current_threshold = float(thresholds[-1])
+
+        offset = len(self._recent)
+        mask = np.concatenate((self._recent, above))
+        self._recent = mask[max(0, len(mask) - (self.trigger_samples - 1)):]
+
+        if not self.running:
+            ends = run_ends(mask, self.trigger_samples)
+            ends = ends[ends >= offset]
+            if len(ends):
+                i = ends[0] - offset
+                self.running = True
+                self._below = 0
+                self.emit(RunningEvent(t[i], self.name, True, float(net[i])))
+            return
+
+        # 连续 release_samples 个样本未超阈值才视为停止跑步
+        hits = np.flatnonzero(above)
+        if len(hits):
+            self._below = len(above) - 1 - hits[-1]
+        else:
+            self._below += len(above)
+        if self._below >= self.release_samples:
+            i = len(above) - 1 - (self._below - self.release_samples)
+            self.running = False
+            self.emit(RunningEvent(t[i], self.name, False, float(net[i])))
+
+
+class FallDetector(Detector):
+    """跌倒检测：合成幅值低于失重阈值持续一段时间，随后在时限内出现冲击峰值"""
+
+    name = "fall"
+
+    def __init__(self, free_fall: float = 0.4 * GRAVITY, impact: float = 2.5 * GRAVITY,
+                 free_fall_samples: int = 6, window: float = 1.0, cooldown: float = 5.0):
+        super().__init__()
+        self.free_fall = free_fall
+        self.impact = impact
+        self.free_fall_samples = free_fall_samples
+        self.history = free_fall_samples - 1
+        self.window = window
+        self.cooldown = cooldown
+        self._free_fall_at = None  # type: Optional[float]
+
+    def process(self, batch: Batch):
+        part = batch.tail(self.history)
+        mag = batch.tail_magnitude(part.stop - part.start)
+        t = batch.t[part]
+        ends = run_ends(mag < self.free_fall, self.free_fall_samples)
+        if len(ends):
+            self._free_fall_at = t[ends[0]]
+        if self._free_fall_at is None:
+            return
+        # 只在新样本中寻找失重之后的冲击峰值
+        first_new = len(mag) - batch.new
+        hits = np.flatnonzero((mag[first_new:] > self.impact) & (t[first_new:] > self._free_fall_at))
+        if len(hits):
+            i = first_new + hits[0]
+            if t[i] - self._free_fall_at <= self.window:
+                self.emit(FallEvent(t[i], self.name, float(mag[i])))
+            self._free_fall_at = None
+        elif t[-1] - self._free_fall_at > self.window:
+            self._free_fall_at = None
+
+
+class StrideModel:
+    """
+    步长模型：步长 L = a + b * f（f 为步频，Hz），速度 = L * f
+
+    默认系数对应成年人慢跑（2.8Hz 时步长约 1.1m）；有可靠 GPS 速度时用带遗忘因子的
+    递推最小二乘在线校准，GPS 信号丢失后继续用校准后的系数估计速度。
+    """
+
+    def __init__(self, a: float = 0.3, b: float = 0.28, forgetting: float = 0.995):
+        self.coef = np.array([a, b])
+        self.forgetting = forgetting
+        self.samples = 0
+        self._p = np.diag([0.05, 0.01])  # 系数协方差（先验的可信程度）
+
+    def stride(self, step_hz: float) -> float:
+        return float(self.coef[0] + self.coef[1] * step_hz)
+
+    def speed(self, step_hz: float) -> float:
+        return self.stride(step_hz) * step_hz
+
+    def calibrate(self, step_hz: float, speed: float):
+        """用一组（步频，GPS 速度）观测更新系数"""
+        if step_hz <= 0:
+            return
+        x = np.array([1.0, step_hz])
+        px = self._p @ x
+        gain = px / (self.forgetting + x @ px)
+        self.coef = self.coef + gain * (speed / step_hz - x @ self.coef)
+        self._p = (self._p - np.outer(gain, px)) / self.forgetting
+        self.samples += 1
+
+
+class CadenceDetector(Detector):
+    """
+    步频检测：对合成加速度幅值做滑动窗口 DFT，取步频频带内的主峰
+
+    只在步频频带附近的一组频点上维护窗口的 DFT，不保留私有样本副本：每隔 hop 秒从流水线共享的
+    Batch 中取出这段时间进入窗口和移出窗口的样本（history 覆盖窗口加一个 hop），按滑动 DFT 增量更新；
+    汉宁窗在频域用相邻 ±1 个窗口频距的三个频点组合得到，均值用同步维护的和减去。
+    主峰用抛物线插值细化；置信度足够时累计步数，并通过步长模型给出速度。
+    数据不连续（丢样本、批太大超出缓冲区）时或每隔 rebuild 个 hop 从窗口重新计算一次，消除累积舍入误差。
+    """
+
+    name = "cadence"
+
+    def __init__(self, rate: float, window: float = 8.0, hop: float = 1.0, band: tuple = (1.0, 4.0),
+                 min_confidence: float = 0.25, min_std: float = 0.5, oversample: int = 2,
+                 rebuild: int = 300, stride_model: Optional[StrideModel] = None):
+        super().__init__()
+        self.rate = rate
+        self.size = int(window * rate)
+        self.hop = max(1, int(hop * rate))
+        self.history = self.size + self.hop
+        self.min_confidence = min_confidence
+        self.min_std = min_std
+        self.rebuild = rebuild
+        self.stride_model = stride_model or StrideModel()
+        # 频点间隔为汉宁窗频距 rate / (size - 1) 的 1/oversample，窗口组合所需的 ±1 频距正好是 ±oversample 个频点
+        self.oversample = oversample
+        self.resolution = rate / ((self.size - 1) * oversample)
+        lo = int(np.ceil(band[0] / self.resolution))
+        hi = int(np.floor(band[1] / self.resolution))
+        margin = oversample + 1  # 频带两侧各多算一个频点用于插值，再加组合窗口所需的频点
+        bins = np.arange(lo - margin, hi + margin + 1)
+        self._omega = 2 * np.pi * bins * self.resolution / rate
+        self._first_bin = lo
+        self._basis = np.exp(-1j * np.outer(np.arange(self.size), self._omega))  # (size, 频点数)
+        self._shift = np.exp(1j * self._omega * self.size)      # 移出窗口的样本相对进入样本的相位
+        # 常数 1 的加窗频谱，用于从加窗频谱中减去均值
+        self._taper_dc = np.hanning(self.size) @ self._basis[:, oversample:-oversample]
+        self._spectrum = None  # type: Optional[np.ndarray]  sum x[i] * exp(-jω(i - base))
+        self._base = 0         # 相位基准的样本序号
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._hops = 0
+        self._count = 0
+        self._since = 0
+        self._last_t = None  # type: Optional[float]
+        self.cadence = 0.0
+        self.confidence = 0.0
+        self.steps = 0.0
+        self.distance = 0.0
+
+    def process(self, batch: Batch):
+        self._count += batch.new
+        self._since += batch.new
+        if self._since < self.hop or self._count < self.size:
+            return
+        self._update(batch, self._since)
+        self._since = 0
+        t = float(batch.t[-1])
+        step_hz, self.confidence = self._estimate()
+        dt = 0.0 if self._last_t is None else t - self._last_t
+        self._last_t = t
+        speed = 0.0
+        if step_hz > 0 and self.confidence >= self.min_confidence:
+            self.cadence = step_hz * 60.0
+            speed = self.stride_model.speed(step_hz)
+            self.steps += step_hz * dt
+            self.distance += speed * dt
+        else:
+            self.cadence = 0.0
+        self.emit(CadenceEvent(t, self.name, self.cadence, self.confidence, self.steps, speed))
+
+    def _update(self, batch: Batch, n: int):
+        """把最近 n 个样本滑入窗口，同时移出窗口最早的 n 个样本"""
+        available = len(batch.samples)
+        self._hops += 1
+        if (self._spectrum is None or n >= self.size or available < n + self.size
+                or self._hops >= self.rebuild):
+            self._reset(batch.tail_magnitude(self.size))
+            return
+        values = batch.tail_magnitude(n + self.size)
+        entering = values[-n:]
+        leaving = values[:n]
+        first = self._count - n  # 第一个进入样本的序号
+        phase = np.exp(-1j * self._omega * (first - self._base))
+        terms = np.stack((entering, leaving)) @ self._basis[:n]
+        self._spectrum += phase * (terms[0] - self._shift * terms[1])
+        self._sum += float(entering.sum() - leaving.sum())
+        self._sum_sq += float(entering @ entering - leaving @ leaving)
+
+    def _reset(self, window: np.ndarray):
+        """从窗口样本重新计算频谱"""
+        self._spectrum = window @ self._basis
+        self._base = self._count - self.size
+        self._sum = float(window.sum())
+        self._sum_sq = float(window @ window)
+        self._hops = 0
+
+    def _estimate(self) -> tuple:
+        """返回 (步频 Hz, 置信度)"""
+        mean = self._sum / self.size
+        if self._sum_sq / self.size - mean * mean < self.min_std ** 2:
+            return 0.0, 0.0
+        # 相位基准移到窗口起点，再组合出汉宁窗频谱并减去均值
+        spectrum = self._spectrum * np.exp(1j * self._omega * (self._count - self.size - self._base))
+        power = np.abs(self._windowed(spectrum) - mean * self._taper_dc) ** 2
+        band = power[1:-1]
+        k = int(np.argmax(band))
+        total = float(band.sum())
+        if total <= 0:
+            return 0.0, 0.0
+        i = k + 1
+        # 抛物线插值细化峰值位置
+        offset = 0.0
+        left, mid, right = power[i - 1], power[i], power[i + 1]
+        denom = left - 2 * mid + right
+        if denom != 0:
+            offset = 0.5 * (left - right) / denom
+        peak = float(band[max(0, k - 1):k + 2].sum())
+        return (self._first_bin + k + offset) * self.resolution, peak / total
+
+    def _windowed(self, spectrum: np.ndarray) -> np.ndarray:
+        """矩形窗频谱 → 汉宁窗频谱：0.5 X(ω) - 0.25 X(ω - Δ) - 0.25 X(ω + Δ)，Δ 为 oversample 个频点"""
+        m = self.oversample
+        return 0.5 * spectrum[m:-m] - 0.25 * (spectrum[:-2 * m] + spectrum[2 * m:])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+播放期间的回声抑制
+
+回复播放时麦克风保持开启，扬声器的声音会被 VAD 当成人声。播放线程每写入一块音频就把它的电平
+记入参考环形缓冲区；音频回调对每帧麦克风数据比较其电平与回声尾长内的最大参考电平（Geigel 双讲检测）：
+超过“回声路径增益 × 参考电平”一定倍数才算近端人声，否则视为回声丢弃，并用这一帧慢速修正回声路径增益。
+没有在播放时直接放行。每帧只做一次 RMS 和一次小数组比较，可以在音频回调中调用。
+"""
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+import metrics
+
+ECHO_TAIL = 0.4            # 回声尾长：音频写入设备到被麦克风收到的最长延迟（含输出缓冲区）(s)
+ECHO_MARGIN = 2.0          # 近端电平超过回声估计的倍数（6 dB）才视为人声
+INITIAL_COUPLING = 1.0     # 回声路径增益初值（麦克风电平 / 参考电平），偏大以免开始几帧回声误判为人声
+MIN_COUPLING = 0.05
+MAX_COUPLING = 4.0
+ADAPT = 0.05               # 回声路径增益的修正速度
+SILENT_REFERENCE = 100.0   # 参考电平（int16 RMS）低于该值视为没有在播放
+REFERENCE_SLOTS = 128      # 参考电平环形缓冲区的块数
+
+SUPPRESSED = metrics.counter("echo_suppressed_frames_total", "播放期间判为回声而丢弃的麦克风帧数")
+
+
+def rms(pcm: np.ndarray) -> float:
+    """int16 采样的均方根电平"""
+    if pcm.size == 0:
+        return 0.0
+    x = pcm.reshape(-1).astype(np.float32)
+    return math.sqrt(float(np.dot(x, x)) / x.size)
+
+
+class EchoGate:
+    """根据正在播放的音频判断麦克风帧是否为近端人声"""
+
+    def __init__(self, tail: float = ECHO_TAIL, margin: float = ECHO_MARGIN,
+                 slots: int = REFERENCE_SLOTS, clock: Callable[[], float] = time.monotonic):
+        self.tail = tail
+        self.margin = margin
+        self.clock = clock
+        self.coupling = INITIAL_COUPLING
+        self._times = np.full(slots, -math.inf)
+        self._levels = np.zeros(slots)
+        self._index = 0
+        self._lock = threading.Lock()
+        self.frames = 0        # 播放期间检查的麦克风帧数
+        self.suppressed = 0    # 其中判为回声的帧数
+
+    def played(self, pcm: np.ndarray):
+        """播放线程在每块音频写入设备前调用"""
+        level = rms(pcm)
+        with self._lock:
+            i = self._index % len(self._times)
+            self._levels[i] = level
+            self._times[i] = self.clock()
+            self._index += 1
+
+    def reference(self, now: Optional[float] = None) -> float:
+        """回声尾长内的最大参考电平"""
+        if now is None:
+            now = self.clock()
+        recent = self._times >= now - self.tail
+        return float(self._levels[recent].max()) if recent.any() else 0.0
+
+    @property
+    def playing(self) -> bool:
+        return self.reference() >= SILENT_REFERENCE
+
+    def near_end(self, frame: np.ndarray) -> bool:
+        """麦克风帧是否含有近端人声（音频回调线程中调用）"""
+        ref = self.reference()
+        if ref < SILENT_REFERENCE:
+            return True
+        self.frames += 1
+        level = rms(frame)
+        if level > self.margin * self.coupling * ref:
+            return True
+        # 只有回声：按本帧修正回声路径增益
+        ratio = min(MAX_COUPLING, max(MIN_COUPLING, level / ref))
+        self.coupling += ADAPT * (ratio - self.coupling)
+        self.suppressed += 1
+        SUPPRESSED.inc()
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "coupling": round(self.coupling, 3),
+            "frames": self.frames,
+            "suppressed": self.suppressed,
+        }
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+GPS/IMU 速度融合
+
+二维卡尔曼滤波，状态为 [前进速度, 前进轴加速度计零偏]：
+    预测：每个加速度样本按前进轴加速度（减去零偏）积分速度
+    更新：GPS 地速（按 HDOP 调整噪声）、步长模型速度、静止时的零速观测
+得到与采样率相同（50–100Hz）的连续速度估计，GPS 定位之间和信号遮挡时也有速度。
+
+滤波器同时对去零偏的前进加速度做平滑，速度较高时出现持续的强减速即判定为急停，
+比单轴瞬时阈值更不容易被落地冲击误触发。
+
+状态保存在固定大小的 NumPy 数组中；每批样本在局部浮点变量上逐个递推，结束时原地写回，
+不为每个样本分配数组。同一批样本之前到达的多个速度观测（如步长模型和 GPS）排队，
+按到达顺序依次做标量卡尔曼更新，不会互相覆盖。
+"""
+import collections
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from detectors import Detector, Batch, StopEvent
+from sampler import COL_X, COL_Y
+
+ACCEL_NOISE = 1.5        # 前进轴加速度噪声 (m/s²)，包含落地冲击
+BIAS_DRIFT = 0.05        # 零偏随机游走 (m/s²/√s)
+GPS_NOISE = 0.4          # HDOP=1 时 GPS 地速噪声 (m/s)
+STRIDE_NOISE = 0.8       # 步长模型速度噪声 (m/s)
+STILL_NOISE = 0.1        # 零速观测噪声 (m/s)
+REFERENCE_TIMEOUT = 5.0  # 超过该时间没有速度观测时视为没有可靠速度 (s)
+MAX_PENDING = 32         # 待处理速度观测的上限（流水线停顿时丢弃最早的）
+
+# 配置中的前进轴（config.Settings.ForwardAxis）-> (列, 正负)
+FORWARD_AXES = {
+    "+X": (COL_X, 1.0),
+    "-X": (COL_X, -1.0),
+    "+Y": (COL_Y, 1.0),
+    "-Y": (COL_Y, -1.0),
+}
+
+
+class SpeedFusion(Detector):
+    """GPS/IMU 速度融合，同时检测急减速"""
+
+    name = "decel"
+
+    def __init__(self, rate: float, axis: int = COL_Y, sign: float = 1.0, threshold: float = -3.0,
+                 min_speed: float = 1.5, trigger_time: float = 0.1, smoothing: float = 0.1,
+                 cooldown: float = 2.0, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.axis = axis
+        self.sign = sign
+        self.threshold = threshold          # 平滑后的前进加速度低于该值视为急减速 (m/s²)
+        self.min_speed = min_speed          # 急减速开始前的最低速度 (m/s)
+        self.trigger_samples = max(1, int(round(trigger_time * rate)))
+        self.alpha = 1.0 / (1.0 + smoothing * rate)   # 加速度平滑系数（时间常数 smoothing 秒）
+        self.cooldown = cooldown
+        self.clock = clock
+        # 滤波状态
+        self.x = np.zeros(2)                 # [速度, 零偏]
+        self.P = np.diag([4.0, 1.0])         # 协方差
+        self.accel = 0.0                     # 平滑后的前进加速度
+        self._run = 0                        # 连续低于阈值的样本数
+        self._run_speed = 0.0                # 本次减速开始时的速度
+        self._last_t = None  # type: Optional[float]
+        self._pending = collections.deque(maxlen=MAX_PENDING)  # 待处理的速度观测 (速度, 方差)
+        self._lock = threading.Lock()
+        self.last_reference = None  # type: Optional[float]
+        self.updates = 0
+
+    @property
+    def speed(self) -> float:
+        return float(self.x[0])
+
+    @property
+    def bias(self) -> float:
+        return float(self.x[1])
+
+    @property
+    def has_reference(self) -> bool:
+        """最近是否有过速度观测（GPS、步长模型或静止）"""
+        return self.last_reference is not None and self.clock() - self.last_reference < REFERENCE_TIMEOUT
+
+    def set_forward(self, axis: int, sign: float):
+        """更换前进轴（在处理样本的线程中调用）：零偏和平滑加速度属于原来的轴，重新估计"""
+        if (axis, sign) == (self.axis, self.sign):
+            return
+        self.axis = axis
+        self.sign = sign
+        self.x[1] = 0.0
+        self.P[0, 1] = self.P[1, 0] = 0.0
+        self.P[1, 1] = 1.0
+        self.accel = 0.0
+        self._run = 0
+
+    def observe(self, speed: float, noise: float):
+        """提交一个速度观测（可在其他线程中调用，下一批样本处理时生效）"""
+        with self._lock:
+            self._pending.append((float(speed), noise * noise))
+        self.last_reference = self.clock()
+
+    def observe_gps(self, speed: float, hdop: float = 1.0):
+        self.observe(speed, GPS_NOISE * max(1.0, hdop))
+
+    def _take_pending(self) -> list:
+        """取出所有待处理的速度观测（按到达顺序）"""
+        with self._lock:
+            if not self._pending:
+                return []
+            measurements = list(self._pending)
+            self._pending.clear()
+            return measurements
+
+    def process(self, batch: Batch):
+        start = len(batch.samples) - batch.new
+        t = batch.t[start:].tolist()
+        forward = batch.samples[start:, self.axis].tolist()
+        if self._last_t is None:
+            self._last_t = t[0] - 1.0 / self.rate
+
+        v, b = float(self.x[0]), float(self.x[1])
+        p00, p01, p11 = float(self.P[0, 0]), float(self.P[0, 1]), float(self.P[1, 1])
+        for measurement in self._take_pending():
+            v, b, p00, p01, p11 = self._update(v, b, p00, p01, p11, *measurement)
+            self.updates += 1
+
+        q_accel = ACCEL_NOISE * ACCEL_NOISE
+        q_bias = BIAS_DRIFT * BIAS_DRIFT
+        alpha = self.alpha
+        accel = self.accel
+        last_t = self._last_t
+        for ti, ai in zip(t, forward):
+            dt = ti - last_t
+            last_t = ti
+            if dt <= 0:
+                continue
+            a = self.sign * ai - b
+            # 预测：按去零偏的前进加速度积分速度，零偏随机游走
+            v += a * dt
+            p00 += dt * (dt * p11 - 2.0 * p01) + q_accel * dt * dt
+            p01 -= dt * p11
+            p11 += q_bias * dt
+            if v < 0.0:
+                v = 0.0
+            # 急减速：平滑加速度连续 trigger_samples 个样本低于阈值
+            accel += alpha * (a - accel)
+            if accel < self.threshold:
+                if self._run == 0:
+                    self._run_speed = v
+                self._run += 1
+                if self._run == self.trigger_samples and self._run_speed >= self.min_speed:
+                    self.emit(StopEvent(ti, self.name, accel))
+            else:
+                self._run = 0
+
+        self._last_t = last_t
+        self.accel = accel
+        self.x[0] = v
+        self.x[1] = b
+        self.P[0, 0] = p00
+        self.P[0, 1] = self.P[1, 0] = p01
+        self.P[1, 1] = p11
+
+    @staticmethod
+    def _update(v, b, p00, p01, p11, z, r):
+        """速度观测更新（H = [1, 0]）"""
+        s = p00 + r
+        k0 = p00 / s
+        k1 = p01 / s
+        y = z - v
+        v += k0 * y
+        b += k1 * y
+        p11 -= k1 * p01
+        p01 *= 1.0 - k0
+        p00 *= 1.0 - k0
+        return max(0.0, v), b, p00, p01, p11
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+GPS 定位
+
+串口读到的字节追加到解析器的缓冲区，解析器在缓冲区上按偏移查找完整语句（不按行拆分拷贝，
+跨多次读取的语句也不会被截断），校验和通过后解析 RMC/GGA/VTG/GSA，合并成定位结果 Fix。
+接收线程把最新的 Fix 放进线程安全的最新值槽位（LatestValue），其他线程随时读取或等待更新。
+"""
+import functools
+import math
+import operator
+import threading
+import time
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+import hal
+import logs
+
+log = logs.get("GPS")
+
+KNOTS = 0.514444           # 节 -> m/s
+MAX_SENTENCE = 128         # 超过该长度仍未结束的数据视为噪声丢弃
+IDLE_SLEEP = 0.02          # 串口不支持阻塞读取时的轮询间隔 (s)
+
+
+class Fix(NamedTuple):
+    """一次定位结果；缺失的数值为 nan"""
+    t: float             # 收到该语句的单调时间
+    utc: str             # hhmmss.ss
+    valid: bool          # RMC 状态 A 或 GGA 定位质量 > 0
+    lat: float           # 纬度（度，南纬为负）
+    lon: float           # 经度（度，西经为负）
+    speed: float         # 地速 (m/s)
+    course: float        # 航向（度）
+    altitude: float      # 海拔 (m)
+    hdop: float
+    satellites: int
+    fix_type: int        # GSA：1 无定位，2 二维，3 三维
+
+
+def checksum(body: bytes) -> int:
+    """NMEA 校验和：$ 与 * 之间所有字节的异或"""
+    return functools.reduce(operator.xor, body, 0)
+
+
+def sentence(body: str) -> bytes:
+    """给语句体加上 $、校验和与行尾"""
+    data = body.encode("ascii")
+    return b"$%s*%02X\r\n" % (data, checksum(data))
+
+
+def _float(field: str) -> float:
+    try:
+        return float(field)
+    except ValueError:
+        return math.nan
+
+
+def _coordinate(value: str, hemisphere: str, degree_digits: int) -> float:
+    """ddmm.mmmm / dddmm.mmmm -> 度"""
+    if len(value) <= degree_digits:
+        return math.nan
+    try:
+        degrees = int(value[:degree_digits]) + float(value[degree_digits:]) / 60.0
+    except ValueError:
+        return math.nan
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+class NmeaParser:
+    """增量 NMEA 解析器"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._primary = None  # type: Optional[bytes]
+        self._state = {
+            "utc": "", "valid": False, "lat": math.nan, "lon": math.nan, "speed": math.nan,
+            "course": math.nan, "altitude": math.nan, "hdop": math.nan, "satellites": 0, "fix_type": 1,
+        }
+        self.sentences = 0
+        self.checksum_errors = 0
+        self.malformed = 0
+        self.ignored = 0
+        self.bytes = 0
+
+    def feed(self, data: bytes, t: float) -> List[Fix]:
+        """
+        追加串口数据，返回本次数据中完成的定位结果
+
+        第一个出现的定位语句（RMC 或 GGA）作为每个历元的主语句，每收到一次主语句输出一个 Fix；
+        其他语句（VTG/GSA 及另一种定位语句）更新的字段在下一个 Fix 中体现。
+        """
+        self.bytes += len(data)
+        buf = self._buffer
+        buf += data
+        fixes = []
+        pos = 0
+        end = len(buf)
+        while True:
+            start = buf.find(b"$", pos)
+            if start < 0:
+                pos = end
+                break
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                # 语句未结束，保留到下次；过长则视为噪声
+                pos = start if end - start <= MAX_SENTENCE else end
+                break
+            pos = nl + 1
+            # 前一条语句被截断时从本行最后一个 $ 开始
+            start = buf.rfind(b"$", start, nl)
+            star = buf.rfind(b"*", start, nl)
+            if star < 0 or nl - star < 3:
+                self.malformed += 1
+                continue
+            try:
+                expected = int(buf[star + 1:star + 3], 16)
+            except ValueError:
+                self.malformed += 1
+                continue
+            body = bytes(buf[start + 1:star])
+            if checksum(body) != expected:
+                self.checksum_errors += 1
+                continue
+            self.sentences += 1
+            fix = self._parse(body, t)
+            if fix is not None:
+                fixes.append(fix)
+        # 已处理的数据一次性移出缓冲区
+        del buf[:pos]
+        return fixes
+
+    def _parse(self, body: bytes, t: float) -> Optional[Fix]:
+        kind = body[2:5]
+        try:
+            fields = body.decode("ascii").split(",")
+        except UnicodeDecodeError:
+            self.malformed += 1
+            return None
+        state = self._state
+        if kind == b"RMC" and len(fields) >= 9:
+            state["utc"] = fields[1]
+            state["valid"] = fields[2] == "A"
+            state["lat"] = _coordinate(fields[3], fields[4], 2)
+            state["lon"] = _coordinate(fields[5], fields[6], 3)
+            state["speed"] = _float(fields[7]) * KNOTS
+            state["course"] = _float(fields[8])
+        elif kind == b"GGA" and len(fields) >= 10:
+            state["utc"] = fields[1]
+            state["lat"] = _coordinate(fields[2], fields[3], 2)
+            state["lon"] = _coordinate(fields[4], fields[5], 3)
+            quality = fields[6]
+            state["valid"] = quality not in ("", "0")
+            state["satellites"] = int(fields[7]) if fields[7].isdigit() else 0
+            state["hdop"] = _float(fields[8])
+            state["altitude"] = _float(fields[9])
+        elif kind == b"VTG" and len(fields) >= 8:
+            course = _float(fields[1])
+            if not math.isnan(course):
+                state["course"] = course
+            speed = _float(fields[7])
+            if not math.isnan(speed):
+                state["speed"] = speed / 3.6
+            return None
+        elif kind == b"GSA" and len(fields) >= 18:
+            state["fix_type"] = int(fields[2]) if fields[2].isdigit() else 1
+            state["hdop"] = _float(fields[16])
+            return None
+        else:
+            self.ignored += 1
+            return None
+        if self._primary is None:
+            self._primary = kind
+        if kind != self._primary:
+            return None
+        return Fix(t=t, **state)
+
+    def stats(self) -> dict:
+        return {
+            "bytes": self.bytes,
+            "sentences": self.sentences,
+            "checksum_errors": self.checksum_errors,
+            "malformed": self.malformed,
+            "ignored": self.ignored,
+        }
+
+
+class LatestValue:
+    """线程安全的最新值槽位：写入覆盖旧值，读取方按序号判断是否有更新"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._seq = 0
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self):
+        """返回 (序号, 最新值)"""
+        with self._cond:
+            return self._seq, self._value
+
+    @property
+    def value(self):
+        return self._value
+
+    def wait(self, seq: int, timeout: Optional[float] = None):
+        """等待序号超过 seq，返回 (序号, 最新值)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return self._seq, self._value
+
+
+class GpsReceiver:
+    """GPS 接收线程：读取串口、解析并发布最新定位"""
+
+    def __init__(self, uart: hal.SerialPort, clock: Callable[[], float] = time.monotonic):
+        self.uart = uart
+        self.clock = clock
+        self.parser = NmeaParser()
+        self.latest = LatestValue()
+        self.fixes = 0
+        self.errors = 0
+        self._listeners = []  # type: List[Callable[[Fix], None]]
+        self._running = False
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def subscribe(self, callback: Callable[[Fix], None]):
+        """每个新定位都会在接收线程中回调，应尽快返回"""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="gps", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def feed(self, data: bytes) -> List[Fix]:
+        fixes = self.parser.feed(data, self.clock())
+        for fix in fixes:
+            self.fixes += 1
+            self.latest.put(fix)
+            for callback in self._listeners:
+                callback(fix)
+        return fixes
+
+    def _run(self):
+        while self._running:
+            try:
+                # 有缓存数据时一次读完；否则阻塞读取（串口 timeout 控制最长等待）
+                data = self.uart.read(self.uart.in_waiting or 1)
+            except Exception as e:
+                self.errors += 1
+                log.warning("串口读取失败：%s", e)
+                time.sleep(1.0)
+                continue
+            if not data:
+                time.sleep(IDLE_SLEEP)
+                continue
+            self.feed(data)
+
+    def stats(self) -> dict:
+        return dict(self.parser.stats(), fixes=self.fixes, errors=self.errors)
+
+
+def synthetic_nmea(duration: float = 60.0, rate: float = 10.0, lat: float = 31.2304, lon: float = 121.4737,
+                   speed: float = 3.0, course: float = 45.0, turn_rate: float = 1.0) -> Iterator[bytes]:
+    """
+    生成模拟跑步轨迹的 NMEA 语句（每个历元 RMC、VTG、GGA、GSA 各一条）
+
+    Args:
+        duration: 时长（秒）
+        rate: 定位频率（Hz）
+        lat, lon: 起点
+        speed: 速度 (m/s)
+        course: 初始航向（度）
+        turn_rate: 航向变化速度（度/秒）
+    """
+    for i in range(int(duration * rate)):
+        t = i / rate
+        seconds = 8 * 3600 + t
+        utc = "%02d%02d%05.2f" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+        lat_field = "%02d%07.4f" % (int(abs(lat)), (abs(lat) % 1) * 60)
+        lon_field = "%03d%07.4f" % (int(abs(lon)), (abs(lon) % 1) * 60)
+        ns = "N" if lat >= 0 else "S"
+        ew = "E" if lon >= 0 else "W"
+        knots = speed / KNOTS
+        yield sentence(f"GPRMC,{utc},A,{lat_field},{ns},{lon_field},{ew},{knots:.2f},{course % 360:.1f},181026,,,A")
+        yield sentence(f"GPVTG,{course % 360:.1f},T,,M,{knots:.2f},N,{speed * 3.6:.2f},K,A")
+        yield sentence(f"GPGGA,{utc},{lat_field},{ns},{lon_field},{ew},1,09,0.9,12.5,M,8.0,M,,")
+        yield sentence("GPGSA,A,3,01,03,06,09,12,14,17,19,22,,,,1.6,0.9,1.3")
+        # 沿航向前进
+        step = speed / rate
+        heading = math.radians(course)
+        lat += step * math.cos(heading) / 111320.0
+        lon += step * math.sin(heading) / (111320.0 * math.cos(math.radians(lat)))
+        course += turn_rate / rate
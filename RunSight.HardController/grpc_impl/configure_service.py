@@ -1,57 +1,205 @@
 """
 ConfigureService 实现
+
+与 FastAPI 共用同一份配置存储（config.shared()）和遥测中心（telemetry.shared()），
+由控制器在进程内与 uvicorn 一起启动；任何一边修改的配置另一边立即可见。
 """
 import grpc
 from concurrent import futures
-import logging
-from typing import Any
+import os
+import sys
+import threading
+from typing import Any, Iterator, Optional
+
+# 生成的代码按 proto 路径互相导入（from Protobuf.Models import ...），需要把 grpc_gen 加入搜索路径
+GRPC_GEN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "grpc_gen")
+if GRPC_GEN not in sys.path:
+    sys.path.insert(0, GRPC_GEN)
+
+from Protobuf.Services import ConfigureService_pb2_grpc
+from Protobuf.Requests import ConfigureUpdateReq_pb2, ConfigureGetReq_pb2, TelemetrySubscribeReq_pb2
+from Protobuf.Responses import ConfigureUpdateRsp_pb2, ConfigureGetRsp_pb2
+from Protobuf.Models import Configure_pb2, Telemetry_pb2
+from Protobuf.Enums import RetCodes_pb2
+
+import config
+import logs
+import telemetry
+
+log = logs.get("gRPC")
+
+PORT = 50051
+WORKERS = 6              # 每个遥测流占用一个工作线程
+MAX_STREAMS = 4          # 同时进行的遥测流上限，保证配置请求总有空闲线程
+POLL_TIMEOUT = 1.0       # 等待遥测帧的超时 (s)，用于检查客户端是否已断开
+FLOAT_DIGITS = 6         # proto float 为单精度，写入配置前舍入（0.2 → 0.2 而不是 0.20000000298）
+
+
+def _status_message(data: dict) -> Telemetry_pb2.TelemetryStatus:
+    gps = data.get("gps") or {}
+    return Telemetry_pb2.TelemetryStatus(
+        T=data["t"],
+        Monitoring=data["monitoring"],
+        Exercising=data["exercising"],
+        Running=data["running"],
+        BaseZ=data["base_z"],
+        BaselineConfidence=data["baseline_confidence"],
+        Speed=data["speed"],
+        Cadence=data["cadence"] or 0.0,
+        Distance=data["distance"],
+        Pace=data["pace"] or 0.0,
+        GpsValid=bool(gps.get("valid")),
+        Latitude=gps.get("lat", 0.0),
+        Longitude=gps.get("lon", 0.0),
+        Hdop=gps.get("hdop", 0.0),
+        ConfigVersion=data["config_version"] or 0,
+    )
+
+
+def _event_message(data: dict) -> Telemetry_pb2.DetectorEvent:
+    value = next((data[k] for k in ("value", "impact", "magnitude") if k in data), 0.0)
+    return Telemetry_pb2.DetectorEvent(
+        T=data["t"],
+        Kind=data["event"],
+        Detector=data["detector"],
+        Value=value,
+        Running=data.get("running", False),
+    )
+
+
+def _samples_message(seq: int, samples) -> Telemetry_pb2.SampleBlock:
+    t0 = float(samples[0, 0])
+    block = Telemetry_pb2.SampleBlock(Seq=seq, T0=t0)
+    block.Dt.extend((samples[:, 0] - t0).tolist())
+    block.X.extend(samples[:, 1].tolist())
+    block.Y.extend(samples[:, 2].tolist())
+    block.Z.extend(samples[:, 3].tolist())
+    return block
+
+
+def telemetry_message(frame) -> Telemetry_pb2.Telemetry:
+    """把遥测中心的 RAW 帧转换为 protobuf 消息"""
+    kind, data = frame
+    if kind == "samples":
+        return Telemetry_pb2.Telemetry(Samples=_samples_message(*data))
+    if kind == "event":
+        return Telemetry_pb2.Telemetry(Event=_event_message(data))
+    return Telemetry_pb2.Telemetry(Status=_status_message(data))
 
-from grpc_gen.Protobuf.Services import ConfigureService_pb2_grpc
-from grpc_gen.Protobuf.Requests import ConfigureUpdateReq_pb2
-from grpc_gen.Protobuf.Responses import ConfigureUpdateRsp_pb2
-from grpc_gen.Protobuf.Enums import RetCodes_pb2
 
 class ConfigureServicer(ConfigureService_pb2_grpc.ConfigureServiceServicer):
     """ConfigureService 实现类"""
-    
+
+    def __init__(self, store: Optional[config.ConfigStore] = None, hub: Optional[telemetry.TelemetryHub] = None):
+        self.store = store or config.shared()
+        self.hub = hub or telemetry.shared()
+        self._streams = 0
+        self._lock = threading.Lock()
+
     def UpdateConfigure(self, request: ConfigureUpdateReq_pb2.ConfigureUpdateReq, context: Any) -> ConfigureUpdateRsp_pb2.ConfigureUpdateRsp:
         """
         更新配置
-        
+
+        proto3 标量没有“未设置”状态：SpeedThreshold 为 0、字符串为空时视为不修改；
+        TriggerTime/DebounceTime/BufferSeconds/DecelThreshold/MinStopSpeed 按是否设置判断。ServerAddress、ServerPort、
+        AccessToken 不由控制器保存，忽略。
+
         Args:
             request: 配置更新请求
             context: gRPC 上下文
-            
+
         Returns:
             配置更新响应
         """
         try:
-            # TODO: 实现配置更新逻辑
             configure = request.Configure
-            logging.info(f"Received configure update request: {configure}")
-            
+            log.info("接收到配置更新请求：%s", context.peer())
+            changes = {
+                "SpeedThreshold": round(configure.SpeedThreshold, FLOAT_DIGITS) or None,
+                "WifiSSID": configure.WifiSSID or None,
+                "WifiPassword": configure.WifiPassword or None,
+                "ForwardAxis": configure.ForwardAxis or None,
+            }
+            if configure.UserId:
+                if not configure.UserId.isdigit():
+                    raise ValueError(f"UserId 必须是数字，收到：{configure.UserId}")
+                changes["UID"] = int(configure.UserId)
+            for name in ("TriggerTime", "DebounceTime", "BufferSeconds", "DecelThreshold", "MinStopSpeed"):
+                if configure.HasField(name):
+                    changes[name] = round(getattr(configure, name), FLOAT_DIGITS)
+            settings = self.store.update(**changes)
+
             # 返回成功响应
             return ConfigureUpdateRsp_pb2.ConfigureUpdateRsp(
                 RetCode=RetCodes_pb2.RetCodes.Success,
-                Message="配置更新成功"
+                Message=f"配置更新成功（版本 {settings.version}）"
             )
         except Exception as e:
-            logging.error(f"Failed to update configure: {e}")
+            log.warning("配置更新失败：%s", e)
             return ConfigureUpdateRsp_pb2.ConfigureUpdateRsp(
                 RetCode=RetCodes_pb2.RetCodes.Failed,
                 Message=f"配置更新失败：{str(e)}"
             )
 
-def serve():
-    """启动 gRPC 服务器"""
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    def GetConfigure(self, request: ConfigureGetReq_pb2.ConfigureGetReq, context: Any) -> ConfigureGetRsp_pb2.ConfigureGetRsp:
+        """获取当前配置"""
+        settings = self.store.current
+        return ConfigureGetRsp_pb2.ConfigureGetRsp(
+            RetCode=RetCodes_pb2.RetCodes.Success,
+            Message="",
+            Configure=Configure_pb2.Configure(
+                SpeedThreshold=settings.SpeedThreshold,
+                WifiSSID=settings.WifiSSID,
+                WifiPassword=settings.WifiPassword,
+                UserId=str(settings.UID),
+                TriggerTime=settings.TriggerTime,
+                DebounceTime=settings.DebounceTime,
+                BufferSeconds=settings.BufferSeconds,
+                DecelThreshold=settings.DecelThreshold,
+                MinStopSpeed=settings.MinStopSpeed,
+                ForwardAxis=settings.ForwardAxis,
+            ),
+            Version=settings.version,
+        )
+
+    def SubscribeTelemetry(self, request: TelemetrySubscribeReq_pb2.TelemetrySubscribeReq, context: Any) -> Iterator[Telemetry_pb2.Telemetry]:
+        """
+        遥测流：状态、检测事件，以及按 SampleRate 抽取的加速度样本
+
+        客户端处理不过来时丢弃最旧的帧，不会阻塞其他客户端或采样。
+        """
+        with self._lock:
+            if self._streams >= MAX_STREAMS:
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"遥测流已达上限 {MAX_STREAMS}")
+            self._streams += 1
+        subscriber = telemetry.Subscriber(
+            rate=request.SampleRate, encoding=telemetry.RAW,
+            maxlen=request.QueueFrames or telemetry.QUEUE_FRAMES, name=f"grpc {context.peer()}")
+        self.hub.subscribe(subscriber)
+        # 客户端断开时立即唤醒等待中的 get
+        context.add_callback(lambda: self.hub.unsubscribe(subscriber))
+        try:
+            while context.is_active() and not subscriber.closed:
+                frame = subscriber.get(POLL_TIMEOUT)
+                if frame is not None:
+                    yield telemetry_message(frame)
+        finally:
+            self.hub.unsubscribe(subscriber)
+            with self._lock:
+                self._streams -= 1
+
+def serve(port: int = PORT, block: bool = True) -> grpc.Server:
+    """启动 gRPC 服务器；block=False 时立即返回（与 uvicorn 在同一进程中运行）"""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="grpc"))
     ConfigureService_pb2_grpc.add_ConfigureServiceServicer_to_server(
         ConfigureServicer(), server)
-    server.add_insecure_port('[::]:50051')
+    server.add_insecure_port(f'[::]:{port}')
     server.start()
-    logging.info("ConfigureService server started on port 50051")
-    server.wait_for_termination()
+    log.info("ConfigureService 已启动（端口 %d）", port)
+    if block:
+        server.wait_for_termination()
+    return server
 
 if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO)
-    serve() 
\ No newline at end of file
+    logs.setup()
+    serve()
\ No newline at end of file
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+硬件抽象层
+
+SafetySystem 只通过这里的接口访问加速度计、输出引脚（马达/蜂鸣器/指示灯）、
+音频设备和 GPS 串口。板载后端包装 pinpong/unihiker/pyserial，模拟后端按可配置的
+采样率回放录制数据或生成合成数据，便于在普通 Linux 主机和 CI 上测量检测延迟与 CPU 开销。
+
+通过环境变量 RUNSIGHT_BACKEND 选择后端：board（默认）或 sim。
+"""
+import math
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+GRAVITY = 9.81
+
+# 输出引脚名称 -> UNIHIKER 引脚编号
+MOTOR = "motor"        # 震动马达
+BUZZER = "buzzer"      # 蜂鸣器
+STATUS_LED = "status_led"  # 状态指示灯
+
+BOARD_PINS = {
+    MOTOR: "P9",
+    BUZZER: "P8",
+    STATUS_LED: "P21",
+}
+
+
+class Accelerometer:
+    """三轴加速度计接口（单位 m/s²）"""
+
+    def get_x(self) -> float:
+        return self.read()[0]
+
+    def get_y(self) -> float:
+        return self.read()[1]
+
+    def get_z(self) -> float:
+        return self.read()[2]
+
+    def read(self) -> Tuple[float, float, float]:
+        """一次读取三轴数据"""
+        raise NotImplementedError
+
+
+class OutputPin:
+    """数字输出引脚接口"""
+
+    def write_digital(self, value: int):
+        raise NotImplementedError
+
+
+class AudioDevice:
+    """音频播放接口"""
+
+    def play(self, filename: str):
+        raise NotImplementedError
+
+
+class PcmOutput:
+    """连续 PCM 输出流（int16），连续写入的数据无缝播放"""
+
+    def write(self, pcm):
+        """写入一段采样（阻塞到设备缓冲区可容纳为止）"""
+        raise NotImplementedError
+
+    def discard(self):
+        """丢弃设备缓冲区中尚未播放的数据（被打断时立即静音）"""
+
+    def close(self):
+        pass
+
+
+class SerialPort:
+    """GPS 串口接口，与 pyserial 的 Serial 保持一致"""
+
+    @property
+    def in_waiting(self) -> int:
+        raise NotImplementedError
+
+    def read(self, size: int = 1) -> bytes:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Backend:
+    """硬件后端：统一提供各外设的访问入口"""
+
+    name = "base"
+
+    def begin(self):
+        """初始化开发板"""
+
+    def accelerometer(self) -> Accelerometer:
+        raise NotImplementedError
+
+    def output(self, name: str) -> OutputPin:
+        raise NotImplementedError
+
+    def audio(self) -> AudioDevice:
+        raise NotImplementedError
+
+    def pcm_output(self, sample_rate: int, channels: int = 1) -> PcmOutput:
+        raise NotImplementedError
+
+    def gps_uart(self) -> SerialPort:
+        raise NotImplementedError
+
+    def now(self) -> float:
+        """后端时钟（单调时间，秒）"""
+        return time.monotonic()
+
+
+# ---------------------------------------------------------------------------
+# 板载后端
+# ---------------------------------------------------------------------------
+
+class _BoardAccelerometer(Accelerometer):
+    def __init__(self, impl):
+        self._impl = impl
+
+    def get_x(self) -> float:
+        return self._impl.get_x()
+
+    def get_y(self) -> float:
+        return self._impl.get_y()
+
+    def get_z(self) -> float:
+        return self._impl.get_z()
+
+    def read(self) -> Tuple[float, float, float]:
+        return self._impl.get_x(), self._impl.get_y(), self._impl.get_z()
+
+
+class _SoundDeviceOutput(PcmOutput):
+    def __init__(self, sample_rate: int, channels: int):
+        import sounddevice
+        self._stream = sounddevice.OutputStream(samplerate=sample_rate, channels=channels, dtype="int16")
+        self._stream.start()
+
+    def write(self, pcm):
+        self._stream.write(pcm)
+
+    def discard(self):
+        self._stream.abort()
+        self._stream.start()
+
+    def close(self):
+        self._stream.stop()
+        self._stream.close()
+
+
+class BoardBackend(Backend):
+    """UNIHIKER 板载后端（pinpong + unihiker + pyserial）"""
+
+    name = "board"
+
+    def __init__(self, gps_port: str = "/dev/ttyS3", gps_baudrate: int = 9600):
+        self.gps_port = gps_port
+        self.gps_baudrate = gps_baudrate
+        self._accelerometer = None
+        self._audio = None
+
+    def begin(self):
+        from pinpong.board import Board
+        Board().begin()
+
+    def accelerometer(self) -> Accelerometer:
+        if self._accelerometer is None:
+            from pinpong.extension.unihiker import accelerometer
+            self._accelerometer = _BoardAccelerometer(accelerometer)
+        return self._accelerometer
+
+    def output(self, name: str) -> OutputPin:
+        from pinpong.board import Pin
+        return Pin(getattr(Pin, BOARD_PINS[name]), Pin.OUT)
+
+    def audio(self) -> AudioDevice:
+        if self._audio is None:
+            from unihiker import Audio
+            self._audio = Audio()
+        return self._audio
+
+    def pcm_output(self, sample_rate: int, channels: int = 1) -> PcmOutput:
+        return _SoundDeviceOutput(sample_rate, channels)
+
+    def gps_uart(self) -> SerialPort:
+        import serial
+        return serial.Serial(self.gps_port, baudrate=self.gps_baudrate, timeout=1)
+
+
+# ---------------------------------------------------------------------------
+# 模拟后端
+# ---------------------------------------------------------------------------
+
+class SensorStream:
+    """按固定采样率提供的三轴数据流，读取时按后端时钟取当前时刻的样本"""
+
+    def __init__(self, samples: List[Tuple[float, float, float]], rate: float, loop: bool = True):
+        if not samples:
+            raise ValueError("传感器数据流不能为空")
+        self.samples = samples
+        self.rate = rate
+        self.loop = loop
+
+    def sample_at(self, elapsed: float) -> Tuple[float, float, float]:
+        index = int(elapsed * self.rate)
+        if self.loop:
+            index %= len(self.samples)
+        else:
+            index = min(index, len(self.samples) - 1)
+        return self.samples[index]
+
+    @classmethod
+    def load(cls, path: str, rate: float, loop: bool = True) -> "SensorStream":
+        """加载录制数据：每行 x,y,z 或 t,x,y,z（CSV，# 开头为注释），或会话记录文件（.rsrec）"""
+        if path.endswith(".rsrec"):
+            import recorder
+            with recorder.SessionReader(path) as reader:
+                data = reader.read(recorder.ACCEL)
+                samples = list(zip(data["x"].tolist(), data["y"].tolist(), data["z"].tolist()))
+            return cls(samples, rate, loop)
+        samples = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                values = [float(v) for v in line.split(",")]
+                samples.append(tuple(values[-3:]))
+        return cls(samples, rate, loop)
+
+
+def synthetic_stream(duration: float = 60.0, rate: float = 100.0, noise: float = 0.3,
+                     stops: Optional[List[float]] = None, stop_z: float = -8.0,
+                     stop_duration: float = 0.3, step_hz: float = 2.8, stop_decel: float = 0.0,
+                     seed: Optional[int] = None) -> SensorStream:
+    """
+    生成合成跑步数据流
+
+    Args:
+        duration: 数据时长（秒）
+        rate: 采样率（Hz）
+        noise: 高斯噪声标准差
+        stops: 急停事件发生的时刻（秒）
+        stop_z: 急停时 Z 轴相对重力的加速度
+        stop_duration: 急停持续时间（秒）
+        step_hz: 步频（Hz），用于叠加周期性的垂直振动
+        stop_decel: 急停时前进方向（Y 轴）的减速度 (m/s²)，0 时急停只体现在 Z 轴上
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    stops = stops or []
+    samples = []
+    for i in range(int(duration * rate)):
+        t = i / rate
+        bounce = 2.0 * math.sin(2 * math.pi * step_hz * t)
+        x = rng.gauss(0.0, noise)
+        y = 0.5 * math.sin(math.pi * step_hz * t) + rng.gauss(0.0, noise)
+        z = GRAVITY + bounce + rng.gauss(0.0, noise)
+        if any(s <= t < s + stop_duration for s in stops):
+            z = GRAVITY + stop_z + rng.gauss(0.0, noise)
+            if stop_decel:
+                y = stop_decel + rng.gauss(0.0, noise)
+        samples.append((x, y, z))
+    return SensorStream(samples, rate, loop=False)
+
+
+class SimAccelerometer(Accelerometer):
+    def __init__(self, backend: "SimulatedBackend"):
+        self._backend = backend
+        self.reads = 0
+
+    def read(self) -> Tuple[float, float, float]:
+        self.reads += 1
+        return self._backend.stream.sample_at(self._backend.elapsed())
+
+
+class SimOutputPin(OutputPin):
+    """模拟输出引脚，记录每次电平变化的时间"""
+
+    def __init__(self, backend: "SimulatedBackend", name: str):
+        self._backend = backend
+        self.name = name
+        self.value = 0
+        self.edges = []  # [(time, value)]
+
+    def write_digital(self, value: int):
+        if value != self.value:
+            self.edges.append((self._backend.now(), value))
+            for listener in self._backend.edge_listeners:
+                listener(self.name, value)
+        self.value = value
+
+
+class SimAudio(AudioDevice):
+    def __init__(self):
+        self.played = []
+
+    def play(self, filename: str):
+        self.played.append(filename)
+
+
+class SimPcmOutput(PcmOutput):
+    """模拟 PCM 输出：按实时速度消耗数据并记录写入量"""
+
+    def __init__(self, backend: "SimulatedBackend", sample_rate: int, channels: int):
+        self._backend = backend
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples = 0
+        self.first_write = None
+
+    def write(self, pcm):
+        if self.first_write is None:
+            self.first_write = self._backend.now()
+        self.samples += len(pcm)
+        time.sleep(len(pcm) / self.sample_rate)
+
+
+class SimSerial(SerialPort):
+    """模拟 GPS 串口，按波特率节奏吐出预先准备的 NMEA 字节"""
+
+    def __init__(self, backend: "SimulatedBackend", data: bytes, baudrate: int = 9600, loop: bool = True):
+        self._backend = backend
+        self._data = data
+        self._bytes_per_sec = baudrate / 10.0
+        self._loop = loop
+        self._pos = 0
+
+    def _available(self) -> int:
+        produced = int(self._backend.elapsed() * self._bytes_per_sec)
+        if not self._data:
+            return 0
+        if not self._loop:
+            produced = min(produced, len(self._data))
+        return max(0, produced - self._pos)
+
+    @property
+    def in_waiting(self) -> int:
+        return self._available()
+
+    def read(self, size: int = 1) -> bytes:
+        size = min(size, self._available())
+        out = bytearray()
+        while size > 0:
+            offset = self._pos % len(self._data)
+            chunk = self._data[offset:offset + size]
+            out += chunk
+            self._pos += len(chunk)
+            size -= len(chunk)
+        return bytes(out)
+
+
+class SimulatedBackend(Backend):
+    """模拟后端：回放录制或合成的传感器数据，并记录输出引脚动作"""
+
+    name = "sim"
+
+    def __init__(self, stream: Optional[SensorStream] = None, nmea: bytes = b"",
+                 clock: Callable[[], float] = time.monotonic):
+        self.stream = stream or synthetic_stream()
+        self.nmea = nmea
+        self._clock = clock
+        self.t0 = clock()
+        self._accelerometer = SimAccelerometer(self)
+        self._audio = SimAudio()
+        self.pins = {}
+        self.edge_listeners = []
+        self._lock = threading.Lock()
+
+    def begin(self):
+        self.t0 = self._clock()
+
+    def now(self) -> float:
+        return self._clock()
+
+    def elapsed(self) -> float:
+        """从 begin() 起经过的时间（秒）"""
+        return self._clock() - self.t0
+
+    def accelerometer(self) -> Accelerometer:
+        return self._accelerometer
+
+    def output(self, name: str) -> OutputPin:
+        with self._lock:
+            if name not in self.pins:
+                self.pins[name] = SimOutputPin(self, name)
+            return self.pins[name]
+
+    def audio(self) -> AudioDevice:
+        return self._audio
+
+    def pcm_output(self, sample_rate: int, channels: int = 1) -> PcmOutput:
+        return SimPcmOutput(self, sample_rate, channels)
+
+    def gps_uart(self) -> SerialPort:
+        return SimSerial(self, self.nmea)
+
+
+def create_backend(name: Optional[str] = None) -> Backend:
+    """根据名称（或 RUNSIGHT_BACKEND 环境变量）创建硬件后端"""
+    name = name or os.getenv("RUNSIGHT_BACKEND", "board")
+    if name == "board":
+        return BoardBackend()
+    if name == "sim":
+        path = os.getenv("RUNSIGHT_SIM_DATA")
+        rate = float(os.getenv("RUNSIGHT_SIM_RATE", "100"))
+        stream = SensorStream.load(path, rate) if path else synthetic_stream(rate=rate)
+        # RUNSIGHT_SIM_NMEA 指定录制的 NMEA 日志，未指定时生成模拟轨迹
+        nmea_path = os.getenv("RUNSIGHT_SIM_NMEA")
+        if nmea_path:
+            with open(nmea_path, "rb") as f:
+                nmea = f.read()
+        else:
+            import gps
+            nmea = b"".join(gps.synthetic_nmea(duration=600.0, rate=1.0))  # 9600 波特率下 1Hz
+        return SimulatedBackend(stream, nmea)
+    raise ValueError(f"未知的硬件后端：{name}")
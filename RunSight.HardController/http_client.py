@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+共享 HTTP 客户端
+
+所有对外请求（TTS 服务、跑步数据后端、OpenAI 兼容的 Whisper/大模型接口）都经过这里：
+按端点配置超时和重试策略，连接保持长连接复用，失败时按带抖动的指数退避重试，
+并统计每个端点的请求数、错误数和延迟分布。
+
+requests 请求走共享 Session 的连接池；OpenAI 客户端使用带计时传输层的 httpx 连接池
+（httpx 随 openai 一起安装）。
+异步调用方（如 FastAPI 路由）可以使用 arequest/apost 或 async_openai_client。
+"""
+import asyncio
+import collections
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# 端点名称
+TTS = "tts"
+BACKEND = "backend"
+ASR = "asr"
+LLM = "llm"
+
+POOL_SIZE = 8              # 每个主机保持的连接数
+KEEPALIVE_EXPIRY = 30.0    # 空闲连接保留时间 (s)
+RETRY_STATUS = (429, 502, 503, 504)
+LATENCY_HISTORY = 256      # 每个端点保留的延迟样本数
+
+
+class Endpoint(NamedTuple):
+    name: str
+    url: str
+    timeout: Tuple[float, float] = (3.0, 30.0)   # (连接, 读取) 超时 (s)
+    retries: int = 2                             # 失败后的最大重试次数
+    backoff: float = 0.2                         # 退避基准时间 (s)
+    backoff_max: float = 2.0                     # 单次退避上限 (s)
+
+
+DEFAULT_ENDPOINTS = (
+    Endpoint(TTS, os.getenv("RUNSIGHT_TTS_URL", "http://10.1.2.101:9880/tts"), (3.0, 30.0), retries=2),
+    Endpoint(BACKEND, os.getenv("RUNSIGHT_API_URL", "http://10.1.2.101:5238/api"), (3.0, 10.0), retries=3),
+    Endpoint(ASR, os.getenv("OPENAI_BASEURL1") or "", (3.0, 30.0), retries=1),
+    Endpoint(LLM, os.getenv("OPENAI_BASEURL2") or "", (3.0, 60.0), retries=1),
+)
+
+
+class EndpointStats:
+    """单个端点的请求统计；流式请求的延迟按收到响应头计"""
+
+    def __init__(self, history: int = LATENCY_HISTORY):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {"requests": self.requests, "errors": self.errors, "retries": self.retries}
+        if latencies:
+            stats["latency_p50_ms"] = latencies[len(latencies) // 2] * 1000
+            stats["latency_p95_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            stats["latency_max_ms"] = latencies[-1] * 1000
+        return stats
+
+
+def backoff_delay(endpoint: Endpoint, attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（full jitter）"""
+    return random.uniform(0, min(endpoint.backoff_max, endpoint.backoff * (2 ** attempt)))
+
+
+class HttpClient:
+    """按端点管理超时、重试和统计的 HTTP 客户端"""
+
+    def __init__(self, endpoints=DEFAULT_ENDPOINTS, pool_size: int = POOL_SIZE):
+        self.endpoints = {}  # type: Dict[str, Endpoint]
+        self._stats = {}  # type: Dict[str, EndpointStats]
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+        self._lock = threading.Lock()
+        for endpoint in endpoints:
+            self.register(endpoint)
+
+    def register(self, endpoint: Endpoint) -> Endpoint:
+        self.endpoints[endpoint.name] = endpoint
+        self._stats.setdefault(endpoint.name, EndpointStats())
+        return endpoint
+
+    def endpoint(self, name: str) -> Endpoint:
+        if name not in self.endpoints:
+            raise KeyError(f"未配置的端点：{name}")
+        return self.endpoints[name]
+
+    def stats(self) -> Dict[str, dict]:
+        """各端点的统计快照"""
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def request(self, name: str, method: str, path: str = "", **kwargs) -> requests.Response:
+        """
+        发送请求
+
+        连接失败和 RETRY_STATUS 中的状态码会按退避策略重试；读取超时不重试，
+        避免非幂等请求（如数据上传）被服务端重复处理。stream=True 时返回的响应需由调用方关闭。
+        """
+        endpoint = self.endpoint(name)
+        stats = self._stats[name]
+        kwargs.setdefault("timeout", endpoint.timeout)
+        url = endpoint.url + path
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                stats.record(time.monotonic() - started, False)
+                if attempt >= endpoint.retries:
+                    raise
+            except requests.RequestException:
+                stats.record(time.monotonic() - started, False)
+                raise
+            else:
+                ok = response.status_code < 500
+                stats.record(time.monotonic() - started, ok)
+                if response.status_code not in RETRY_STATUS or attempt >= endpoint.retries:
+                    return response
+                response.close()
+            time.sleep(backoff_delay(endpoint, attempt))
+            attempt += 1
+            stats.retried()
+
+    def get(self, name: str, path: str = "", **kwargs) -> requests.Response:
+        return self.request(name, "GET", path, **kwargs)
+
+    def post(self, name: str, path: str = "", **kwargs) -> requests.Response:
+        return self.request(name, "POST", path, **kwargs)
+
+    async def arequest(self, name: str, method: str, path: str = "", **kwargs) -> requests.Response:
+        """request 的异步版本，在连接池大小的线程池中执行，共享同一组连接"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix="http")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self.request, name, method, path, **kwargs))
+
+    async def apost(self, name: str, path: str = "", **kwargs) -> requests.Response:
+        return await self.arequest(name, "POST", path, **kwargs)
+
+    def _openai_options(self, name: str) -> dict:
+        endpoint = self.endpoint(name)
+        connect, read = endpoint.timeout
+        return {
+            "base_url": endpoint.url or None,
+            "timeout": httpx.Timeout(read, connect=connect),
+            "max_retries": endpoint.retries,
+        }
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                            keepalive_expiry=KEEPALIVE_EXPIRY)
+
+    def openai_client(self, name: str, api_key: Optional[str]):
+        """创建使用该端点配置（地址、超时、重试）和共享统计的 OpenAI 客户端"""
+        import openai
+        transport = _TimedTransport(self._stats[name], limits=self._limits())
+        return openai.OpenAI(api_key=api_key, http_client=httpx.Client(transport=transport),
+                             **self._openai_options(name))
+
+    def async_openai_client(self, name: str, api_key: Optional[str]):
+        """openai_client 的异步版本"""
+        import openai
+        transport = _AsyncTimedTransport(self._stats[name], limits=self._limits())
+        return openai.AsyncOpenAI(api_key=api_key, http_client=httpx.AsyncClient(transport=transport),
+                                  **self._openai_options(name))
+
+    def close(self):
+        self.session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class _TimedTransport(httpx.HTTPTransport):
+    """httpx 传输层：记录每次请求（含 openai 内部重试）的延迟和错误"""
+
+    def __init__(self, stats: EndpointStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        started = time.monotonic()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.stats.record(time.monotonic() - started, False)
+            raise
+        self.stats.record(time.monotonic() - started, response.status_code < 500)
+        return response
+
+
+class _AsyncTimedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: EndpointStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.stats.record(time.monotonic() - started, False)
+            raise
+        self.stats.record(time.monotonic() - started, response.status_code < 500)
+        return response
+
+
+_shared = None  # type: Optional[HttpClient]
+_shared_lock = threading.Lock()
+
+
+def shared() -> HttpClient:
+    """进程内共享的客户端"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HttpClient()
+        return _shared
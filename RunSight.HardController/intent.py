@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+本地意图匹配
+
+识别文本先经过这里：运动指令（开始/结束运动）用短语表 + 动宾语法规则 + 模糊匹配在本地判定，
+命中后直接执行对应处理函数，不需要等待大模型；其余开放对话再交给大模型。
+为避免误触发，只对短句生效，且排除疑问句、否定句和“开始跑步之前”这类从句。
+
+结束运动会关闭急停监控，只接受短语表或语法规则的精确命中，不做模糊匹配；模糊匹配只用于开始运动中较长的说法。
+部分识别结果命中结束运动时只提前结束录音，连续两次部分结果都命中（或整句识别命中）才执行。
+"""
+import difflib
+import re
+from typing import NamedTuple, Optional
+
+START_EXERCISE = "start_exercise"
+END_EXERCISE = "end_exercise"
+
+# 内置短语表：意图 -> 常见说法
+PHRASES = {
+    START_EXERCISE: ["开始运动", "开始跑步", "开始锻炼", "开始训练", "我要跑步", "我要开始跑步", "出发吧", "开跑"],
+    END_EXERCISE: ["结束运动", "结束跑步", "结束锻炼", "结束训练", "停止运动", "停止跑步", "不跑了", "跑完了", "我跑完了"],
+}
+
+# 动宾语法规则
+_OBJECT = "(运动|跑步|锻炼|训练|跑)"
+GRAMMAR = {
+    START_EXERCISE: re.compile("(开始|启动|开启|准备)(一下)?(我的)?" + _OBJECT),
+    END_EXERCISE: re.compile("(结束|停止|停下|暂停|完成|关闭)(一下)?(我的)?(本次|这次)?" + _OBJECT),
+}
+
+# 命中指令后的固定语音回复
+RESPONSES = {
+    START_EXERCISE: "好的，开始运动，我会一直陪着你。",
+    END_EXERCISE: "运动结束，你今天做得很棒！",
+}
+
+MAX_COMMAND_CHARS = 12     # 超过该长度的句子视为开放对话
+FUZZY_THRESHOLD = 0.85     # 模糊匹配的最低相似度
+FUZZY_MIN_CHARS = 5        # 参与模糊匹配的最短短语：四字短语错一个字相似度仍有 0.75（“我吃完了”≈“我跑完了”）
+FUZZY_INTENTS = (START_EXERCISE,)   # 允许模糊匹配的意图
+CONFIRM_INTENTS = (END_EXERCISE,)    # 部分识别结果需要连续两次命中才执行的意图
+# 疑问句：疑问词，以及“是不是/要不要/有没有”这类正反问
+_QUESTION = re.compile(r"(吗|呢|什么|怎么|怎样|如何|为什么|为何|多少|几|是否|(.)[不没]\2)")
+# 指令后面紧跟时间或条件从句时只是在描述，不是指令（“开始跑步之前”“结束运动的时候”）
+_CLAUSE = re.compile("(之前|以前|之后|以后|前|后|的时候|时候|时|的话|的)")
+_NEGATION = re.compile("(不要|别|不想|先不|不用|没有|不能)")
+_PUNCTUATION = re.compile(r"[\s，。！？、；：,.!?;:\"'“”‘’（）()…~～-]+")
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    score: float    # 1.0 为精确或语法命中，模糊匹配时为相似度
+    phrase: str     # 命中的短语或文本片段
+
+
+def normalize(text: str) -> str:
+    """去除标点和空白"""
+    return _PUNCTUATION.sub("", text or "").lower()
+
+
+def _fuzzy(text: str, phrase: str) -> float:
+    """text 中与 phrase 等长的滑动片段的最高相似度"""
+    n = len(phrase)
+    if len(text) <= n:
+        return difflib.SequenceMatcher(None, text, phrase).ratio()
+    best = 0.0
+    for i in range(len(text) - n + 1):
+        best = max(best, difflib.SequenceMatcher(None, text[i:i + n], phrase).ratio())
+    return best
+
+
+def match(text: str, partial: bool = False) -> Optional[IntentMatch]:
+    """
+    在识别文本中匹配运动指令
+
+    Args:
+        text: 识别文本
+        partial: 是否为说话过程中的部分识别结果（只接受精确或语法命中）
+
+    Returns:
+        命中时返回 IntentMatch，否则返回 None（交给大模型处理）
+    """
+    if "?" in text or "？" in text:
+        return None
+    norm = normalize(text)
+    if not norm or len(norm) > MAX_COMMAND_CHARS or _QUESTION.search(norm):
+        return None
+
+    hits = []
+    for intent, phrases in PHRASES.items():
+        for phrase in phrases:
+            if phrase in norm:
+                hits.append(IntentMatch(intent, 1.0, phrase))
+    if not hits:
+        for intent, pattern in GRAMMAR.items():
+            found = pattern.search(norm)
+            if found:
+                hits.append(IntentMatch(intent, 1.0, found.group(0)))
+    if not hits:
+        for intent in FUZZY_INTENTS:
+            for phrase in PHRASES[intent]:
+                if len(phrase) < FUZZY_MIN_CHARS:
+                    continue
+                score = _fuzzy(norm, phrase)
+                if score >= FUZZY_THRESHOLD:
+                    hits.append(IntentMatch(intent, score, phrase))
+    if not hits:
+        return None
+
+    best = max(hits, key=lambda m: (m.score, len(m.phrase)))
+    # 同时命中开始和结束时无法判断，交给大模型
+    if any(m.intent != best.intent and m.score >= best.score for m in hits):
+        return None
+    if partial and best.score < 1.0:
+        return None
+    # 否定句（“不要结束运动”）不执行
+    start = norm.find(best.phrase)
+    head = norm[:start] if start >= 0 else norm
+    if _NEGATION.search(head):
+        return None
+    # 从句（“开始跑步之前”）不执行
+    if start >= 0 and _CLAUSE.match(norm, start + len(best.phrase)):
+        return None
+    return best
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务
+
+重新配置网络等耗时操作不在 Web 请求里同步执行：提交后立即返回任务编号，由工作线程执行，
+客户端通过 /jobs/{id} 查询状态。
+
+同一个 key 的任务串行执行；还在排队的任务收到同 key 的新提交时合并为一个
+（保留原编号、推迟到新的执行时间），连续多次提交配置只会重新配置一次网络。
+任务函数应在执行时读取最新状态（如配置快照），而不是提交时的参数。
+"""
+import collections
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import logs
+
+log = logs.get("任务")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+WORKERS = 2
+HISTORY = 50             # 保留的已结束任务数
+
+
+class Job:
+    """一个后台任务"""
+
+    def __init__(self, kind: str, func: Callable[[], object], key: Optional[str], due: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.due = due                 # 最早执行时间（单调时钟）
+        self.state = QUEUED
+        self.created = time.time()
+        self.started = None  # type: Optional[float]
+        self.finished = None  # type: Optional[float]
+        self.coalesced = 0             # 合并进来的提交次数
+        self.result = None
+        self.error = None  # type: Optional[str]
+
+    @property
+    def done(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "coalesced": self.coalesced,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """工作线程池 + 按 key 合并的任务队列"""
+
+    def __init__(self, workers: int = WORKERS, history: int = HISTORY):
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._queue = []  # type: List[Job]
+        self._busy = set()             # 正在执行的任务的 key
+        self._jobs = collections.OrderedDict()  # type: Dict[str, Job]
+        self._history = history
+        self._threads = []  # type: List[threading.Thread]
+
+    def submit(self, kind: str, func: Callable[[], object], key: Optional[str] = None,
+               delay: float = 0.0) -> Job:
+        """
+        提交任务，立即返回
+
+        Args:
+            kind: 任务类型（显示用）
+            func: 在工作线程中执行的函数，返回值记为任务结果
+            key: 同 key 的任务串行执行，排队中的会被合并
+            delay: 延迟执行的时间 (s)
+        """
+        due = time.monotonic() + delay
+        with self._cond:
+            if key is not None:
+                for job in self._queue:
+                    if job.key == key:
+                        job.func = func
+                        job.due = due
+                        job.coalesced += 1
+                        self._cond.notify_all()
+                        return job
+            job = Job(kind, func, key, due)
+            self._queue.append(job)
+            self._jobs[job.id] = job
+            self._trim()
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify_all()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def latest(self, key: str) -> Optional[Job]:
+        """某个 key 最近提交的任务"""
+        with self._cond:
+            for job in reversed(self._jobs.values()):
+                if job.key == key:
+                    return job
+        return None
+
+    def jobs(self) -> List[Job]:
+        """最近的任务，新的在前"""
+        with self._cond:
+            return list(reversed(self._jobs.values()))
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: job.done, timeout)
+
+    def _trim(self):
+        """只保留最近 history 个已结束的任务（持有锁时调用）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[job_id]
+
+    def _next(self) -> Optional[Job]:
+        """取出一个可以执行的任务；没有时返回 None（持有锁时调用）"""
+        now = time.monotonic()
+        for i, job in enumerate(self._queue):
+            if job.due <= now and job.key not in self._busy:
+                del self._queue[i]
+                return job
+        return None
+
+    def _timeout(self) -> Optional[float]:
+        """距离最早一个到期任务的时间（持有锁时调用）"""
+        waiting = [job.due for job in self._queue if job.key not in self._busy]
+        return max(0.0, min(waiting) - time.monotonic()) if waiting else None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None:
+                    self._cond.wait(self._timeout())
+                    job = self._next()
+                if job.key is not None:
+                    self._busy.add(job.key)
+                job.state = RUNNING
+                job.started = time.time()
+            try:
+                result = job.func()
+                state, error = SUCCEEDED, None
+            except Exception as e:
+                log.exception("%s（%s）失败：%s", job.kind, job.id, e)
+                result, state, error = None, FAILED, str(e)
+            with self._cond:
+                job.result = result
+                job.error = error
+                job.state = state
+                job.finished = time.time()
+                job.func = None
+                self._busy.discard(job.key)
+                self._trim()
+                self._cond.notify_all()
+
+
+_shared = None  # type: Optional[JobRunner]
+_shared_lock = threading.Lock()
+
+
+def shared() -> JobRunner:
+    """进程内共享的任务执行器"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = JobRunner()
+        return _shared
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+异步结构化日志
+
+调用线程（包括采样线程和音频回调）只创建 LogRecord 并放入队列，不格式化消息、不做 I/O；
+消息参数按 logging 的 % 风格延迟格式化（log.info("速度 %.1f", v)），由后台 QueueListener 线程负责：
+    控制台   一行 "[通道] 消息"；状态行（extra={"transient": True}）用 \\r 原地刷新
+    文件     每条记录一行 JSON，写入数据目录下的 logs/runsight.log，超过 FILE_MAX_BYTES 时轮换
+
+通道即 logger 名（runsight.<通道>，通道沿用原来的 [标签]，如 "系统"、"GPS"）。
+高频通道在调用线程上用 Throttle 限速：同一条消息模板每 interval 秒最多放行一次，
+被丢弃的条数记在下一条放行记录的 suppressed 字段中。
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import traceback
+from typing import Dict, Optional
+
+import storage
+
+ROOT = "runsight"
+FILE_NAME = "runsight.log"
+FILE_MAX_BYTES = 1024 * 1024
+FILE_BACKUPS = 3
+
+# 各通道的限速间隔 (s)：同一条消息模板在间隔内只记录一次
+THROTTLE = {
+    "状态": 1.0,   # 监控循环的状态行
+    "音频": 1.0,   # 音频回调
+    "采样": 5.0,   # 传感器读取失败（每个采样周期都可能出现）
+    "GPS": 5.0,    # 串口读取失败
+}
+
+# LogRecord 的标准属性；其余属性（extra=...）写入 JSON
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "transient"}
+
+
+class Throttle(logging.Filter):
+    """同一条消息模板每 interval 秒最多放行一次（在调用线程中执行，只做一次字典查找）"""
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._last = {}  # type: Dict[str, list]  模板 -> [上次放行时间, 之后丢弃的条数]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        state = self._last.get(record.msg)
+        if state is None:
+            self._last[record.msg] = [record.created, 0]
+            return True
+        if record.created - state[0] < self.interval:
+            state[1] += 1
+            return False
+        if state[1]:
+            record.suppressed = state[1]
+        state[0] = record.created
+        state[1] = 0
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只入队不格式化：记录留在进程内，由监听线程格式化"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _channel(record: logging.LogRecord) -> str:
+    name = record.name
+    return name[len(ROOT) + 1:] if name.startswith(ROOT + ".") else name
+
+
+class JsonFormatter(logging.Formatter):
+    """一条记录一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "channel": _channel(record),
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ConsoleHandler(logging.Handler):
+    """控制台输出；每次写入时取当前的 sys.stdout（便于 redirect_stdout）"""
+
+    def __init__(self):
+        super().__init__()
+        self._transient = False  # 上一行是原地刷新的状态行
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = f"[{_channel(record)}] {record.getMessage()}"
+            if record.exc_info:
+                text += "\n" + "".join(traceback.format_exception(*record.exc_info)).rstrip()
+            stream = sys.stdout
+            if getattr(record, "transient", False):
+                stream.write(text.ljust(60) + "\r")
+                self._transient = True
+            else:
+                # 普通消息另起一行，不覆盖状态行
+                stream.write(("\n" if self._transient else "") + text + "\n")
+                self._transient = False
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
+_listener = None  # type: Optional[logging.handlers.QueueListener]
+_handler = None   # type: Optional[_QueueHandler]
+_lock = threading.Lock()
+
+
+def setup(path: Optional[str] = None, level: int = logging.INFO, console: bool = True):
+    """
+    启动后台日志线程（重复调用无效果）
+
+    Args:
+        path: JSON 日志文件，默认为数据目录下的 logs/runsight.log
+        level: 本项目各通道的最低记录级别
+        console: 是否同时输出到控制台
+    """
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        # 不在调用线程上查找调用位置（sys._getframe），也不记录进程信息
+        logging._srcfile = None
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+        handlers = []
+        file_handler = logging.handlers.RotatingFileHandler(
+            path or storage.data_path("logs", FILE_NAME), maxBytes=FILE_MAX_BYTES,
+            backupCount=FILE_BACKUPS, encoding="utf-8", delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+        if console:
+            handlers.append(ConsoleHandler())
+
+        records = queue.SimpleQueue()
+        _handler = _QueueHandler(records)
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        # 第三方库（httpx、urllib3……）只记录警告以上
+        root.setLevel(max(level, logging.WARNING))
+        logging.getLogger(ROOT).setLevel(level)
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """写出队列中剩余的记录并停止后台线程"""
+    global _listener, _handler
+    with _lock:
+        listener, _listener = _listener, None
+        handler, _handler = _handler, None
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def get(channel: str) -> logging.Logger:
+    """获取某个通道的 logger；THROTTLE 中的通道自动限速"""
+    logger = logging.getLogger(f"{ROOT}.{channel}")
+    interval = THROTTLE.get(channel)
+    if interval and not any(isinstance(f, Throttle) for f in logger.filters):
+        logger.addFilter(Throttle(interval))
+    return logger
@@ -1,39 +1,58 @@
 # -*- coding: utf-8 -*-
+import math
 import time
 import threading
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import uvicorn
 from typing import Optional
 import os
-import sys, json
 from datetime import datetime
-from pinpong.board import Board, Pin
-from pinpong.extension.unihiker import accelerometer
-from unihiker import Audio 
-import openai
-import requests
-from web import start_server, current_config
-import voice_interact
-
-# 初始化开发板
-Board().begin()
-
-# 硬件配置
-MOTOR_PIN = Pin.P9        # 震动马达引脚
-BUZZER_PIN = Pin.P8       # 蜂鸣器引脚
-STATUS_LED = Pin.P21      # 状态指示灯
+import hal
+import config
+import logs
+import metrics
+import network
+import telemetry
+from startup import Startup
+import recorder
+import gps
+import fusion
+from baseline import GravityBaseline, BaselineEvent
+from track import TrackAccumulator
+import asr
+import intent
+import turns
+from sampler import Sampler, COL_Z
+from alarm import AlarmEngine, STOP_ALARM, FALL_ALARM, SPOKEN_ALERTS
+from detectors import (DetectorPipeline, StopDetector, RunningDetector, FallDetector, CadenceDetector,
+                       StopEvent, RunningEvent, FallEvent, CadenceEvent, alpha_for_rate)
 
 # 核心参数（根据实际测试调整）
-Z_THRESHOLD = -5.5       # 急停阈值 (m/s²)
-BUFFER_SIZE = 6          # 数据窗口大小
-DEBOUNCE_TIME = 2.0      # 触发冷却时间
-#参数推荐范围调节效果
-#Z_THRESHOLD-3.5 ~ -5.5 负值越小，灵敏度越低
-#BUFFER_SIZE5 ~ 10 值越大，抗干扰能力越强
-#DEBOUNCE_TIME1.5 ~ 3.0 值越大，误报率越低
+SAMPLE_RATE = 100        # 采样率 (Hz)
+TRIGGER_TIME = 0.15      # 跑步检测连续超阈值的持续时间 (s)
+STATUS_INTERVAL = 0.1    # 状态行刷新间隔 (s)，输出频率另受“状态”日志通道限速
+FREE_FALL_TIME = 0.06    # 跌倒检测的最短失重时间 (s)
+RUN_RELEASE_TIME = 0.5   # 合成加速度回落多久后视为停止跑步 (s)
+STOP_MERGE = 1.0         # 两个检测器在该时间内先后检出视为同一次急停 (s)
+# 急停阈值、持续时间、冷却时间、急减速阈值、前进轴和缓冲区时长见 config.Settings，可通过 Web/gRPC 接口实时修改
+
+TRIGGER_SAMPLES = max(3, round(TRIGGER_TIME * SAMPLE_RATE))
 
 OPENAI_MODEL = os.getenv("OPENAI_MODEL")
+WHISPER_MODEL = "Systran/faster-whisper-large-v3"
+STREAMING_ASR = os.getenv("RUNSIGHT_STREAMING_ASR", "1") == "1"  # 说话过程中进行部分识别
+
+# 语音回合各阶段耗时（tts 阶段由 tts.py 记录）：
+#   asr 录音结束到识别完成，llm_first_token 请求到首个 token，llm 请求到回复结束，
+#   first_audio 回复开始到出声，playback 出声到播放完毕，turn 录音结束到回合结束
+VOICE_PHASES = {phase: metrics.histogram("voice_phase_seconds", "语音回合各阶段耗时", metrics.SLOW_BUCKETS, phase=phase)
+                for phase in ("asr", "llm_first_token", "llm", "first_audio", "playback", "turn")}
+
+log = logs.get("系统")
+status_log = logs.get("状态")
+event_log = logs.get("检测")
+config_log = logs.get("配置")
+record_log = logs.get("记录")
+voice_log = logs.get("语音")
+upload_log = logs.get("上传")
 
 functions = [
     {
@@ -72,213 +91,576 @@ prompt = """
 """
 
 class SafetySystem:
-    def __init__(self):
-        print("====启动硬件自检====")
-        # 初始化硬件
-        self.motor = Pin(MOTOR_PIN, Pin.OUT)
-        self.buzzer = Pin(BUZZER_PIN, Pin.OUT)
-        self.status_led = Pin(STATUS_LED, Pin.OUT)
+    def __init__(self, backend: Optional[hal.Backend] = None, start_services: bool = True):
+        logs.setup()
+        log.info("====启动硬件自检====")
+        # 安全监控所需的部分同步初始化，其余阶段由启动编排并发执行
+        self.boot = Startup()
+        self.running = True
+        self.http = None  # 共享 HTTP 客户端（http_client.HttpClient），由 http 阶段创建
+        self.uploads = None  # 上传队列（upload_queue.UploadQueue），由 uploads 阶段创建
+        self.gps = None  # type: Optional[gps.GpsReceiver]
+        self.grpc_server = None  # ConfigureService（grpc.Server），由 grpc 阶段启动
+        self.turns = None  # 语音回合（turns.TurnManager），由 voice 阶段创建
+        self.speech = None  # 语音回复（tts.SpeechPipeline），由 voice 阶段创建
         
         # 运动记录
         self.exercise_start_time = None
         self.exercise_duration = None
         self.monitoring_enabled = False  # 默认禁用急停监控
         
-        self.ai1 = openai.OpenAI(
-            api_key=os.getenv("OPENAI_KEY1"),  # 如果您没有配置环境变量，请用百炼 API Key 将本行替换为：api_key="sk-xxx"
-            base_url=os.getenv("OPENAI_BASEURL1"),  # 填写 DashScope SDK 的 base_url
-        )
-        self.ai2 = openai.OpenAI(
-            api_key=os.getenv("OPENAI_KEY2"),  # 如果您没有配置环境变量，请用百炼 API Key 将本行替换为：api_key="sk-xxx"
-            base_url=os.getenv("OPENAI_BASEURL2"),  # 填写 DashScope SDK 的 base_url
-        )
-        self.audio = Audio()
-        # self.audio.play('/root/work/test.wav')
+        # 配置快照：监控循环每次直接读取 self.config.current，按版本号判断是否需要应用
+        self.config = config.shared()
+        self.config.subscribe(self._on_config)
+        # WiFi 配置变化时重新连接网络（Web、gRPC 的修改都经过这里，与 Web 服务是否启动无关）
+        network.watch(self.config)
+        self._applied_version = None  # type: Optional[int]
+        
+        with self.boot.stage("board"):
+            # 初始化开发板（默认按 RUNSIGHT_BACKEND 选择板载或模拟后端）
+            self.backend = backend or hal.create_backend()
+            self.backend.begin()
+            self.accelerometer = self.backend.accelerometer()
+            self.motor = self.backend.output(hal.MOTOR)
+            self.buzzer = self.backend.output(hal.BUZZER)
+            self.status_led = self.backend.output(hal.STATUS_LED)
+            self.audio = self.backend.audio()
+            # self.audio.play('/root/work/test.wav')
         
-        # 系统参数
-        self.base_z = 9.81
-        self.buffer = []
-        self.last_trigger = 0
+        with self.boot.stage("safety"):
+            self._init_safety()
         
-        # 启动初始化
-        self._simple_calibrate()
-        self._hardware_test()
+        # 其余阶段：依赖满足后立即在后台开始
+        self.boot.add("selftest", self._hardware_test)
+        self.boot.add("gps", self._init_gps)
+        self.boot.add("http", self._init_http)
+        self.boot.add("uploads", lambda: self._init_uploads(start_services), after=["http"])
+        if start_services:
+            self.boot.add("web", self._start_web_service)
+            self.boot.add("grpc", self._start_grpc_service)
+            self.boot.add("voice", self._start_voice_service, after=["http"])
+        self.boot.seal()
+    
+    def _init_safety(self):
+        """采样、检测流水线和报警引擎"""
+        # 重力基准在后台持续估计，开机先用上次保存的结果
+        self.baseline = GravityBaseline(SAMPLE_RATE)
+        self.base_z = self.baseline.base_z
+        log.info("重力基准：%.1fm/s²（置信度 %.2f）", self.base_z, self.baseline.confidence)
+        
+        # 固定频率采样器
+        settings = self.config.current
+        self.sampler = Sampler(self.accelerometer, SAMPLE_RATE, int(SAMPLE_RATE * settings.BufferSeconds))
+        
+        # 报警引擎（独立线程播放，不阻塞采样）
+        self.alarm = AlarmEngine({
+            hal.MOTOR: self.motor,
+            hal.BUZZER: self.buzzer,
+            hal.STATUS_LED: self.status_led,
+        })
+        self.alarm.start()
+        
+        # 检测流水线：每批样本只读一次，分发给所有检测器
+        self.pipeline = DetectorPipeline(self.sampler.buffer)
+        self.pipeline.register(self.baseline)
+        self.stop_detector = self.pipeline.register(StopDetector(base_z=self.base_z))
+        self.running_detector = self.pipeline.register(
+            RunningDetector(trigger_samples=TRIGGER_SAMPLES, alpha=alpha_for_rate(0.2, SAMPLE_RATE),
+                            release_samples=round(RUN_RELEASE_TIME * SAMPLE_RATE)))
+        self.pipeline.register(FallDetector(free_fall_samples=max(3, round(FREE_FALL_TIME * SAMPLE_RATE))))
+        # 步频与步长模型：GPS 信号弱时估计速度和距离
+        self.cadence_detector = self.pipeline.register(CadenceDetector(SAMPLE_RATE))
+        self.cadence = None  # type: Optional[CadenceEvent]
+        self._cadence_distance = 0.0  # 本次运动开始时步长模型的累计距离
+        # GPS/IMU 速度融合：按前进方向的真实减速检测急停，与 Z 轴阈值检测任一检出即报警
+        axis, sign = fusion.FORWARD_AXES[settings.ForwardAxis]
+        self.fusion = self.pipeline.register(fusion.SpeedFusion(
+            SAMPLE_RATE, axis, sign, settings.DecelThreshold, settings.MinStopSpeed))
+        self._apply_settings(settings)
+        self._last_stop = None  # type: Optional[float]
+        self.pipeline.subscribe(StopEvent, self._on_stop)
+        self.pipeline.subscribe(FallEvent, self._on_fall)
+        self.pipeline.subscribe(RunningEvent, self._on_running)
+        self.pipeline.subscribe(CadenceEvent, self._on_cadence)
+        self.pipeline.subscribe(BaselineEvent, self._on_baseline)
+        # 会话记录：运动期间把加速度和事件写入本地文件
+        self.recorder_tap = self.pipeline.register(recorder.RecorderTap())
+        self.session = None  # type: Optional[recorder.SessionRecorder]
         
-        # 启动 Web 服务
-        self._start_web_service()
+        # 运动轨迹（距离、配速、路线）
+        self.track = TrackAccumulator()
+        self._tracking = False
         
-        self._start_voice_service()
+        # 实时遥测：遥测线程自己读取缓冲区和状态，监控循环只转发事件
+        self.telemetry = telemetry.shared()
+        self.telemetry.attach(self.sampler.buffer, SAMPLE_RATE, self._telemetry_status)
+        for event_type in (StopEvent, FallEvent, RunningEvent):
+            self.pipeline.subscribe(event_type, self.telemetry.publish)
+        
+        # 运行指标：各模块自己记录，这里只补充按需读取的状态量；环形日志随监控循环启动
+        self.metrics = metrics.shared()
+        self.metrics.gauge("baseline_confidence", "重力基准的置信度", lambda: self.baseline.confidence)
+        self.metrics.gauge("telemetry_subscribers", "实时遥测客户端数", lambda: len(self.telemetry.subscribers))
+        self.metrics.gauge("config_version", "已应用的配置版本", lambda: self._applied_version or 0)
+    
+    def _init_gps(self):
+        """GPS 接收（串口不可用时只做加速度监控）"""
+        try:
+            receiver = gps.GpsReceiver(self.backend.gps_uart(), self.backend.now)
+        except Exception as e:
+            log.warning("GPS 串口不可用：%s", e)
+            return
+        receiver.subscribe(self._on_fix)
+        receiver.start()
+        self.gps = receiver
+        if not self.running:
+            receiver.stop()
+    
+    def _init_http(self):
+        """共享 HTTP 客户端（长连接池、按端点的超时与重试）"""
+        import http_client
+        self.http = http_client.shared()
+    
+    def _init_uploads(self, start: bool):
+        """跑步记录先写入本地队列，由后台线程上传"""
+        from upload_queue import UploadQueue
+        self.uploads = UploadQueue(self.http)
+        if start:
+            self.uploads.start()
     
     def _start_web_service(self):
         """启动 Web 服务"""
-        print("[系统] 正在启动 Web 服务...")
+        log.info("正在启动 Web 服务...")
+        from web import start_server
         web_thread = threading.Thread(target=start_server, daemon=True)
         web_thread.start()
-        print("[系统] Web 服务已启动")
+        log.info("Web 服务已启动")
+    
+    def _start_grpc_service(self):
+        """启动 gRPC ConfigureService（与 Web 共用配置存储和遥测中心）"""
+        log.info("正在启动 gRPC 服务...")
+        try:
+            from grpc_impl import configure_service
+        except ImportError as e:
+            log.error("gRPC 服务不可用（%s），请先运行 tools/generate_grpc.sh", e)
+            raise
+        self.grpc_server = configure_service.serve(block=False)
+        log.info("gRPC 服务已启动（端口 %d）", configure_service.PORT)
         
         
     def _start_voice_service(self):
         """启动语音交互服务"""
-        print("[系统] 正在启动语音交互服务...")
-        voice_interact.speech_captured = lambda filename: self.on_speech_captured(filename)
+        log.info("正在启动语音交互服务...")
+        import echo
+        import http_client
+        import tts
+        from tts_cache import TtsCache
+        # 地址取自 OPENAI_BASEURL1/OPENAI_BASEURL2（填写 DashScope SDK 的 base_url）
+        self.ai1 = self.http.openai_client(http_client.ASR, os.getenv("OPENAI_KEY1"))
+        self.ai2 = self.http.openai_client(http_client.LLM, os.getenv("OPENAI_KEY2"))
+        import voice_interact
+        self.voice = voice_interact
+        tts_client = tts.TtsClient(http=self.http)
+        # 播放时麦克风保持开启：播放线程记录回声参考，录音按回声估计过滤扬声器的声音
+        self.echo = echo.EchoGate()
+        self.speech = tts.SpeechPipeline(self.backend, tts_client, TtsCache(tts_client.params), reference=self.echo)
+        self.turns = turns.TurnManager()
+        self.recognizer = None
+        self._turn_command = None  # 当前语音中已在部分识别阶段执行的指令
+        self._partial_intent = None  # 上一个部分识别结果命中、尚待确认的意图
+        if STREAMING_ASR:
+            self.recognizer = asr.WindowedRecognizer(self._transcribe, on_partial=self._on_partial,
+                                                     sample_rate=voice_interact.SAMPLE_RATE)
+            voice_interact.speech_chunk = self.recognizer.feed
+        voice_interact.echo_gate = self.echo
+        voice_interact.speech_started = self._on_speech_started
+        voice_interact.speech_confirmed = self._on_speech_confirmed
+        voice_interact.speech_captured = self._on_speech_captured
         web_thread = threading.Thread(target=voice_interact.work, daemon=True)
         web_thread.start()
-        print("[系统] 语音交互服务已启动")
-    
-    def _simple_calibrate(self):
-        """3 秒快速校准"""
-        print("[校准] 正在校准传感器...")
-        samples = []
-        for _ in range(50):
-            samples.append(accelerometer.get_z())
-            time.sleep(0.02)
-        self.base_z = sum(samples)/len(samples)
-        print(f"[校准] 基准值：{self.base_z:.1f}m/s²")
+        # 后台预合成固定提示语
+        self.speech.cache.start_prerender(tts_client)
+        log.info("语音交互服务已启动")
     
     def _hardware_test(self):
         """硬件自检"""
-        print("[自检] 正在测试外设...")
+        log.info("自检：正在测试外设...")
         for device in [self.motor, self.buzzer, self.status_led]:
             device.write_digital(1)
             time.sleep(0.2)
             device.write_digital(0)
-        print("[自检] 外设测试完成")
+        log.info("自检：外设测试完成")
     
-    def _safe_get_z(self):
-        """带异常保护的传感器读取"""
-        try:
-            return accelerometer.get_z() - self.base_z
-        except Exception as e:
-            print(f"[错误] 传感器读取失败：{str(e)}")
-            return 0.0  # 返回安全值
+    def _activate_alarm(self, pattern=STOP_ALARM, detected_at: Optional[float] = None):
+        """触发报警装置（立即返回，由报警引擎播放），语音服务可用时同时播报提示"""
+        self.alarm.trigger(pattern, detected_at)
+        text = SPOKEN_ALERTS.get(pattern.name)
+        if text is not None and self.speech is not None and self.turns is not None:
+            # 取消回合、关闭连接可能稍有耗时，不在监控线程中执行
+            threading.Thread(target=self._speak_alert, args=(text,), name="speak-alert", daemon=True).start()
     
-    def _activate_alarm(self):
-        """触发报警装置"""
-        self.last_trigger = time.time()
-        
-        # 报警模式：3 次震动 + 蜂鸣
-        for _ in range(3):
-            self.motor.write_digital(1)
-            self.buzzer.write_digital(1)
-            self.status_led.write_digital(1)
-            time.sleep(0.3)
-            
-            self.motor.write_digital(0) 
-            self.buzzer.write_digital(0)
-            self.status_led.write_digital(0)
-            time.sleep(0.2)
+    def _speak_alert(self, text: str):
+        """停止正在进行的语音回合和回复，播报报警提示"""
+        self.turns.cancel("alert")
+        self.speech.cancel()
+        self.speech.say(text)
+    
+    def _on_stop(self, event: StopEvent):
+        """
+        急停事件（仅在监控启用时报警）
+
+        Z 轴阈值和融合减速两个检测器互为补充，任一检出即报警；佩戴方向不确定时前进轴可能不可靠，
+        不能用融合结果屏蔽 Z 轴检测。两者先后检出同一次急停只报警一次。
+        """
+        last = self._last_stop
+        if last is not None and event.t - last < max(STOP_MERGE, self.config.current.DebounceTime):
+            return
+        self._last_stop = event.t
+        self._record_event("stop", event.t, event.value)
+        if self.monitoring_enabled:
+            event_log.warning("检测到急停事件！")
+            self._activate_alarm(STOP_ALARM, event.t)
+    
+    def _on_fall(self, event: FallEvent):
+        """跌倒事件（仅在监控启用时报警）"""
+        self._record_event("fall", event.t, event.impact)
+        if self.monitoring_enabled:
+            event_log.warning("检测到跌倒！冲击 %.1fm/s²", event.impact)
+            self._activate_alarm(FALL_ALARM, event.t)
+    
+    def _on_running(self, event: RunningEvent):
+        """跑步状态变化"""
+        self._record_event("running_start" if event.running else "running_stop", event.t, event.magnitude)
+        event_log.info("%s（合成加速度 %.1fm/s²）", "开始跑步" if event.running else "停止跑步", event.magnitude)
+    
+    def _record_event(self, kind: str, t: float, value: float):
+        session = self.session
+        if session is not None:
+            session.event(t, kind, value)
+    
+    def _telemetry_status(self) -> dict:
+        """遥测状态帧（在遥测线程中调用，只读取现成的属性）"""
+        cadence = self.cadence
+        fix = self.gps.latest.value if self.gps is not None else None
+        return {
+            "t": self.backend.now(),
+            "monitoring": self.monitoring_enabled,
+            "exercising": self._tracking,
+            "running": self.running_detector.running,
+            "base_z": self.base_z,
+            "baseline_confidence": self.baseline.confidence,
+            "speed": self.fusion.speed,
+            "cadence": cadence.cadence if cadence is not None else None,
+            "distance": self.track.distance,
+            "pace": self.track.current_pace,
+            "gps": None if fix is None else {"valid": fix.valid, "lat": fix.lat, "lon": fix.lon, "hdop": fix.hdop},
+            "config_version": self._applied_version,
+        }
+    
+    def _apply_settings(self, settings: config.Settings):
+        """把配置快照应用到检测器（在监控线程中调用）"""
+        detector = self.stop_detector
+        detector.threshold = settings.SpeedThreshold
+        detector.trigger_samples = max(3, round(settings.TriggerTime * SAMPLE_RATE))
+        detector.history = detector.trigger_samples - 1
+        detector.cooldown = settings.DebounceTime
+        self.fusion.threshold = settings.DecelThreshold
+        self.fusion.min_speed = settings.MinStopSpeed
+        self.fusion.set_forward(*fusion.FORWARD_AXES[settings.ForwardAxis])
+        self._applied_version = settings.version
+    
+    def _on_config(self, old: config.Settings, new: config.Settings):
+        """配置变更通知（在更新配置的线程中调用；检测器参数由监控循环按快照应用）"""
+        changes = config.diff(old, new)
+        if "WifiPassword" in changes:
+            changes["WifiPassword"] = "******"
+        config_log.info("已更新到版本 %d：%s", new.version, changes)
+        if "BufferSeconds" in changes:
+            config_log.info("缓冲区时长将在重启后生效")
+    
+    def _on_baseline(self, event: BaselineEvent):
+        """重力基准更新：急停检测随之使用新的基准"""
+        self.base_z = event.base_z
+        self.stop_detector.base_z = event.base_z
+    
+    def _on_cadence(self, event: CadenceEvent):
+        """步频估计：作为速度观测送入融合滤波器"""
+        self.cadence = event
+        if event.cadence > 0:
+            self.fusion.observe(event.speed, fusion.STRIDE_NOISE)
+        elif event.confidence == 0:
+            self.fusion.observe(0.0, fusion.STILL_NOISE)  # 几乎没有加速度变化：静止
+    
+    def _on_fix(self, fix: gps.Fix):
+        """新的 GPS 定位（在 GPS 接收线程中调用）"""
+        if fix.valid and not math.isnan(fix.speed):
+            self.fusion.observe_gps(fix.speed, 1.0 if math.isnan(fix.hdop) else fix.hdop)
+        if self._tracking and self.track.add(fix):
+            # 有可靠的 GPS 速度时校准步长模型
+            cadence = self.cadence
+            if cadence is not None and cadence.cadence > 0 and fix.speed >= 1.0:
+                self.cadence_detector.stride_model.calibrate(cadence.cadence / 60.0, fix.speed)
+        session = self.session
+        if session is not None and fix.valid:
+            session.fix(fix.t, fix.lat, fix.lon, fix.speed, fix.course, fix.altitude, fix.hdop)
+    
+    def _start_recording(self):
+        """开始记录本次运动"""
+        self._stop_recording()
+        path = recorder.session_path()
+        self.session = recorder.SessionRecorder(path, meta={
+            "sample_rate": SAMPLE_RATE,
+            "base_z": self.base_z,
+            "started": datetime.now().isoformat(),
+        })
+        self.recorder_tap.recorder = self.session
+        record_log.info("开始记录：%s", path)
+    
+    def _stop_recording(self):
+        """结束记录并写出剩余数据"""
+        session, self.session = self.session, None
+        self.recorder_tap.recorder = None
+        if session is not None:
+            session.close()
+            record_log.info("记录完成：%dKB（压缩前 %dKB）", session.bytes_written // 1024, session.bytes_raw // 1024)
     
     def monitor_loop(self):
         """主监控循环"""
-        print("[系统] 安全监控已启动")
+        log.info("安全监控已启动")
+        self.sampler.start()
+        self.metrics.log.start()
+        buffer = self.sampler.buffer
+        self.pipeline.seq = buffer.count
+        last_status = 0.0
         try:
-            while True:
-                # 读取并处理数据
-                current_z = self._safe_get_z()
-                self.buffer = (self.buffer + [current_z])[-BUFFER_SIZE:]
-                
-                # 显示简化信息
-                status = '正常' if current_z > Z_THRESHOLD else '急停'
-                monitor_status = '启用' if self.monitoring_enabled else '禁用'
-                print(f"Z 轴：{current_z:6.2f} 状态：{status} 监控：{monitor_status}".ljust(60), end='\r')
+            while self.running:
+                # 等待采样线程写入新数据，整批交给检测流水线
+                count = self.sampler.wait(self.pipeline.seq, timeout=0.5)
+                if count == self.pipeline.seq:
+                    continue
+                # 无锁读取最新的配置快照，版本变化时应用到检测器
+                settings = self.config.current
+                if settings.version != self._applied_version:
+                    self._apply_settings(settings)
+                self.pipeline.process(count)
                 
-                # 触发条件判断（仅在监控启用时）
-                if self.monitoring_enabled and len(self.buffer) >= 3 and all(z < Z_THRESHOLD for z in self.buffer[-3:]):
-                    if time.time() - self.last_trigger > DEBOUNCE_TIME:
-                        print("\n[警报] 检测到急停事件！")
-                        self._activate_alarm()
-                
-                time.sleep(0.05)
+                # 显示简化信息（只传参数，格式化和输出在日志线程中进行）
+                now = time.monotonic()
+                if now - last_status >= STATUS_INTERVAL:
+                    last_status = now
+                    current_z = float(buffer.window(1)[0, COL_Z] - self.base_z)
+                    status_log.info("Z 轴：%6.2f 速度：%4.1fm/s 状态：%s 监控：%s", current_z, self.fusion.speed,
+                                    '正常' if current_z > settings.SpeedThreshold else '急停',
+                                    '启用' if self.monitoring_enabled else '禁用', extra={"transient": True})
                 
         except KeyboardInterrupt:
             self._shutdown()
+    
+    def stop(self):
+        """停止监控循环"""
+        self.running = False
+        self.telemetry.stop()
+        self.sampler.stop()
+        self.metrics.log.stop()
+        if self.gps is not None:
+            self.gps.stop()
+        self.alarm.stop()
             
-    def on_speech_captured(self, filename: str): 
+    def _transcribe(self, audio) -> str:
+        """调用 Whisper 接口转写一段已编码的音频"""
+        return self.ai1.audio.transcriptions.create(
+            model=WHISPER_MODEL,
+            file=audio.as_file(),
+            response_format="text",
+            language="zh"
+        )
+    
+    def _on_speech_started(self):
+        """新的一段语音开始（音频回调线程）"""
+        self._turn_command = None
+        self._partial_intent = None
+        if self.recognizer is not None:
+            self.recognizer.start()
+    
+    def _on_speech_confirmed(self):
+        """近端人声已持续足够长（音频回调线程）：回复尚未结束时打断"""
+        if self.turns.current is not None or self.speech.busy:
+            # 关闭连接、清空播放可能稍有耗时，不在音频回调中执行
+            threading.Thread(target=self._barge_in, name="barge-in", daemon=True).start()
+    
+    def _barge_in(self):
+        """取消正在进行的回合，停止所有回复的合成与播放"""
+        self.turns.barge_in()
+        self.speech.cancel()
+    
+    def _on_speech_captured(self, utterance):
+        """一段录音结束（音频回调线程）：在新回合中处理，不等待上一回合收尾"""
+        command, self._turn_command = self._turn_command, None
+        # 识别器在这里就结束本段语音，回合处理期间开始的新语音不影响本段的结果
+        state = self.recognizer.end() if self.recognizer is not None else None
+        self.turns.start(self.on_speech_captured, utterance, command, state)
+    
+    def _on_partial(self, hypothesis: asr.Hypothesis):
+        """
+        部分识别结果：命中运动指令时立即提前结束录音，不再等待静默超时
+
+        开始运动立即执行；结束运动会关闭急停监控，第一次命中只结束录音，
+        下一个部分结果仍命中时执行，否则由整句识别结果决定。
+        """
+        voice_log.info("whisper(partial %.1fs, %.2fs)> %s", hypothesis.audio_seconds, hypothesis.latency, hypothesis.text)
+        if self._turn_command is not None:
+            return
+        match = intent.match(hypothesis.text, partial=True)
+        previous, self._partial_intent = self._partial_intent, match.intent if match is not None else None
+        if match is None:
+            return
+        self.voice.request_end()
+        if match.intent in intent.CONFIRM_INTENTS and previous != match.intent:
+            return
+        self._execute_intent(match)
+    
+    def _try_local_intent(self, text: str, turn: Optional[turns.Turn] = None) -> bool:
+        """本地意图快速通道：命中运动指令时直接执行并播报固定回复，返回是否命中"""
+        match = intent.match(text)
+        if match is None:
+            return False
+        self._execute_intent(match, turn)
+        return True
+    
+    def _execute_intent(self, match: intent.IntentMatch, turn: Optional[turns.Turn] = None):
+        """执行命中的运动指令并播报固定回复；turn 为 None 表示在说话过程中命中"""
+        voice_log.info("本地意图命中 %s（%s，%.2f）", match.intent, match.phrase, match.score)
+        if turn is None:
+            # 说话过程中命中：录音结束后不再请求大模型
+            self._turn_command = match.intent
+        self._run_command(match.intent)
+        reply = self.speech.say(intent.RESPONSES[match.intent])
+        if turn is not None:
+            turn.on_cancel(reply.cancel)
+    
+    def _run_command(self, func_name: str):
+        """执行运动指令"""
+        if func_name == intent.START_EXERCISE:
+            log.info("开始运动")
+            self.exercise_start_time = datetime.now()
+            self.monitoring_enabled = True  # 启用急停监控
+            log.info("急停监控已启用")
+            self.track = TrackAccumulator()
+            self._tracking = True
+            self._cadence_distance = self.cadence_detector.distance
+            self._start_recording()
+        elif func_name == intent.END_EXERCISE:
+            log.info("结束运动")
+            self.monitoring_enabled = False  # 禁用急停监控
+            log.info("急停监控已禁用")
+            self._tracking = False
+            self._stop_recording()
+            if self.exercise_start_time:
+                self.exercise_duration = datetime.now() - self.exercise_start_time
+                self.exercise_start_time = None
+            self._upload_data()
+    
+    def on_speech_captured(self, turn: turns.Turn, utterance, command: Optional[str] = None, state=None):
+        """
+        处理一段录音（回合线程）：识别、本地意图或大模型回复、合成播放
+
+        用户再次开口时回合被取消：登记的回调关闭大模型流和合成请求并停止播放，各阶段之间的 check() 退出。
+        state 为识别器 end() 在录音结束时返回的识别状态。
+        """
+        captured = time.perf_counter()
         try:
-            with open(filename, "rb") as f:
-                resultInput = self.ai1.audio.transcriptions.create(
-                    model="Systran/faster-whisper-large-v3",
-                    file=f,
-                    response_format="text",
-                    language="zh"
-                )
-            print('whisper>', resultInput)
-            res = self.ai2.chat.completions.create(
+            if command is not None:
+                # 指令已在说话过程中执行，不再请求大模型
+                return
+            if self.recognizer is not None:
+                hypothesis = self.recognizer.resolve(utterance, state)
+                resultInput = hypothesis.text
+            else:
+                # 录音在内存中编码后直接上传，不经过文件系统
+                audio = utterance.encode()
+                voice_log.info("录音 %.1fs，%s %dKB", utterance.duration, audio.filename, len(audio.data) // 1024)
+                resultInput = self._transcribe(audio)
+            turn.check()
+            VOICE_PHASES["asr"].observe(time.perf_counter() - captured)
+            voice_log.info("whisper> %s", resultInput)
+            if self._try_local_intent(resultInput, turn):
+                return
+            # 大模型回复以流的形式逐句送往 TTS，边生成边合成边播放
+            requested = time.perf_counter()
+            stream = self.ai2.chat.completions.create(
                 model=OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": prompt},
                     {"role": "user", "content": resultInput}
                 ],
                 tools=functions,
-                tool_choice="auto"
+                tool_choice="auto",
+                stream=True
             )
-            message = res.choices[0].message
-            if message.tool_calls is not None and len(message.tool_calls) >= 1:
-                func_name = message.tool_calls[0].function.name
-                if func_name == "start_exercise":
-                    print("开始运动")
-                    self.exercise_start_time = datetime.now()
-                    self.monitoring_enabled = True  # 启用急停监控
-                    print("[系统] 急停监控已启用")
-                elif func_name == "end_exercise":
-                    print("结束运动")
-                    self.monitoring_enabled = False  # 禁用急停监控
-                    print("[系统] 急停监控已禁用")
-                    if self.exercise_start_time:
-                        self.exercise_duration = datetime.now() - self.exercise_start_time
-                        self.exercise_start_time = None
-                    self._upload_data()
-            rsp = res.choices[0].message.content
-            print(rsp)
-
-            # 定义 API 的 URL 和端口
-            url = "http://10.1.2.101:9880/tts"
-
-            # 构造请求数据
-            data = {
-                "text": rsp,
-                "text_lang": "zh",  # 文本语言
-                "ref_audio_path": "【普通】为曾经拥有过某种幸福而开心，为未来依旧会出现奇迹而期待。.wav",  # 参考音频路径
-                "prompt_lang": "zh",  # 提示文本语言
-                "prompt_text": "为曾经拥有过某种幸福而开心，为未来依旧会出现奇迹而期待。",
-                "top_k": 5,
-                "top_p": 1.0,
-                "temperature": 1.0,
-                "batch_size": 1,
-                "media_type": "wav",  # 返回的音频格式
-                "streaming_mode": False,  # 是否启用流式传输
-                "text_split_method": "cut3",
-            }
-
-            # 发送 POST 请求
-            response = requests.post(url, json=data)
-
-            # 检查返回状态并处理响应
-            if response.status_code == 200:
-                # 保存返回的音频流
-                with open("/tmp/output.wav", "wb") as f:
-                    f.write(response.content)
-                print("生成的语音已保存为 /tmp/output.wav")
-                self.audio.play("/tmp/output.wav")
-            else:
-                # 输出错误信息
-                print(f"请求失败：{response.status_code}")
-                print(response.json())
-        except Exception as e:
-            print(f"[错误] 语音识别失败：{str(e)}")
+            turn.on_cancel(stream.close)
+            reply = self.speech.start_turn()
+            turn.on_cancel(reply.cancel)
+            func_name = None
+            first_token = True
+            try:
+                for chunk in stream:
+                    turn.check()
+                    if first_token:
+                        first_token = False
+                        VOICE_PHASES["llm_first_token"].observe(time.perf_counter() - requested)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    for tool_call in delta.tool_calls or ():
+                        if tool_call.function is not None and tool_call.function.name:
+                            func_name = tool_call.function.name
+                    if delta.content:
+                        reply.feed(delta.content)
+            finally:
+                reply.close()
+            turn.check()
+            VOICE_PHASES["llm"].observe(time.perf_counter() - requested)
+            if func_name is not None:
+                self._run_command(func_name)
+            voice_log.info("回复：%s", reply.text)
+            reply.wait()
+            turn.check()
+            if reply.first_audio is not None:
+                VOICE_PHASES["first_audio"].observe(reply.time_to_first_audio)
+                VOICE_PHASES["playback"].observe(time.monotonic() - reply.first_audio)
         finally:
-            os.remove(filename)
+            VOICE_PHASES["turn"].observe(time.perf_counter() - captured)
     
     def _shutdown(self):
         """安全关闭系统"""
+        self.telemetry.stop()
+        self.sampler.stop()
+        self.metrics.log.stop()
+        if self.gps is not None:
+            self.gps.stop()
+        self.alarm.stop()
+        if self.uploads is not None:
+            self.uploads.stop()
+            upload_log.info("上传队列：%s", self.uploads.stats())
+        if self.grpc_server is not None:
+            self.grpc_server.stop(grace=1)
+        if self.turns is not None:
+            self.turns.stop()
+            self.speech.cancel()
+        self._stop_recording()
+        self.baseline.save()
         self.motor.write_digital(0)
         self.buzzer.write_digital(0)
         self.status_led.write_digital(0)
-        print("\n[系统] 安全关闭完成")
+        for name, stats in (self.http.stats() if self.http is not None else {}).items():
+            if stats["requests"]:
+                log.info("网络 %s：%s", name, stats)
+        log.info("安全关闭完成")
+        logs.shutdown()
         
     def _upload_data(self):
         """上传数据"""
-        print("[上传] 正在上传数据...")
+        upload_log.info("正在上传数据...")
         
         # 格式化持续时间
         duration_str = "00:00:00"
@@ -288,22 +670,33 @@ class SafetySystem:
             minutes, seconds = divmod(remainder, 60)
             duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
         
+        # 距离和配速以 GPS 轨迹为准；没有 GPS 定位时用步频和步长模型估计
+        distance = self.track.distance
+        pace = self.track.average_pace or 0.0
+        if self.track.accepted < 2:
+            distance = self.cadence_detector.distance - self._cadence_distance
+            if distance >= 1.0 and self.exercise_duration:
+                pace = self.exercise_duration.total_seconds() / 60.0 / (distance / 1000.0)
+        
         data = {
-            "userId": current_config.UID or 1,  # 使用配置的 UID，如果为空则使用默认值 1
+            "userId": self.config.current.UID or 1,  # 使用配置的 UID，如果为空则使用默认值 1
             "runDate": datetime.now().isoformat(),
-            "distance": 7.5,
-            "averagePace": 10,
+            "distance": round(distance / 1000.0, 3),  # 公里
+            "averagePace": round(pace, 2),            # 分钟/公里
             "averageHeartRate": 70,
-            "routeMap": "string",
+            "routeMap": self.track.polyline(),  # Douglas–Peucker 抽稀后的编码折线
             "notes": "string",
             "isPublic": True,
             "createdAt": datetime.now().isoformat(),
             "duration": duration_str
         }
-        url = "http://10.1.2.101:5238/api/RunningData"
-        print(data)
-        response = requests.post(url, json=data)
-        print("[上传] 数据上传完成")
+        upload_log.info("跑步记录：%s", data)
+        if not self.boot.wait("uploads", timeout=10.0):
+            upload_log.error("上传队列不可用，本次记录未保存")
+            return
+        # 只写本地队列，不等待网络
+        self.uploads.enqueue(data)
+        upload_log.info("已加入上传队列（待上传 %d 条）", self.uploads.depth)
 
 if __name__ == "__main__":
     system = SafetySystem()
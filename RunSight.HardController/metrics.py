@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+运行时指标：直方图、计数器和仪表
+
+各模块在导入时注册自己的指标（模块级常量），热路径上只做一次 bisect 和几次整数/浮点加法，
+不加锁、不分配对象：每个指标原则上只有一个写入线程（采样线程、监控线程、音频回调……），
+偶发的并发写入最多让计数差一，对统计没有影响。
+
+读取方式：
+    render()       Prometheus 文本格式（web.py 的 /metrics）
+    shared().log   设备本地的环形日志：每 LOG_INTERVAL 秒把各指标在这段时间内的
+                   次数、平均值、p50/p99 和峰值写成一行 JSON，内存中保留最近 LOG_ENTRIES 条，
+                   文件超过 LOG_MAX_BYTES 时轮换（只保留上一份）
+"""
+import bisect
+import collections
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import logs
+import storage
+
+log = logs.get("指标")
+
+PREFIX = "runsight_"
+LOG_FILE = "metrics.log"
+LOG_INTERVAL = 10.0          # 环形日志的记录间隔 (s)
+LOG_ENTRIES = 360            # 内存中保留的记录数（1 小时）
+LOG_MAX_BYTES = 256 * 1024   # 日志文件轮换大小
+
+# 常用的桶边界 (s)
+FAST_BUCKETS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05)
+LOOP_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.008, 0.01, 0.012, 0.015, 0.02, 0.05, 0.1)
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0)
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """固定桶直方图（桶边界为上界，含等号，与 Prometheus 的 le 一致）"""
+
+    kind = "histogram"
+    __slots__ = ("name", "help", "labels", "bounds", "counts", "sum", "peak")
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.peak = 0.0  # 上次写环形日志以来的最大值
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        if value > self.peak:
+            self.peak = value
+
+    def time(self) -> "_Timer":
+        """用于非热路径的计时：with histogram.time(): ..."""
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        """按桶内线性插值估计分位数"""
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                if i == len(self.bounds):
+                    return lower  # 落在 +Inf 桶里，只能给出下界
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += n
+            le = _format_labels(self.labels, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    """只增计数器"""
+
+    kind = "counter"
+    __slots__ = ("name", "help", "labels", "value")
+
+    def __init__(self, name: str, help: str, labels: Tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+    """仪表：读取时调用 func 取当前值（不在热路径上更新）"""
+
+    kind = "gauge"
+    __slots__ = ("name", "help", "labels", "func")
+
+    def __init__(self, name: str, help: str, func: Callable[[], float], labels: Tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.func = func
+
+    @property
+    def value(self) -> float:
+        try:
+            return float(self.func())
+        except Exception:
+            return float("nan")
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+
+class Registry:
+    """指标注册表：同名同标签的指标只创建一次"""
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()  # type: Dict[tuple, object]
+        self._lock = threading.Lock()
+        self.log = RingLog(self)
+
+    def _get(self, cls, name: str, labels: Dict[str, str], *args):
+        name = PREFIX + name
+        key = (name, _labels(labels))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, *args, labels=key[1])
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, labels, help, buckets)
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        return self._get(Counter, name, labels, help)
+
+    def gauge(self, name: str, help: str, func: Callable[[], float], **labels) -> Gauge:
+        gauge = self._get(Gauge, name, labels, help, func)
+        gauge.func = func  # 重新注册时指向新的数据源（如控制器重建）
+        return gauge
+
+    def metrics(self) -> list:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        seen = set()
+        # 同名指标（不同标签）的 HELP/TYPE 只输出一次，且样本须连续
+        for metric in sorted(self.metrics(), key=lambda m: m.name):
+            if metric.name not in seen:
+                seen.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RingLog:
+    """设备本地的指标环形日志"""
+
+    def __init__(self, registry: Registry, path: Optional[str] = None, interval: float = LOG_INTERVAL,
+                 entries: int = LOG_ENTRIES, max_bytes: int = LOG_MAX_BYTES):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.entries = collections.deque(maxlen=entries)
+        self._previous = {}  # type: Dict[int, object]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.path is None:
+            self.path = storage.data_path(LOG_FILE)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.record()
+
+    def recent(self, n: Optional[int] = None) -> List[dict]:
+        entries = list(self.entries)
+        return entries if n is None else entries[-n:]
+
+    def record(self) -> Optional[dict]:
+        """记录一条：各指标自上一条以来的变化，没有变化的指标不写"""
+        values = {}
+        for metric in self.registry.metrics():
+            key = metric.name[len(PREFIX):] + _format_labels(metric.labels)
+            previous = self._previous.get(id(metric))
+            if isinstance(metric, Histogram):
+                counts = list(metric.counts)
+                total = metric.sum
+                # 读后清零峰值；与写入线程的竞争最多丢掉一个峰值
+                peak, metric.peak = metric.peak, 0.0
+                self._previous[id(metric)] = (counts, total)
+                if previous is not None:
+                    delta = [a - b for a, b in zip(counts, previous[0])]
+                    total -= previous[1]
+                else:
+                    delta = counts
+                n = sum(delta)
+                if n:
+                    # 桶内插值的分位数不会超过实际峰值（峰值丢失时不做限制）
+                    limit = peak or float("inf")
+                    values[key] = {
+                        "n": n,
+                        "avg_ms": round(1000 * total / n, 3),
+                        "p50_ms": round(1000 * min(metric.quantile(0.5, delta), limit), 3),
+                        "p99_ms": round(1000 * min(metric.quantile(0.99, delta), limit), 3),
+                        "max_ms": round(1000 * peak, 3),
+                    }
+            elif isinstance(metric, Counter):
+                value = metric.value
+                self._previous[id(metric)] = value
+                if value - (previous or 0):
+                    values[key] = value - (previous or 0)
+            else:
+                values[key] = metric.value
+        if not values:
+            return None
+        entry = {"t": round(time.time(), 1), "metrics": values}
+        self.entries.append(entry)
+        if self.path is not None:
+            self._write(entry)
+        return entry
+
+    def _write(self, entry: dict):
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        except OSError as e:
+            log.warning("写入日志失败：%s", e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.record()
+
+
+_shared = None  # type: Optional[Registry]
+_shared_lock = threading.Lock()
+
+
+def shared() -> Registry:
+    """进程内共享的指标注册表"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Registry()
+        return _shared
+
+
+def histogram(name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+    return shared().histogram(name, help, buckets, **labels)
+
+
+def counter(name: str, help: str, **labels) -> Counter:
+    return shared().counter(name, help, **labels)
+
+
+def gauge(name: str, help: str, func: Callable[[], float], **labels) -> Gauge:
+    return shared().gauge(name, help, func, **labels)
+
+
+def render() -> str:
+    return shared().render()
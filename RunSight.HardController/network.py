@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+WiFi 重新配置
+
+WifiSSID/WifiPassword 变化时（无论来自 Web 还是 gRPC）提交后台任务，按最新的配置快照
+重新配置并重连网络。订阅由控制器在创建配置存储时调用 watch 注册，不依赖 Web 服务是否启动。
+"""
+import subprocess
+import threading
+from typing import Optional
+
+import config
+import jobs
+import logs
+
+log = logs.get("网络")
+
+WIFI_JOB = "wifi"
+WIFI_DELAY = 1.0         # 重新配置网络前的等待时间 (s)：先把响应发回去，并合并连续的配置提交
+NMCLI_TIMEOUT = 30.0     # 单条 nmcli 命令的超时 (s)
+WIFI_FIELDS = ("WifiSSID", "WifiPassword")
+
+_watched = set()  # 已注册订阅的配置存储
+_watched_lock = threading.Lock()
+
+
+def apply_wifi(store: config.ConfigStore) -> str:
+    """按最新的配置快照重新配置并重连 WiFi（在任务线程中执行）"""
+    settings = store.current
+    commands = [
+        ["nmcli", "connection", "modify", "wifi", "802-11-wireless-security.psk", settings.WifiPassword],
+        ["nmcli", "connection", "modify", "wifi", "802-11-wireless.ssid", settings.WifiSSID],
+        ["nmcli", "connection", "down", "wifi"],
+        ["nmcli", "connection", "up", "wifi"],
+    ]
+    for command in commands:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=NMCLI_TIMEOUT)
+        # 断开连接时可能本来就未连接，只要重新连接成功即可
+        if result.returncode != 0 and command[2] != "down":
+            raise RuntimeError(f"{' '.join(command[:4])} 失败：{result.stderr.strip() or result.returncode}")
+    log.info("WiFi 已重新连接：%s", settings.WifiSSID)
+    return f"已连接 {settings.WifiSSID}"
+
+
+def watch(store: Optional[config.ConfigStore] = None, runner: Optional[jobs.JobRunner] = None):
+    """WiFi 配置变化时提交后台任务（排队中的同类任务会被合并）；同一个存储重复调用只注册一次"""
+    store = store or config.shared()
+    runner = runner or jobs.shared()
+    with _watched_lock:
+        if id(store) in _watched:
+            return
+        _watched.add(id(store))
+
+    def update_wifi(old: config.Settings, new: config.Settings) -> jobs.Job:
+        return runner.submit(WIFI_JOB, lambda: apply_wifi(store), key=WIFI_JOB, delay=WIFI_DELAY)
+
+    store.subscribe(update_wifi, keys=WIFI_FIELDS)
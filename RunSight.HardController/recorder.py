@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+跑步会话记录
+
+把一次运动中的三轴加速度、GPS 定位和检测事件写入紧凑的二进制文件，供赛后分析和回放使用。
+
+文件格式（小端）：
+    文件头  MAGIC | uint32 头部长度 | JSON（版本、各数据流的列名和类型、事件类型、元数据）
+    数据块  CHUNK_HEADER | 压缩后的列数据
+
+每个数据块只属于一个数据流，块内按列存储（同一列的值连续存放），整体用 zlib 压缩，
+块头记录首尾时间戳，读取时按时间范围只解压相关的块。文件只追加写入，
+异常断电时最后一个不完整的块会被读取端忽略；解压前校验块的 CRC32，损坏的块跳过并记入 corrupt。
+
+写入端为每个数据流预分配两个块大小的列缓冲区轮换使用，100Hz 追加时不会为每个样本分配对象；
+监控线程只做拷贝，写满的块由写入线程压缩并写文件，关闭时的落盘和 fsync 也不持有锁，不阻塞监控线程。
+读取端用 mmap 映射文件，只扫描块头建立索引。
+"""
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import detectors
+import logs
+import storage
+
+log = logs.get("记录")
+
+MAGIC = b"RSREC\x01\n\x00"
+VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+# 块头：标记、数据流编号、压缩方式、行数、首时间、末时间、数据长度、CRC32
+CHUNK_HEADER = struct.Struct("<4sHHIddII")
+RAW = 0
+ZLIB = 1
+
+CHUNK_ROWS = 1024          # 每块行数（100Hz 下约 10 秒）
+COMPRESS_LEVEL = 1         # zlib 压缩级别，开发板上优先速度
+_FLUSH = object()          # 写入队列中的刷新标记
+
+# 数据流
+ACCEL = "accel"
+GPS = "gps"
+EVENTS = "events"
+
+# 数据流 -> [(列名, 类型)]，第一列固定为单调时间戳
+SCHEMAS = {
+    ACCEL: [("t", "<f8"), ("x", "<f4"), ("y", "<f4"), ("z", "<f4")],
+    GPS: [("t", "<f8"), ("lat", "<f8"), ("lon", "<f8"), ("speed", "<f4"), ("course", "<f4"),
+          ("altitude", "<f4"), ("hdop", "<f4")],
+    EVENTS: [("t", "<f8"), ("kind", "<i4"), ("value", "<f4")],
+}
+
+# 事件类型编码
+EVENT_KINDS = {
+    "stop": 1,
+    "fall": 2,
+    "running_start": 3,
+    "running_stop": 4,
+}
+
+
+def session_path(started: Optional[float] = None) -> str:
+    """按开始时间命名的会话文件路径"""
+    name = time.strftime("%Y%m%d-%H%M%S", time.localtime(started or time.time()))
+    return storage.data_path("sessions", name + ".rsrec")
+
+
+class _Column:
+    """预分配的块缓冲区"""
+
+    def __init__(self, stream_id: int, schema: Sequence[Tuple[str, str]], rows: int):
+        self.stream_id = stream_id
+        self.schema = schema
+        self.columns = [np.empty(rows, dtype=dtype) for _, dtype in schema]
+        self.rows = 0
+
+    def spare(self) -> "_Column":
+        """同一数据流的另一个空缓冲区"""
+        return _Column(self.stream_id, self.schema, len(self.columns[0]))
+
+
+class SessionRecorder:
+    """
+    会话写入端；write/append 在监控线程中调用，close 可在其他线程中调用
+
+    监控线程只把数据拷贝进当前缓冲区；缓冲区写满时换上一个空缓冲区，写满的交给写入线程
+    压缩、写文件后放回空闲列表。每个数据流通常只有两个缓冲区轮换，写入线程落后时才临时新增。
+    """
+
+    def __init__(self, path: str, meta: Optional[dict] = None, chunk_rows: int = CHUNK_ROWS,
+                 level: int = COMPRESS_LEVEL):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.level = level
+        self.bytes_raw = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+        self._lock = threading.Lock()
+        self._buffers = {name: _Column(i, schema, chunk_rows)
+                         for i, (name, schema) in enumerate(SCHEMAS.items())}
+        self._spares = {name: [buf.spare()] for name, buf in self._buffers.items()}
+        header = {
+            "version": VERSION,
+            "created": time.time(),
+            "streams": {name: {"id": buf.stream_id, "columns": [list(c) for c in SCHEMAS[name]]}
+                        for name, buf in self._buffers.items()},
+            "event_kinds": EVENT_KINDS,
+            "meta": meta or {},
+        }
+        data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(data)) + data)
+        self.bytes_written = self._file.tell()
+        self._closed = False
+        self._queue = queue.Queue()  # (数据流, 写满的缓冲区)、_FLUSH 或 None（结束）
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, stream: str, rows: np.ndarray):
+        """
+        追加多行数据
+
+        rows 的列顺序与 SCHEMAS[stream] 一致（加速度流可以直接传入环形缓冲区的窗口视图），
+        按列拷贝进预分配的缓冲区，满一块时交给写入线程。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            start = 0
+            total = len(rows)
+            while start < total:
+                buf = self._buffers[stream]
+                n = min(total - start, self.chunk_rows - buf.rows)
+                for i, column in enumerate(buf.columns):
+                    column[buf.rows:buf.rows + n] = rows[start:start + n, i]
+                buf.rows += n
+                start += n
+                if buf.rows == self.chunk_rows:
+                    self._submit(stream)
+
+    def append(self, stream: str, *values):
+        """追加一行数据（GPS 定位、事件等低频数据）"""
+        with self._lock:
+            if self._closed:
+                return
+            buf = self._buffers[stream]
+            for column, value in zip(buf.columns, values):
+                column[buf.rows] = value
+            buf.rows += 1
+            if buf.rows == self.chunk_rows:
+                self._submit(stream)
+
+    def event(self, t: float, kind: str, value: float = 0.0):
+        self.append(EVENTS, t, EVENT_KINDS[kind], value)
+
+    def fix(self, t: float, lat: float, lon: float, speed: float = float("nan"), course: float = float("nan"),
+            altitude: float = float("nan"), hdop: float = float("nan")):
+        self.append(GPS, t, lat, lon, speed, course, altitude, hdop)
+
+    def _submit(self, stream: str):
+        """把数据流的当前缓冲区交给写入线程，换上空缓冲区（持有锁时调用）"""
+        buf = self._buffers[stream]
+        if buf.rows == 0:
+            return
+        spares = self._spares[stream]
+        self._buffers[stream] = spares.pop() if spares else buf.spare()
+        self._queue.put((stream, buf))
+
+    def _submit_all(self):
+        """把所有未满的缓冲区交给写入线程（持有锁时调用）"""
+        for stream in self._buffers:
+            self._submit(stream)
+
+    def _encode(self, buf: _Column) -> bytes:
+        """把缓冲区编码为一个数据块（块头 + 数据）并清空缓冲区（写入线程中调用）"""
+        if buf.rows == 0:
+            return b""
+        n = buf.rows
+        raw = b"".join(column[:n].tobytes() for column in buf.columns)
+        payload = zlib.compress(raw, self.level)
+        codec = ZLIB
+        if len(payload) >= len(raw):
+            payload, codec = raw, RAW
+        t = buf.columns[0]
+        header = CHUNK_HEADER.pack(CHUNK_MAGIC, buf.stream_id, codec, n, t[0], t[n - 1],
+                                   len(payload), zlib.crc32(payload))
+        self.bytes_raw += len(raw)
+        self.bytes_written += len(header) + len(payload)
+        buf.rows = 0
+        return header + payload
+
+    def _write_loop(self):
+        """写入线程：按提交顺序压缩、写出数据块，缓冲区放回空闲列表"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                if item is _FLUSH:
+                    self._file.flush()
+                    continue
+                stream, buf = item
+                data = self._encode(buf)
+                with self._lock:
+                    self._spares[stream].append(buf)
+                self._file.write(data)
+            except OSError as e:
+                # 磁盘写满等错误：丢弃这一块，继续处理后面的数据，不影响监控
+                self.write_errors += 1
+                log.error("写入会话记录失败：%s", e)
+
+    def flush(self):
+        """写出所有未满的块（由写入线程执行，不等待）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._submit_all()
+            self._queue.put(_FLUSH)
+
+    def close(self):
+        """写出剩余数据并落盘；锁内只提交剩余数据，等待写入线程和 fsync 在锁外进行"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._submit_all()
+            self._queue.put(None)
+        self._writer.join()
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+
+class RecorderTap(detectors.Detector):
+    """挂在检测流水线上的记录器：把每批新样本写入当前会话（未记录时不做任何事）"""
+
+    name = "recorder"
+
+    def __init__(self):
+        super().__init__()
+        self.recorder = None  # type: Optional[SessionRecorder]
+
+    def process(self, batch: detectors.Batch):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(ACCEL, batch.samples[len(batch.samples) - batch.new:])
+
+
+class _Chunks:
+    """单个数据流的块索引"""
+
+    def __init__(self):
+        self.offsets = []  # type: List[int]
+        self.sizes = []  # type: List[int]
+        self.codecs = []  # type: List[int]
+        self.rows = []  # type: List[int]
+        self.t_first = []  # type: List[float]
+        self.t_last = []  # type: List[float]
+        self.crcs = []  # type: List[int]
+
+
+class SessionReader:
+    """会话读取端：mmap 映射文件，按时间范围只解压相关的块"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"不是会话记录文件：{path}")
+        header_len = struct.unpack_from("<I", self._map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self._map[start:start + header_len]).decode("utf-8"))
+        self.meta = self.header.get("meta", {})
+        self.event_kinds = {code: name for name, code in self.header["event_kinds"].items()}
+        streams = self.header["streams"]
+        self._schemas = {name: [tuple(c) for c in info["columns"]] for name, info in streams.items()}
+        ids = {info["id"]: name for name, info in streams.items()}
+        self._chunks = {name: _Chunks() for name in self._schemas}
+        self.truncated = False
+        self.corrupt = []  # type: List[Tuple[str, int]]  # 校验失败的块 (数据流, 块序号)
+        self._scan(start + header_len, ids)
+
+    def _scan(self, pos: int, ids: Dict[int, str]):
+        end = len(self._map)
+        while pos + CHUNK_HEADER.size <= end:
+            magic, stream_id, codec, rows, t_first, t_last, size, crc = CHUNK_HEADER.unpack_from(self._map, pos)
+            data = pos + CHUNK_HEADER.size
+            if magic != CHUNK_MAGIC or data + size > end or stream_id not in ids:
+                self.truncated = True
+                return
+            chunks = self._chunks[ids[stream_id]]
+            chunks.offsets.append(data)
+            chunks.sizes.append(size)
+            chunks.codecs.append(codec)
+            chunks.rows.append(rows)
+            chunks.t_first.append(t_first)
+            chunks.t_last.append(t_last)
+            chunks.crcs.append(crc)
+            pos = data + size
+        if pos != end:
+            self.truncated = True
+
+    @property
+    def streams(self) -> List[str]:
+        return list(self._schemas)
+
+    def columns(self, stream: str) -> List[str]:
+        return [name for name, _ in self._schemas[stream]]
+
+    def rows(self, stream: str) -> int:
+        return sum(self._chunks[stream].rows)
+
+    def time_range(self, stream: str) -> Optional[Tuple[float, float]]:
+        chunks = self._chunks[stream]
+        if not chunks.rows:
+            return None
+        return chunks.t_first[0], chunks.t_last[-1]
+
+    def _decode(self, stream: str, i: int) -> Optional[List[np.ndarray]]:
+        """解码一个块；CRC 不符或数据不完整时记入 corrupt 并返回 None"""
+        chunks = self._chunks[stream]
+        offset, size, rows = chunks.offsets[i], chunks.sizes[i], chunks.rows[i]
+        view = memoryview(self._map)[offset:offset + size]
+        expected = sum(np.dtype(dtype).itemsize for _, dtype in self._schemas[stream]) * rows
+        try:
+            if zlib.crc32(view) != chunks.crcs[i]:
+                raise ValueError("CRC 校验失败")
+            if chunks.codecs[i] == ZLIB:
+                view = zlib.decompress(view)
+            if len(view) != expected:
+                raise ValueError(f"数据长度 {len(view)}，应为 {expected}")
+        except (ValueError, zlib.error) as e:
+            if (stream, i) not in self.corrupt:
+                self.corrupt.append((stream, i))
+                log.warning("%s：%s 第 %d 块已损坏，跳过（%s）", self.path, stream, i, e)
+            return None
+        columns = []
+        pos = 0
+        for _, dtype in self._schemas[stream]:
+            dt = np.dtype(dtype)
+            # 未压缩的块直接引用映射内存，不拷贝
+            columns.append(np.frombuffer(view, dtype=dt, count=rows, offset=pos))
+            pos += dt.itemsize * rows
+        return columns
+
+    def read(self, stream: str, t0: Optional[float] = None, t1: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        读取时间范围 [t0, t1] 内的数据
+
+        Returns:
+            列名 -> NumPy 数组
+        """
+        chunks = self._chunks[stream]
+        t_first = np.asarray(chunks.t_first)
+        t_last = np.asarray(chunks.t_last)
+        lo = 0 if t0 is None else int(np.searchsorted(t_last, t0, side="left"))
+        hi = len(t_first) if t1 is None else int(np.searchsorted(t_first, t1, side="right"))
+        parts = [part for part in (self._decode(stream, i) for i in range(lo, hi)) if part is not None]
+        names = self.columns(stream)
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self._schemas[stream]}
+        if len(parts) == 1:
+            columns = parts[0]
+        else:
+            columns = [np.concatenate([p[k] for p in parts]) for k in range(len(names))]
+        t = columns[0]
+        start = 0 if t0 is None else int(np.searchsorted(t, t0, side="left"))
+        stop = len(t) if t1 is None else int(np.searchsorted(t, t1, side="right"))
+        return {name: column[start:stop] for name, column in zip(names, columns)}
+
+    def verify(self) -> List[Tuple[str, int]]:
+        """校验所有块，返回损坏的块 [(数据流, 块序号)]"""
+        for stream, chunks in self._chunks.items():
+            for i in range(len(chunks.rows)):
+                self._decode(stream, i)
+        return list(self.corrupt)
+
+    def events(self, t0: Optional[float] = None, t1: Optional[float] = None) -> List[Tuple[float, str, float]]:
+        """事件列表 [(t, 类型, 值)]"""
+        data = self.read(EVENTS, t0, t1)
+        return [(float(t), self.event_kinds.get(int(k), str(k)), float(v))
+                for t, k, v in zip(data["t"], data["kind"], data["value"])]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # 仍有数组引用映射内存，随其释放
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+固定频率传感器采样器
+
+采样线程按单调时钟上的截止时间表运行（而不是“处理完再 sleep”），
+把带时间戳的三轴数据写入预分配的 NumPy 环形缓冲区，并统计错过的截止时间和抖动。
+检测逻辑通过 RingBuffer.window() 以零拷贝视图读取最近的数据窗口。
+"""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+import logs
+import metrics
+
+log = logs.get("采样")
+
+# 环形缓冲区列定义
+COL_T = 0   # 单调时间戳（秒）
+COL_X = 1
+COL_Y = 2
+COL_Z = 3
+COLUMNS = 4
+
+PERIOD = metrics.histogram("sampler_period_seconds", "相邻两次采样的实际间隔", metrics.LOOP_BUCKETS)
+LATENESS = metrics.histogram("sampler_lateness_seconds", "采样相对截止时间的启动偏差", metrics.FAST_BUCKETS)
+MISSED = metrics.counter("sampler_missed_total", "错过的采样截止时间")
+ERRORS = metrics.counter("sampler_errors_total", "传感器读取失败次数")
+
+
+class RingBuffer:
+    """
+    定长环形缓冲区
+
+    内部数组长度是容量的两倍，每个样本同时写入 i 和 i + capacity 两行，
+    因此任意不超过容量的最近窗口都是一段连续内存，可以直接返回视图而无需拷贝或拼接。
+    """
+
+    def __init__(self, capacity: int, columns: int = COLUMNS, dtype=np.float64):
+        if capacity <= 0:
+            raise ValueError("容量必须大于 0")
+        self.capacity = capacity
+        self._data = np.zeros((2 * capacity, columns), dtype=dtype)
+        self._count = 0  # 累计写入的样本数，同时作为序号使用
+
+    @property
+    def count(self) -> int:
+        """累计写入的样本数"""
+        return self._count
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def append(self, t: float, x: float, y: float, z: float):
+        """写入一个样本（仅由采样线程调用）"""
+        pos = self._count % self.capacity
+        row = self._data[pos]
+        row[COL_T] = t
+        row[COL_X] = x
+        row[COL_Y] = y
+        row[COL_Z] = z
+        self._data[pos + self.capacity] = row
+        self._count += 1
+
+    def window(self, n: int, end: Optional[int] = None) -> np.ndarray:
+        """
+        返回最近 n 个样本的只读视图，形状 (n, 4)，按时间先后排列
+
+        Args:
+            n: 窗口长度，超过已有样本数时自动截短
+            end: 窗口结束处的样本序号（不含），默认为最新样本
+
+        视图直接引用内部存储，读者需在采样线程覆盖这些行（约 capacity - n 个采样周期）之前用完。
+        """
+        count = self._count if end is None else min(end, self._count)
+        n = min(n, self.capacity, count, count - (self._count - self.capacity))
+        if n <= 0:
+            return self._data[:0]
+        stop = (count - 1) % self.capacity + 1 + self.capacity
+        view = self._data[stop - n:stop]
+        view.flags.writeable = False
+        return view
+
+    def since(self, seq: int) -> np.ndarray:
+        """返回序号 seq 之后写入的所有样本（最多 capacity 个）"""
+        return self.window(self._count - seq)
+
+
+class Sampler:
+    """按截止时间表运行的采样线程"""
+
+    def __init__(self, accelerometer, rate: float = 100.0, capacity: Optional[int] = None,
+                 clock=time.monotonic):
+        self.accelerometer = accelerometer
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.buffer = RingBuffer(capacity or int(rate * 10))
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        # 统计信息
+        self.missed = 0          # 错过的截止时间数（被跳过的采样周期）
+        self.errors = 0          # 传感器读取失败次数
+        self.jitter_max = 0.0    # 最大启动偏差（秒）
+        self._jitter_sum = 0.0
+        self._jitter_n = 0
+
+    def start(self):
+        """启动采样线程"""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样线程"""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, seq: int, timeout: Optional[float] = None) -> int:
+        """阻塞直到有序号 seq 之后的新样本，返回当前序号"""
+        with self._cond:
+            if self.buffer.count == seq and self._running:
+                self._cond.wait(timeout)
+            return self.buffer.count
+
+    def stats(self) -> dict:
+        """采样统计：实际频率、错过的截止时间、抖动"""
+        jitter_avg = self._jitter_sum / self._jitter_n if self._jitter_n else 0.0
+        window = self.buffer.window(len(self.buffer))
+        actual_rate = 0.0
+        if len(window) >= 2:
+            span = window[-1, COL_T] - window[0, COL_T]
+            if span > 0:
+                actual_rate = (len(window) - 1) / span
+        return {
+            "rate": self.rate,
+            "actual_rate": actual_rate,
+            "samples": self.buffer.count,
+            "missed": self.missed,
+            "errors": self.errors,
+            "jitter_avg_ms": 1000 * jitter_avg,
+            "jitter_max_ms": 1000 * self.jitter_max,
+        }
+
+    def _run(self):
+        clock = self._clock
+        read = self.accelerometer.read
+        buffer = self.buffer
+        period = self.period
+        deadline = clock()
+        last = None
+        while self._running:
+            now = clock()
+            # 记录相对截止时间的启动偏差和实际采样间隔
+            lateness = now - deadline
+            self._jitter_sum += lateness
+            self._jitter_n += 1
+            if lateness > self.jitter_max:
+                self.jitter_max = lateness
+            LATENESS.observe(lateness)
+            if last is not None:
+                PERIOD.observe(now - last)
+            last = now
+
+            try:
+                x, y, z = read()
+            except Exception as e:
+                self.errors += 1
+                ERRORS.inc()
+                # 采样通道限速，持续故障时不会每个周期都产生一条日志
+                log.error("传感器读取失败（累计 %d 次）：%s", self.errors, e)
+            else:
+                buffer.append(now, x, y, z)
+                with self._cond:
+                    self._cond.notify_all()
+
+            # 截止时间按固定网格推进，处理耗时不会累积成频率漂移；
+            # 若已落后超过一个周期则跳过错过的截止时间，而不是连续补采
+            deadline += period
+            behind = clock() - deadline
+            if behind > period:
+                skipped = int(behind / period)
+                self.missed += skipped
+                MISSED.inc(skipped)
+                deadline += skipped * period
+            delay = deadline - clock()
+            if delay > 0:
+                time.sleep(delay)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+启动编排
+
+SafetySystem 的初始化拆成若干阶段：安全监控所需的部分（开发板、采样、检测、报警）在构造函数里
+同步完成，其余阶段（外设自检、GPS、网络、上传队列、Web、语音）交给 Startup 并发执行，
+每个阶段在它依赖的阶段完成后立即在独立线程中开始，不互相排队。较重的模块（fastapi、uvicorn、
+openai、requests 等）只在对应阶段内导入，不拖慢安全监控的启动。
+
+每个阶段的开始时间、耗时、所在线程和结果都记录在启动时间线中，全部结束后打印一次。
+"""
+import contextlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import logs
+
+log = logs.get("启动")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Stage:
+    """一个启动阶段"""
+
+    def __init__(self, name: str, func: Optional[Callable[[], None]], after: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.state = PENDING
+        self.started = None  # type: Optional[float]
+        self.finished = None  # type: Optional[float]
+        self.thread = ""
+        self.error = None  # type: Optional[str]
+
+    @property
+    def completed(self) -> bool:
+        return self.state in (DONE, FAILED, SKIPPED)
+
+
+class Startup:
+    """按依赖关系并发执行启动阶段，并记录启动时间线"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.t0 = clock()
+        self._stages = {}  # type: Dict[str, Stage]
+        self._cond = threading.Condition()
+        self._sealed = False
+        self._reported = False
+
+    def add(self, name: str, func: Callable[[], None], after: Iterable[str] = ()) -> Stage:
+        """
+        添加一个阶段；after 中的阶段全部成功后立即在新线程中执行
+
+        依赖的阶段失败或被跳过时，本阶段也被跳过。
+        """
+        stage = Stage(name, func, after)
+        with self._cond:
+            if name in self._stages:
+                raise ValueError(f"启动阶段重复：{name}")
+            self._stages[name] = stage
+            self._schedule()
+        return stage
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """在当前线程中同步执行的阶段（with 块），同样记入时间线"""
+        stage = Stage(name, None)
+        with self._cond:
+            self._stages[name] = stage
+            self._begin(stage)
+        try:
+            yield stage
+        except BaseException as e:
+            self._end(stage, e)
+            raise
+        self._end(stage)
+
+    def seal(self):
+        """不再添加阶段；全部阶段结束后打印启动时间线"""
+        with self._cond:
+            self._sealed = True
+            self._maybe_report()
+
+    def wait(self, name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        等待某个阶段（默认全部阶段）结束
+
+        Returns:
+            阶段是否成功完成（等待超时或阶段失败、跳过时为 False）
+        """
+        with self._cond:
+            if name is None:
+                self._cond.wait_for(lambda: all(s.completed for s in self._stages.values()), timeout)
+                return all(s.state == DONE for s in self._stages.values())
+            self._cond.wait_for(lambda: name in self._stages and self._stages[name].completed, timeout)
+            stage = self._stages.get(name)
+            return stage is not None and stage.state == DONE
+
+    def done(self, name: str) -> bool:
+        stage = self._stages.get(name)
+        return stage is not None and stage.state == DONE
+
+    def _schedule(self):
+        """启动所有依赖已满足的阶段（持有锁时调用）"""
+        for stage in self._stages.values():
+            if stage.state != PENDING or stage.func is None:
+                continue
+            deps = [self._stages.get(dep) for dep in stage.after]
+            if any(dep is None or not dep.completed for dep in deps):
+                continue
+            failed = [dep.name for dep in deps if dep.state != DONE]
+            if failed:
+                stage.state = SKIPPED
+                stage.started = stage.finished = self.clock()
+                stage.error = f"依赖的阶段未完成：{', '.join(failed)}"
+                continue
+            self._begin(stage)
+            threading.Thread(target=self._run, args=(stage,), name=f"boot-{stage.name}", daemon=True).start()
+
+    def _begin(self, stage: Stage):
+        stage.state = RUNNING
+        stage.started = self.clock()
+
+    def _run(self, stage: Stage):
+        stage.thread = threading.current_thread().name
+        try:
+            stage.func()
+        except Exception as e:
+            log.exception("阶段 %s 失败：%s", stage.name, e)
+            self._end(stage, e)
+            return
+        self._end(stage)
+
+    def _end(self, stage: Stage, error: Optional[BaseException] = None):
+        with self._cond:
+            stage.finished = self.clock()
+            if not stage.thread:
+                stage.thread = threading.current_thread().name
+            if error is None:
+                stage.state = DONE
+            else:
+                stage.state = FAILED
+                stage.error = str(error) or type(error).__name__
+            self._schedule()
+            self._cond.notify_all()
+            self._maybe_report()
+
+    def _maybe_report(self):
+        if self._sealed and not self._reported and all(s.completed for s in self._stages.values()):
+            self._reported = True
+            log.info("%s", self.report())
+
+    def timeline(self) -> List[dict]:
+        """各阶段相对启动时刻的开始时间和耗时（秒），按开始时间排序"""
+        with self._cond:
+            stages = list(self._stages.values())
+        rows = []
+        for s in stages:
+            start = None if s.started is None else s.started - self.t0
+            end = self.clock() if s.finished is None else s.finished
+            rows.append({
+                "stage": s.name,
+                "state": s.state,
+                "start_s": start,
+                "duration_s": None if s.started is None else end - s.started,
+                "after": list(s.after),
+                "thread": s.thread,
+                "error": s.error,
+            })
+        rows.sort(key=lambda r: float("inf") if r["start_s"] is None else r["start_s"])
+        return rows
+
+    def report(self, width: int = 30) -> str:
+        """文本形式的启动时间线（每个阶段一行，带简易甘特条）"""
+        rows = self.timeline()
+        total = max((r["start_s"] + r["duration_s"] for r in rows if r["start_s"] is not None), default=0.0)
+        scale = width / total if total > 0 else 0.0
+        lines = [f"时间线（共 {total:.2f}s）"]
+        for r in rows:
+            if r["start_s"] is None:
+                lines.append(f"  {r['stage']:<14} {r['state']}")
+                continue
+            begin = int(r["start_s"] * scale)
+            bar = " " * begin + "#" * max(1, int((r["start_s"] + r["duration_s"]) * scale) - begin)
+            status = "" if r["state"] == DONE else f"  {r['state']}：{r['error'] or ''}"
+            lines.append(f"  {r['stage']:<14} {r['start_s']:6.2f}s +{r['duration_s']:5.2f}s |{bar:<{width}}|{status}")
+        return "\n".join(lines)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+设备本地数据目录
+
+缓存、日志、校准结果等持久化数据统一放在 RUNSIGHT_DATA_DIR（默认 ~/.runsight）下。
+"""
+import os
+
+DATA_DIR = os.getenv("RUNSIGHT_DATA_DIR") or os.path.expanduser("~/.runsight")
+
+
+def data_path(*parts: str) -> str:
+    """返回数据目录下的路径，并确保其父目录存在"""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+实时遥测
+
+TelemetryHub 在自己的线程中每 FRAME_INTERVAL 秒从采样环形缓冲区读取一次新样本
+（只读，不参与采样线程的同步），按每个客户端要求的频率抽取后编码成帧，连同定期的状态帧
+（监控状态、速度、步频、重力基准等）和检测事件一起放进各客户端的队列。
+采样线程和监控循环不为遥测做任何额外工作；没有客户端时遥测线程只在等待。
+
+每个客户端的队列有长度上限，手机处理不过来时丢弃最旧的帧并计数，不会让队列无限增长。
+帧的编码按客户端选择：
+    JSON    所有帧都是 JSON 文本
+    BINARY  样本帧为二进制，状态帧和事件帧为 JSON 文本
+            二进制样本帧 = SAMPLE_HEADER（类型 1、版本、样本数、首样本序号、首样本时间）
+                          + 每个样本 4 个 float32（相对首样本的时间、x、y、z），小端
+    RAW     不编码，帧为 (类型, 数据) 元组，由调用方自行转换（如 gRPC 的 protobuf 消息）
+"""
+import asyncio
+import collections
+import json
+import struct
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import logs
+from sampler import RingBuffer
+
+log = logs.get("遥测")
+
+FRAME_INTERVAL = 0.1       # 样本帧间隔 (s)
+STATUS_INTERVAL = 0.5      # 状态帧间隔 (s)
+QUEUE_FRAMES = 64          # 每个客户端最多缓存的帧数
+FRAME_SAMPLES = 1          # 二进制样本帧类型
+JSON = "json"
+BINARY = "binary"
+RAW = "raw"
+FRAME_VERSION = 1
+SAMPLE_HEADER = struct.Struct("<BBHQd")
+
+
+class Subscriber:
+    """一个遥测客户端：有界队列（满时丢弃最旧的帧）+ 唤醒方式（asyncio 或线程）"""
+
+    def __init__(self, rate: Optional[float] = None, encoding: str = JSON, maxlen: int = QUEUE_FRAMES,
+                 loop: Optional[asyncio.AbstractEventLoop] = None, name: str = ""):
+        self.rate = rate           # 期望的样本频率 (Hz)，None 表示原始频率，0 表示不要样本
+        self.encoding = encoding
+        self.name = name
+        self.step = 1              # 抽取间隔（加入时按采样率计算）
+        self.frames = collections.deque(maxlen=maxlen)
+        self.sent = 0
+        self.dropped = 0
+        self.connected = time.time()
+        self.closed = False
+        self._loop = loop
+        self._event = asyncio.Event() if loop is not None else None
+        self._cond = threading.Condition() if loop is None else None
+
+    def push(self, frame):
+        """放入一帧（遥测线程调用）"""
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                self.closed = True  # 事件循环已关闭
+        else:
+            with self._cond:
+                self._cond.notify()
+
+    async def next(self):
+        """取出下一帧（asyncio 客户端）"""
+        while True:
+            try:
+                frame = self.frames.popleft()
+            except IndexError:
+                self._event.clear()
+                if self.frames:
+                    continue
+                await self._event.wait()
+                continue
+            self.sent += 1
+            return frame
+
+    def get(self, timeout: Optional[float] = None):
+        """取出下一帧（线程客户端），超时返回 None"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.frames or self.closed, timeout)
+            if not self.frames:
+                return None
+            self.sent += 1
+            return self.frames.popleft()
+
+    def close(self):
+        self.closed = True
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                pass
+        else:
+            with self._cond:
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "rate": self.rate,
+            "encoding": self.encoding,
+            "queued": len(self.frames),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "connected": self.connected,
+        }
+
+
+def encode_samples(samples: np.ndarray, seq: int, encoding: str):
+    """编码样本帧；samples 为 (n, 4) [t, x, y, z]"""
+    if encoding == RAW:
+        return "samples", (seq, samples)
+    t0 = float(samples[0, 0])
+    if encoding == BINARY:
+        body = np.empty((len(samples), 4), dtype="<f4")
+        body[:, 0] = samples[:, 0] - t0
+        body[:, 1:] = samples[:, 1:]
+        return SAMPLE_HEADER.pack(FRAME_SAMPLES, FRAME_VERSION, len(samples), seq, t0) + body.tobytes()
+    return json.dumps({
+        "type": "samples",
+        "seq": seq,
+        "t0": t0,
+        "t": np.round(samples[:, 0] - t0, 4).tolist(),
+        "x": np.round(samples[:, 1], 3).tolist(),
+        "y": np.round(samples[:, 2], 3).tolist(),
+        "z": np.round(samples[:, 3], 3).tolist(),
+    })
+
+
+def encode_json(kind: str, data: dict) -> str:
+    return json.dumps(dict(data, type=kind), ensure_ascii=False, default=float)
+
+
+class TelemetryHub:
+    """把样本、状态和事件广播给所有遥测客户端"""
+
+    def __init__(self, frame_interval: float = FRAME_INTERVAL, status_interval: float = STATUS_INTERVAL):
+        self.frame_interval = frame_interval
+        self.status_interval = status_interval
+        self.buffer = None  # type: Optional[RingBuffer]
+        self.rate = None  # type: Optional[float]
+        self.status = None  # type: Optional[Callable[[], dict]]
+        self.frames = 0
+        self._subscribers = []  # type: List[Subscriber]
+        self._events = collections.deque(maxlen=QUEUE_FRAMES)
+        self._cond = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._running = False
+
+    def attach(self, buffer: RingBuffer, rate: float, status: Optional[Callable[[], dict]] = None):
+        """接入采样缓冲区和状态函数（状态函数在遥测线程中调用，应只读取现成的属性）"""
+        self.buffer = buffer
+        self.rate = rate
+        self.status = status
+        for subscriber in self.subscribers:
+            subscriber.step = self._step(subscriber.rate)
+
+    @property
+    def subscribers(self) -> List[Subscriber]:
+        with self._cond:
+            return list(self._subscribers)
+
+    def _step(self, rate: Optional[float]) -> int:
+        if not rate or not self.rate:
+            return 1
+        return max(1, int(round(self.rate / rate)))
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        subscriber.step = self._step(subscriber.rate)
+        with self._cond:
+            self._subscribers.append(subscriber)
+            self._cond.notify_all()
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        with self._cond:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, event):
+        """转发检测事件（NamedTuple，在监控线程中调用，只做一次追加）"""
+        if self._subscribers:
+            self._events.append(event)
+            with self._cond:
+                self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "clients": [s.stats() for s in self.subscribers]}
+
+    def _run(self):
+        seq = None
+        last_status = 0.0
+        while True:
+            with self._cond:
+                while self._running and not self._subscribers:
+                    seq = None
+                    self._cond.wait()
+                if not self._running:
+                    return
+                self._cond.wait(self.frame_interval)
+                subscribers = list(self._subscribers)
+            buffer = self.buffer
+            if buffer is not None:
+                count = buffer.count
+                if seq is None or count - seq > buffer.capacity:
+                    seq = max(0, count - 1)
+                if count > seq:
+                    # 立即拷贝，避免采样线程覆盖
+                    self._broadcast_samples(subscribers, np.array(buffer.window(count - seq, end=count)), seq)
+                    seq = count
+            while self._events:
+                event = self._events.popleft()
+                self._broadcast(subscribers, "event", dict(event._asdict(), event=type(event).__name__))
+            now = time.monotonic()
+            if self.status is not None and now - last_status >= self.status_interval:
+                last_status = now
+                try:
+                    status = self.status()
+                except Exception as e:
+                    log.exception("读取状态失败：%s", e)
+                else:
+                    self._broadcast(subscribers, "status", status)
+
+    def _broadcast(self, subscribers: List[Subscriber], kind: str, data: dict):
+        text = None
+        for subscriber in subscribers:
+            if subscriber.encoding == RAW:
+                subscriber.push((kind, data))
+                continue
+            if text is None:
+                text = encode_json(kind, data)
+            subscriber.push(text)
+        self.frames += 1
+
+    def _broadcast_samples(self, subscribers: List[Subscriber], samples: np.ndarray, seq: int):
+        # 相同抽取间隔和编码的客户端共用一帧
+        encoded = {}
+        for subscriber in subscribers:
+            if subscriber.rate == 0:
+                continue
+            key = (subscriber.step, subscriber.encoding)
+            frame = encoded.get(key)
+            if frame is None:
+                step = subscriber.step
+                # 按全局序号抽取，跨帧保持等间隔
+                first = (-seq) % step
+                picked = samples[first::step]
+                if len(picked) == 0:
+                    continue
+                frame = encoded[key] = encode_samples(picked, seq + first, subscriber.encoding)
+                self.frames += 1
+            subscriber.push(frame)
+
+
+_shared = None  # type: Optional[TelemetryHub]
+_shared_lock = threading.Lock()
+
+
+def shared() -> TelemetryHub:
+    """进程内共享的遥测中心（控制器接入数据源，Web/gRPC 接入客户端）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TelemetryHub()
+        return _shared
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""测试从 RunSight.HardController 目录导入模块（与直接运行 main.py 时相同）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""同一批样本之前到达的多个速度观测依次更新"""
+import numpy as np
+
+import fusion
+from detectors import Batch
+
+
+def still_batch(rate: float, n: int = 1, start: float = 0.0) -> Batch:
+    """前进轴加速度为 0 的 n 个样本"""
+    samples = np.zeros((n, 4))
+    samples[:, 0] = start + np.arange(n) / rate
+    samples[:, 3] = 9.81
+    return Batch(samples, n)
+
+
+def sequential(observations, p00=4.0):
+    """从初始状态依次做标量卡尔曼更新，返回 (速度, 速度方差)"""
+    v, b, p01, p11 = 0.0, 0.0, 0.0, 1.0
+    for z, noise in observations:
+        v, b, p00, p01, p11 = fusion.SpeedFusion._update(v, b, p00, p01, p11, z, noise * noise)
+    return v, p00
+
+
+def test_cadence_and_gps_in_one_step_are_both_applied():
+    f = fusion.SpeedFusion(100.0)
+    f.observe(3.0, fusion.STRIDE_NOISE)
+    f.observe_gps(2.0)
+    f.process(still_batch(100.0))
+    assert f.updates == 2
+    expected, _ = sequential([(3.0, fusion.STRIDE_NOISE), (2.0, fusion.GPS_NOISE)])
+    # 两次顺序更新后按零加速度预测一个样本，速度不变
+    assert abs(f.speed - expected) < 1e-9
+    # 更精确的 GPS 观测权重更大，没有被步长模型覆盖，也没有覆盖步长模型
+    assert abs(f.speed - 2.0) < abs(f.speed - 3.0)
+    gps_only, _ = sequential([(2.0, fusion.GPS_NOISE)])
+    assert f.speed != gps_only
+
+
+def test_observations_are_consumed_once():
+    f = fusion.SpeedFusion(100.0)
+    f.observe_gps(2.0)
+    f.process(still_batch(100.0))
+    f.process(still_batch(100.0, start=0.01))
+    assert f.updates == 1
+
+
+def test_pending_observations_are_bounded():
+    f = fusion.SpeedFusion(100.0)
+    for i in range(fusion.MAX_PENDING + 10):
+        f.observe(float(i), fusion.STRIDE_NOISE)
+    f.process(still_batch(100.0))
+    assert f.updates == fusion.MAX_PENDING
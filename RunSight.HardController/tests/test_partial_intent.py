@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""部分识别结果命中运动指令时提前结束录音"""
+import types
+
+import asr
+import intent
+import main
+
+
+class FakeVoice:
+    def __init__(self):
+        self.end_requests = 0
+
+    def request_end(self):
+        self.end_requests += 1
+
+
+class FakeSpeech:
+    def __init__(self):
+        self.said = []
+
+    def say(self, text):
+        self.said.append(text)
+        return types.SimpleNamespace(cancel=lambda: None)
+
+
+def make_system():
+    """只带语音回调所需属性的控制器，不初始化硬件"""
+    system = main.SafetySystem.__new__(main.SafetySystem)
+    system.voice = FakeVoice()
+    system.speech = FakeSpeech()
+    system.recognizer = None
+    system._turn_command = None
+    system._partial_intent = None
+    system.commands = []
+    system._run_command = system.commands.append
+    return system
+
+
+def partial(text):
+    return asr.Hypothesis(text, False, 1.0, 0.1)
+
+
+def test_partial_end_requests_end_immediately():
+    system = make_system()
+    system._on_partial(partial("结束运动"))
+    # 在部分识别回调中同步请求结束录音，不等待静默超时
+    assert system.voice.end_requests == 1
+    # 第一次命中不执行，由下一个部分结果或整句识别确认
+    assert system.commands == []
+    assert system._turn_command is None
+
+
+def test_partial_end_runs_after_two_consecutive_hits():
+    system = make_system()
+    system._on_partial(partial("结束运动"))
+    system._on_partial(partial("结束运动。"))
+    assert system.commands == [intent.END_EXERCISE]
+    assert system._turn_command == intent.END_EXERCISE
+    assert system.speech.said == [intent.RESPONSES[intent.END_EXERCISE]]
+
+
+def test_partial_end_not_confirmed_when_next_partial_differs():
+    system = make_system()
+    system._on_partial(partial("结束运动"))
+    system._on_partial(partial("结束运动之前"))
+    system._on_partial(partial("结束运动"))
+    assert system.commands == []
+
+
+def test_partial_start_runs_immediately():
+    system = make_system()
+    system._on_partial(partial("开始跑步"))
+    assert system.voice.end_requests == 1
+    assert system.commands == [intent.START_EXERCISE]
+
+
+def test_speech_started_resets_pending_intent():
+    system = make_system()
+    system._on_partial(partial("结束运动"))
+    system._on_speech_started()
+    system._on_partial(partial("结束运动"))
+    assert system.commands == []
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""会话记录：写满的块由写入线程压缩写出，监控线程不等待"""
+import threading
+
+import numpy as np
+
+import recorder
+
+
+def accel_rows(n: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.column_stack([np.arange(n) / 100.0, rng.normal(size=(n, 3))])
+
+
+def test_roundtrip_through_writer_thread(tmp_path):
+    path = str(tmp_path / "session.rsrec")
+    rows = accel_rows(3000)
+    session = recorder.SessionRecorder(path, chunk_rows=256)
+    for i in range(0, len(rows), 7):
+        session.write(recorder.ACCEL, rows[i:i + 7])
+    session.event(1.0, "stop", 2.0)
+    session.close()
+    assert session.closed
+    with recorder.SessionReader(path) as reader:
+        data = reader.read(recorder.ACCEL)
+        assert np.array_equal(data["t"], rows[:, 0])
+        assert np.array_equal(data["x"], rows[:, 1].astype("<f4"))
+        assert len(reader.read(recorder.EVENTS)["t"]) == 1
+        assert reader.verify() == []
+
+
+def test_write_does_not_wait_for_encoding(tmp_path, monkeypatch):
+    release = threading.Event()
+    encode = recorder.SessionRecorder._encode
+
+    def blocked(self, buf):
+        release.wait(5.0)
+        return encode(self, buf)
+
+    monkeypatch.setattr(recorder.SessionRecorder, "_encode", blocked)
+    path = str(tmp_path / "session.rsrec")
+    rows = accel_rows(2000)
+    session = recorder.SessionRecorder(path, chunk_rows=256)
+    # 写入线程卡在第一块时，后续的块照常写入缓冲区
+    session.write(recorder.ACCEL, rows)
+    release.set()
+    session.close()
+    with recorder.SessionReader(path) as reader:
+        assert np.array_equal(reader.read(recorder.ACCEL)["t"], rows[:, 0])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""被服务端拒绝的上传记录按保留期限和数量清理"""
+import time
+import types
+
+import upload_queue
+
+
+class FakeHttp:
+    """总是返回给定状态码的 HTTP 客户端"""
+
+    def __init__(self, status: int):
+        self.status = status
+        self.sent = []
+
+    def post(self, endpoint, path, data=None, headers=None):
+        self.sent.append(headers[upload_queue.IDEMPOTENCY_HEADER])
+        return types.SimpleNamespace(status_code=self.status, text="bad request")
+
+
+def make_queue(tmp_path, status):
+    return upload_queue.UploadQueue(FakeHttp(status), db_path=str(tmp_path / "uploads.db"))
+
+
+def test_rejected_rows_are_purged_after_retention(tmp_path):
+    queue = make_queue(tmp_path, 400)
+    queue.enqueue({"distance": 1})
+    queue.enqueue({"distance": 2})
+    assert queue.flush() == 0
+    assert queue.stats()["failed"] == 2
+    # 保留期内不删除
+    assert queue.purge_failed() == 0
+    assert queue.purge_failed(now=time.time() + upload_queue.FAILED_RETENTION + 1) == 2
+    assert queue.stats()["failed"] == 0
+
+
+def test_rejected_rows_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_queue, "MAX_FAILED", 3)
+    queue = make_queue(tmp_path, 400)
+    for i in range(5):
+        queue.enqueue({"distance": i})
+    queue.flush()
+    assert queue.stats()["failed"] == 5
+    # 下一轮上传前清理，只保留最新的 MAX_FAILED 条
+    queue.flush()
+    assert queue.stats()["failed"] == 3
+
+
+def test_pending_rows_are_not_purged(tmp_path):
+    queue = make_queue(tmp_path, 503)
+    queue.enqueue({"distance": 1})
+    try:
+        queue.flush()
+    except RuntimeError:
+        pass
+    assert queue.purge_failed(now=time.time() + 2 * upload_queue.FAILED_RETENTION) == 0
+    assert queue.depth == 1
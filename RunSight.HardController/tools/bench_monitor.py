@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+在模拟后端上运行 SafetySystem.monitor_loop，测量急停检测延迟和 CPU 占用
+
+用法：python tools/bench_monitor.py [--duration 30] [--rate 100] [--data recording.csv] [--decel]
+
+默认注入只有 Z 轴特征的急停；--decel 同时在前进轴（Y）上叠加减速，覆盖融合减速检测。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import hal
+import main
+
+
+def run(duration: float, rate: float, data: str = None, decel: bool = False):
+    if data:
+        stream = hal.SensorStream.load(data, rate, loop=True)
+        stops = []
+    else:
+        # 预留 2 秒校准时间，之后每 5 秒注入一次急停
+        stops = [t for t in range(5, int(duration), 5)]
+        stream = hal.synthetic_stream(duration=duration + 5, rate=rate, stops=stops, seed=1,
+                                      stop_decel=-6.0 if decel else 0.0)
+    backend = hal.SimulatedBackend(stream)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = main.SafetySystem(backend=backend, start_services=False)
+    system.monitoring_enabled = True
+    motor = backend.output(hal.MOTOR)
+    edges_before = len(motor.edges)
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    thread = threading.Thread(target=system.monitor_loop, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        time.sleep(max(0.0, duration - backend.elapsed()))
+        system.stop()
+        thread.join()
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    rising = [t for t, v in motor.edges[edges_before:] if v == 1]
+    latencies = []
+    for stop in stops:
+        start = backend.t0 + stop
+        hits = [t for t in rising if t >= start]
+        if hits and hits[0] - start < 1.0:
+            latencies.append(hits[0] - start)
+
+    print(f"运行时长：{wall:.1f}s  CPU：{cpu:.2f}s（{100 * cpu / wall:.1f}%）")
+    print(f"传感器读取：{backend.accelerometer().reads} 次  报警：{len(rising)} 次")
+    stats = system.sampler.stats()
+    print(f"采样：目标 {stats['rate']:.0f}Hz 实际 {stats['actual_rate']:.1f}Hz  "
+          f"错过截止 {stats['missed']} 次  抖动 avg={stats['jitter_avg_ms']:.2f}ms max={stats['jitter_max_ms']:.2f}ms")
+    alarm = system.alarm.stats()
+    print(f"报警引擎：播放 {alarm['played']} 次  检测到首个上升沿 p50={alarm['latency_p50_ms']:.2f}ms "
+          f"max={alarm['latency_max_ms']:.2f}ms")
+    if stops:
+        print(f"急停事件：{len(stops)} 个，检出 {len(latencies)} 个")
+    if latencies:
+        latencies.sort()
+        print(f"检测延迟 ms：min={1000 * latencies[0]:.1f} "
+              f"p50={1000 * latencies[len(latencies) // 2]:.1f} max={1000 * latencies[-1]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafetySystem 监控循环基准测试")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--data", default=None, help="录制的加速度数据（CSV 或 .rsrec 会话记录）")
+    parser.add_argument("--decel", action="store_true", help="急停时同时在前进轴上叠加减速")
+    args = parser.parse_args()
+    run(args.duration, args.rate, args.data, args.decel)
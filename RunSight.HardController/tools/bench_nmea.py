@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+NMEA 解析吞吐量测试：把录制的 NMEA 日志按串口读取的块大小切开送入解析器，
+统计每秒可解析的语句数，以及 10Hz 定位下解析所占的 CPU 比例
+
+用法：python tools/bench_nmea.py [--log gps.nmea] [--chunk 64] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import gps
+
+
+def run(log: str = None, chunk: int = 64, repeat: int = 20, fix_rate: float = 10.0):
+    if log:
+        with open(log, "rb") as f:
+            data = f.read()
+    else:
+        data = b"".join(gps.synthetic_nmea(duration=60.0, rate=fix_rate))
+    # 模拟串口零散到达：固定块大小切分，语句会跨块
+    chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+
+    parser = gps.NmeaParser()
+    fixes = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for i, piece in enumerate(chunks):
+            fixes += len(parser.feed(piece, i))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    stats = parser.stats()
+    sentences = stats["sentences"]
+    epochs = fixes / repeat
+    print(f"数据：{len(data) // 1024}KB  {sentences // repeat} 条语句/遍  {epochs:.0f} 个定位/遍  块大小 {chunk}B")
+    print(f"吞吐：{sentences / wall:,.0f} 条语句/s  {stats['bytes'] / wall / 1024:,.0f}KB/s  "
+          f"每条 {1e6 * wall / max(1, sentences):.1f}us")
+    print(f"校验失败 {stats['checksum_errors']}  格式错误 {stats['malformed']}  未处理类型 {stats['ignored']}")
+    if epochs:
+        # 10Hz 定位时每秒需要处理的语句数 / 解析能力
+        per_second = sentences / repeat / (epochs / fix_rate)
+        print(f"{fix_rate:.0f}Hz 定位下解析 CPU 占用：{100 * per_second * cpu / max(1, sentences):.3f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NMEA 解析吞吐量测试")
+    parser.add_argument("--log", default=None, help="录制的 NMEA 日志，缺省时使用模拟轨迹")
+    parser.add_argument("--chunk", type=int, default=64, help="每次串口读取的字节数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=10.0, help="定位频率 (Hz)")
+    args = parser.parse_args()
+    run(args.log, args.chunk, args.repeat, args.rate)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+查看会话记录文件：各数据流的行数、时间范围、损坏的块和事件列表，可导出加速度数据为 CSV
+
+用法：python tools/session_info.py session.rsrec [--csv accel.csv] [--start 0] [--end 60]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import recorder
+
+
+def main(path: str, csv: str = None, start: float = None, end: float = None):
+    with recorder.SessionReader(path) as reader:
+        print(f"文件：{path}  {os.path.getsize(path) // 1024}KB" + ("（末尾不完整）" if reader.truncated else ""))
+        print(f"元数据：{reader.meta}")
+        corrupt = reader.verify()
+        if corrupt:
+            print(f"校验失败的块（读取时跳过）：{', '.join(f'{stream}#{i}' for stream, i in corrupt)}")
+        for stream in reader.streams:
+            span = reader.time_range(stream)
+            span = f"{span[0]:.2f}s ~ {span[1]:.2f}s" if span else "-"
+            print(f"{stream}：{reader.rows(stream)} 行  {span}  列 {', '.join(reader.columns(stream))}")
+        for t, kind, value in reader.events(start, end):
+            print(f"  事件 {t:.2f}s {kind} {value:.2f}")
+        if csv:
+            data = reader.read(recorder.ACCEL, start, end)
+            table = np.column_stack([data[name] for name in reader.columns(recorder.ACCEL)])
+            np.savetxt(csv, table, delimiter=",", fmt="%.4f", header="t,x,y,z")
+            print(f"已导出 {len(table)} 行到 {csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看会话记录")
+    parser.add_argument("path")
+    parser.add_argument("--csv", default=None, help="导出加速度数据的 CSV 路径")
+    parser.add_argument("--start", type=float, default=None)
+    parser.add_argument("--end", type=float, default=None)
+    args = parser.parse_args()
+    main(args.path, args.csv, args.start, args.end)
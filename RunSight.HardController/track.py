@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+跑步轨迹统计
+
+GPS 定位逐个进入 TrackAccumulator：按 HDOP 和相对上一个有效点的速度剔除漂移点，
+累计距离（haversine）、移动时间和滚动配速，每个定位的处理是常数时间。
+有效点存入按倍数扩容的 NumPy 数组，结束时用 Douglas–Peucker 抽稀并编码为 polyline，
+长距离跑步上传的路线只有几 KB。
+"""
+import collections
+import math
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8   # 平均地球半径 (m)
+
+MAX_SPEED = 10.0           # 超过该速度 (m/s) 的跳变视为漂移
+MAX_HDOP = 5.0             # HDOP 超过该值的定位不参与统计
+MIN_MOVING_SPEED = 0.5     # 低于该速度 (m/s) 的时间不计入移动时间
+PACE_WINDOW = 30.0         # 滚动配速的时间窗口 (s)
+ROUTE_TOLERANCE = 5.0      # 路线抽稀的允许偏差 (m)
+REANCHOR_AFTER = 5         # 连续被速度剔除的点数达到该值时，改以新位置为起点（原起点是漂移）
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """两点（或两组点）之间的大圆距离 (m)，输入为度，支持 NumPy 数组"""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def path_length(lat: np.ndarray, lon: np.ndarray) -> float:
+    """折线总长 (m)"""
+    if len(lat) < 2:
+        return 0.0
+    return float(np.sum(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])))
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas–Peucker 折线抽稀（平面坐标）
+
+    Returns:
+        保留点的布尔掩码
+    """
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(px * dy - py * dx) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def encode_polyline(lat: np.ndarray, lon: np.ndarray, precision: int = 5) -> str:
+    """Google 编码折线算法"""
+    factor = 10 ** precision
+    points = np.round(np.column_stack([lat, lon]) * factor).astype(np.int64)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    out = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> np.ndarray:
+    """encode_polyline 的逆运算，返回 (n, 2) 的 [纬度, 经度]"""
+    values = []
+    value = shift = 0
+    for ch in encoded:
+        b = ord(ch) - 63
+        value |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+
+
+class TrackAccumulator:
+    """在线累计距离、移动时间和配速"""
+
+    def __init__(self, max_speed: float = MAX_SPEED, max_hdop: float = MAX_HDOP,
+                 min_moving_speed: float = MIN_MOVING_SPEED, pace_window: float = PACE_WINDOW,
+                 capacity: int = 1024):
+        self.max_speed = max_speed
+        self.max_hdop = max_hdop
+        self.min_moving_speed = min_moving_speed
+        self.pace_window = pace_window
+        self.distance = 0.0       # 累计距离 (m)
+        self.moving_time = 0.0    # 移动时间 (s)
+        self.accepted = 0
+        self.rejected = 0
+        self._first_t = None  # type: Optional[float]
+        self._last = None         # 上一个有效点 (t, lat, lon)
+        self._jumps = 0           # 连续因速度被剔除的点数
+        self._window = collections.deque()  # 滚动配速窗口 (t, 累计距离)
+        self._points = np.empty((capacity, 3))  # 有效点 [t, lat, lon]
+
+    def add(self, fix) -> bool:
+        """加入一个定位（gps.Fix），返回是否被采纳"""
+        if not fix.valid or math.isnan(fix.lat) or math.isnan(fix.lon) or fix.hdop > self.max_hdop:
+            self.rejected += 1
+            return False
+        if self._last is not None:
+            t0, lat0, lon0 = self._last
+            dt = fix.t - t0
+            if dt <= 0:
+                self.rejected += 1
+                return False
+            step = float(haversine(lat0, lon0, fix.lat, fix.lon))
+            speed = step / dt
+            if speed > self.max_speed:
+                self.rejected += 1
+                self._jumps += 1
+                if self._jumps >= REANCHOR_AFTER:
+                    self._jumps = 0
+                    self._last = (fix.t, fix.lat, fix.lon)
+                return False
+            self._jumps = 0
+            self.distance += step
+            if speed >= self.min_moving_speed:
+                self.moving_time += dt
+        else:
+            self._first_t = fix.t
+        self._last = (fix.t, fix.lat, fix.lon)
+        self._window.append((fix.t, self.distance))
+        while fix.t - self._window[0][0] > self.pace_window:
+            self._window.popleft()
+        self._store(fix.t, fix.lat, fix.lon)
+        return True
+
+    def _store(self, t: float, lat: float, lon: float):
+        if self.accepted == len(self._points):
+            grown = np.empty((2 * len(self._points), 3))
+            grown[:self.accepted] = self._points
+            self._points = grown
+        self._points[self.accepted] = (t, lat, lon)
+        self.accepted += 1
+
+    @property
+    def points(self) -> np.ndarray:
+        """有效点 (n, 3) [t, lat, lon]"""
+        return self._points[:self.accepted]
+
+    @property
+    def elapsed(self) -> float:
+        return 0.0 if self._last is None else self._last[0] - self._first_t
+
+    @property
+    def average_pace(self) -> Optional[float]:
+        """平均配速（分钟/公里，按移动时间）"""
+        if self.distance < 1.0:
+            return None
+        return self.moving_time / 60.0 / (self.distance / 1000.0)
+
+    @property
+    def current_pace(self) -> Optional[float]:
+        """最近 pace_window 秒内的配速（分钟/公里）"""
+        if len(self._window) < 2:
+            return None
+        (t0, d0), (t1, d1) = self._window[0], self._window[-1]
+        if d1 - d0 < 1.0:
+            return None
+        return (t1 - t0) / 60.0 / ((d1 - d0) / 1000.0)
+
+    def route(self, tolerance: float = ROUTE_TOLERANCE) -> np.ndarray:
+        """抽稀后的路线 (n, 2) [lat, lon]"""
+        points = self.points
+        if len(points) == 0:
+            return np.empty((0, 2))
+        lat, lon = points[:, 1], points[:, 2]
+        # 局部等距投影到平面坐标 (m)
+        lat0 = math.radians(float(lat.mean()))
+        y = np.radians(lat) * EARTH_RADIUS
+        x = np.radians(lon) * EARTH_RADIUS * math.cos(lat0)
+        keep = douglas_peucker(x, y, tolerance)
+        return np.column_stack([lat[keep], lon[keep]])
+
+    def polyline(self, tolerance: float = ROUTE_TOLERANCE) -> str:
+        route = self.route(tolerance)
+        return encode_polyline(route[:, 0], route[:, 1]) if len(route) else ""
+
+    def summary(self) -> dict:
+        return {
+            "distance_m": self.distance,
+            "moving_time_s": self.moving_time,
+            "elapsed_s": self.elapsed,
+            "average_pace": self.average_pace,
+            "current_pace": self.current_pace,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+流式语音合成与播放
+
+大模型回复以 token 流的形式进入 SpeechTurn，在句子边界切分后逐句送往 TTS 服务
+（streaming_mode 开启），返回的音频块直接写入持续打开的 PCM 输出流，前后句之间无缝衔接。
+大模型生成、语音合成和播放三者重叠进行，首句合成完成即可开始出声。
+
+回复可以随时取消（用户打断）：SpeechTurn.cancel 丢弃未合成的句子、关闭进行中的 TTS 响应，
+播放线程按小块写入设备，块之间发现所属回复已取消就丢弃其余音频并清空设备缓冲区。
+"""
+import queue
+import struct
+import threading
+import time
+import weakref
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+import hal
+import http_client
+import logs
+import metrics
+
+log = logs.get("语音")
+
+# 音色与合成参数（不含文本）
+TTS_PARAMS = {
+    "text_lang": "zh",  # 文本语言
+    "ref_audio_path": "【普通】为曾经拥有过某种幸福而开心，为未来依旧会出现奇迹而期待。.wav",  # 参考音频路径
+    "prompt_lang": "zh",  # 提示文本语言
+    "prompt_text": "为曾经拥有过某种幸福而开心，为未来依旧会出现奇迹而期待。",
+    "top_k": 5,
+    "top_p": 1.0,
+    "temperature": 1.0,
+    "batch_size": 1,
+    "media_type": "wav",  # 返回的音频格式
+    "text_split_method": "cut3",
+}
+
+# 句子结束标点
+SENTENCE_ENDINGS = "。！？!?；;\n"
+MIN_SENTENCE_CHARS = 4   # 过短的片段并入下一句，避免一两个字单独请求 TTS
+PLAY_BLOCK = 0.05        # 每次写入设备的时长 (s)，决定被打断后多快静音
+
+# 语音回合各阶段耗时（其余阶段在 main.on_speech_captured 中记录）
+PHASE_HELP = "语音回合各阶段耗时"
+TTS_TIME = metrics.histogram("voice_phase_seconds", PHASE_HELP, metrics.SLOW_BUCKETS, phase="tts")
+CACHE_HITS = metrics.counter("tts_cache_hits_total", "直接使用缓存音频的句子数")
+
+
+class SentenceSplitter:
+    """把 token 流按句子边界切分"""
+
+    def __init__(self, endings: str = SENTENCE_ENDINGS, min_chars: int = MIN_SENTENCE_CHARS):
+        self.endings = endings
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> Iterator[str]:
+        """送入一段文本，产出其中已完整的句子"""
+        self._buffer += text
+        start = 0
+        for i, ch in enumerate(self._buffer):
+            if ch in self.endings and len(self._buffer[start:i + 1].strip()) >= self.min_chars:
+                sentence = self._buffer[start:i + 1].strip()
+                start = i + 1
+                yield sentence
+        self._buffer = self._buffer[start:]
+
+    def flush(self) -> Iterator[str]:
+        """产出剩余的文本"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        if rest:
+            yield rest
+
+
+class WavStreamDecoder:
+    """增量解析流式 WAV：先解析文件头取得采样率，其后的数据按 int16 PCM 输出"""
+
+    def __init__(self):
+        self._header = b""
+        self._leftover = b""
+        self._ready = False      # 文件头已解析完毕
+        self.sample_rate = None  # type: Optional[int]
+        self.channels = 1
+
+    def feed(self, data: bytes) -> Optional[np.ndarray]:
+        if not self._ready:
+            self._header += data
+            offset = self._parse_header()
+            if offset is None:
+                return None
+            self._ready = True
+            data = self._header[offset:]
+            self._header = b""
+        data = self._leftover + data
+        usable = len(data) - len(data) % (2 * self.channels)
+        self._leftover = data[usable:]
+        if usable == 0:
+            return None
+        return np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self.channels)
+
+    def _parse_header(self) -> Optional[int]:
+        """返回 data 块起始偏移；文件头不完整时返回 None"""
+        header = self._header
+        if len(header) < 12:
+            return None
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError("TTS 返回的不是 WAV 数据")
+        pos = 12
+        while pos + 8 <= len(header):
+            chunk_id = header[pos:pos + 4]
+            size = struct.unpack("<I", header[pos + 4:pos + 8])[0]
+            if chunk_id == b"fmt ":
+                if pos + 24 > len(header):
+                    return None
+                self.channels, self.sample_rate = struct.unpack("<HI", header[pos + 10:pos + 16])
+            elif chunk_id == b"data":
+                return pos + 8 if self.sample_rate else None
+            pos += 8 + size
+        return None
+
+
+class TtsClient:
+    """TTS 服务客户端"""
+
+    def __init__(self, params: Optional[dict] = None, http: Optional[http_client.HttpClient] = None,
+                 endpoint: str = http_client.TTS):
+        self.params = dict(TTS_PARAMS if params is None else params)
+        self.http = http or http_client.shared()
+        self.endpoint = endpoint
+
+    def synthesize_stream(self, text: str, chunk_size: int = 4096, on_response: Optional[Callable] = None) -> Iterator[tuple]:
+        """流式合成，逐块产出 (sample_rate, int16 PCM)；on_response 收到响应对象，可用于从其他线程关闭"""
+        data = dict(self.params, text=text, streaming_mode=True)
+        decoder = WavStreamDecoder()
+        with self.http.post(self.endpoint, json=data, stream=True) as response:
+            if on_response is not None:
+                on_response(response)
+            if response.status_code != 200:
+                raise RuntimeError(f"请求失败：{response.status_code} {response.text[:200]}")
+            for chunk in response.iter_content(chunk_size):
+                pcm = decoder.feed(chunk)
+                if pcm is not None:
+                    yield decoder.sample_rate, pcm
+
+
+class PcmPlayer:
+    """播放线程：保持输出流打开，按顺序无缝写入各句音频"""
+
+    def __init__(self, backend: "hal.Backend", reference=None):
+        self.backend = backend
+        self.reference = reference  # 回声参考（echo.EchoGate），记录写入设备的每块音频
+        self._queue = queue.Queue()
+        self._output = None
+        self._format = None
+        self._thread = threading.Thread(target=self._run, name="pcm-player", daemon=True)
+        self._thread.start()
+
+    def play(self, sample_rate: int, pcm: np.ndarray, on_start=None, cancelled: Optional[threading.Event] = None):
+        """
+        排队一段音频
+
+        Args:
+            on_start: 这段音频开始写入设备时调用
+            cancelled: 所属回复的取消标志，置位后尚未写入的部分直接丢弃
+        """
+        self._queue.put((sample_rate, pcm, on_start, cancelled))
+
+    def mark(self) -> threading.Event:
+        """排队一个标记，之前的音频播放完毕时置位"""
+        event = threading.Event()
+        self._queue.put(event)
+        return event
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            sample_rate, pcm, on_start, cancelled = item
+            if cancelled is not None and cancelled.is_set():
+                continue
+            fmt = (sample_rate, pcm.shape[1] if pcm.ndim > 1 else 1)
+            try:
+                if self._format != fmt:
+                    if self._output is not None:
+                        self._output.close()
+                    self._output = self.backend.pcm_output(*fmt)
+                    self._format = fmt
+                if on_start is not None:
+                    on_start()
+                self._write(pcm, max(1, int(sample_rate * PLAY_BLOCK)), cancelled)
+            except Exception as e:
+                log.error("音频输出失败：%s", e)
+                self._output = None
+                self._format = None
+
+    def _write(self, pcm: np.ndarray, block: int, cancelled: Optional[threading.Event]):
+        """分块写入，块之间检查取消"""
+        for start in range(0, len(pcm), block):
+            if cancelled is not None and cancelled.is_set():
+                self._output.discard()
+                return
+            chunk = pcm[start:start + block]
+            if self.reference is not None:
+                self.reference.played(chunk)
+            self._output.write(chunk)
+
+
+class SpeechTurn:
+    """一次回复：接收大模型 token，逐句合成并排队播放"""
+
+    def __init__(self, tts: TtsClient, player: PcmPlayer, cache=None):
+        self.tts = tts
+        self.player = player
+        self.cache = cache
+        self.started = time.monotonic()
+        self.first_audio = None  # type: Optional[float]
+        self.text = ""
+        self._splitter = SentenceSplitter()
+        self._sentences = queue.Queue()
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._response = None      # 正在读取的 TTS 响应
+        self._thread = threading.Thread(target=self._run, name="tts-turn", daemon=True)
+        self._thread.start()
+
+    def feed(self, text: str):
+        """送入大模型输出的一段文本"""
+        if self._cancelled.is_set():
+            return
+        self.text += text
+        for sentence in self._splitter.feed(text):
+            self._sentences.put(sentence)
+
+    def close(self):
+        """大模型输出结束"""
+        for sentence in self._splitter.flush():
+            self._sentences.put(sentence)
+        self._sentences.put(None)
+
+    def cancel(self):
+        """停止本次回复：丢弃未合成的句子，关闭进行中的合成请求，未播放的音频不再写入设备"""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+        while True:
+            try:
+                self._sentences.get_nowait()
+            except queue.Empty:
+                break
+        self._sentences.put(None)
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception as e:
+                log.debug("关闭合成请求失败：%s", e)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待全部句子播放完毕（或回复被取消）"""
+        return self._done.wait(timeout)
+
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        return None if self.first_audio is None else self.first_audio - self.started
+
+    def _on_first_audio(self):
+        if self.first_audio is None:
+            self.first_audio = time.monotonic()
+            log.info("首段音频延迟：%.2fs", self.time_to_first_audio)
+
+    def _set_response(self, response):
+        self._response = response
+
+    def _run(self):
+        # 逐句合成保证播放顺序；每句的音频块边到边排队，下一句的合成与本句播放重叠
+        cancelled = self._cancelled
+        while True:
+            sentence = self._sentences.get()
+            if sentence is None or cancelled.is_set():
+                break
+            cached = self.cache.get(sentence) if self.cache is not None else None
+            if cached is not None:
+                CACHE_HITS.inc()
+                self.player.play(cached[0], cached[1], self._on_first_audio, cancelled)
+                continue
+            try:
+                chunks = []
+                requested = time.perf_counter()
+                for sample_rate, pcm in self.tts.synthesize_stream(sentence, on_response=self._set_response):
+                    if cancelled.is_set():
+                        break
+                    if not chunks:
+                        # 单句合成延迟：请求到首个音频块
+                        TTS_TIME.observe(time.perf_counter() - requested)
+                    self.player.play(sample_rate, pcm, self._on_first_audio, cancelled)
+                    chunks.append(pcm)
+                else:
+                    if self.cache is not None and chunks:
+                        self.cache.put(sentence, sample_rate, np.concatenate(chunks))
+            except Exception as e:
+                if not cancelled.is_set():
+                    log.warning("合成失败：%s %s", sentence, e)
+            finally:
+                self._response = None
+        if not cancelled.is_set():
+            self.player.mark().wait()
+        self._done.set()
+
+
+class SpeechPipeline:
+    """语音输出入口"""
+
+    def __init__(self, backend: "hal.Backend", tts: Optional[TtsClient] = None, cache=None, reference=None):
+        self.tts = tts or TtsClient()
+        self.player = PcmPlayer(backend, reference)
+        self.cache = cache
+        self._turns = weakref.WeakSet()  # 尚未结束的回复
+
+    def start_turn(self) -> SpeechTurn:
+        turn = SpeechTurn(self.tts, self.player, self.cache)
+        self._turns.add(turn)
+        return turn
+
+    @property
+    def busy(self) -> bool:
+        """是否有回复还在合成或播放"""
+        return any(not turn.done for turn in list(self._turns))
+
+    def cancel(self) -> int:
+        """停止所有正在进行的回复（用户打断），返回停止的数量"""
+        turns = [turn for turn in list(self._turns) if not turn.done and not turn.cancelled]
+        for turn in turns:
+            turn.cancel()
+        return len(turns)
+
+    def say(self, text: str) -> SpeechTurn:
+        """合成并播放一段完整文本"""
+        turn = self.start_turn()
+        turn.feed(text)
+        turn.close()
+        return turn
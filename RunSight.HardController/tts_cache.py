@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+语音合成结果的磁盘缓存
+
+以“文本 + 音色参数”为键把合成好的音频存成 WAV 文件，按最近使用时间做 LRU 淘汰，
+总大小不超过上限。固定提示语（指令确认、安全提醒、鼓励语）可在启动后或空闲时预先合成，
+命中缓存的句子立即播放，TTS 服务不可达时也能正常播报。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import wave
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+import alarm
+import audio_codec
+import intent
+import logs
+import storage
+
+log = logs.get("缓存")
+
+CACHE_DIR = os.path.join(storage.DATA_DIR, "tts_cache")
+MAX_CACHE_BYTES = int(os.getenv("RUNSIGHT_TTS_CACHE_MB", "64")) * 1024 * 1024
+
+# 默认预合成的固定提示语；RUNSIGHT_TTS_PHRASES 可指定额外的短语文件（每行一句）
+DEFAULT_PHRASES = list(intent.RESPONSES.values()) + list(alarm.SPOKEN_ALERTS.values()) + [
+    "你做得很棒，继续保持！",
+    "慢慢来，我们一起加油。",
+    "我会陪你一起完成接下来的路程。",
+]
+
+
+def load_phrases(path: Optional[str] = None) -> list:
+    """默认提示语加上短语文件中的内容"""
+    phrases = list(DEFAULT_PHRASES)
+    path = path or os.getenv("RUNSIGHT_TTS_PHRASES")
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            phrases += [line.strip() for line in f if line.strip()]
+    return phrases
+
+
+class TtsCache:
+    """按 LRU 淘汰的合成音频缓存"""
+
+    def __init__(self, params: dict, directory: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.params = params
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 键 -> (最近使用时间, 文件大小)，启动时从文件修改时间恢复
+        self._index = {}  # type: Dict[str, Tuple[float, int]]
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".wav"):
+                st = os.stat(os.path.join(directory, name))
+                self._index[name[:-4]] = (st.st_mtime, st.st_size)
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size in self._index.values())
+
+    def key(self, text: str) -> str:
+        material = json.dumps(dict(self.params, text=text), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".wav")
+
+    def __contains__(self, text: str) -> bool:
+        return self.key(text) in self._index
+
+    def get(self, text: str) -> Optional[Tuple[int, np.ndarray]]:
+        """命中时返回 (sample_rate, int16 PCM)，并刷新其最近使用时间"""
+        key = self.key(text)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            self._index[key] = (now, entry[1])
+        path = self._path(key)
+        try:
+            with wave.open(path, "rb") as w:
+                sample_rate = w.getframerate()
+                channels = w.getnchannels()
+                pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16).reshape(-1, channels)
+            os.utime(path, (now, now))
+        except (OSError, EOFError, wave.Error) as e:
+            log.warning("读取失败，丢弃：%s", e)
+            self._discard(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return sample_rate, pcm
+
+    def put(self, text: str, sample_rate: int, pcm: np.ndarray):
+        """写入缓存（先写临时文件再改名，断电不会留下半个文件）"""
+        key = self.key(text)
+        channels = pcm.shape[1] if pcm.ndim > 1 else 1
+        data = audio_codec.encode_wav(pcm, sample_rate, channels)
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._index[key] = (time.time(), len(data))
+        self._evict()
+
+    def _discard(self, key: str):
+        with self._lock:
+            self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """超过容量时按最近使用时间从旧到新删除"""
+        with self._lock:
+            total = sum(size for _, size in self._index.values())
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for key, (used, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes:
+                    break
+                victims.append(key)
+                total -= size
+        for key in victims:
+            self._discard(key)
+
+    def prerender(self, tts_client, phrases: Iterable[str]) -> int:
+        """预合成尚未缓存的短语，返回新合成的数量；TTS 不可达时跳过"""
+        rendered = 0
+        for text in phrases:
+            if text in self:
+                continue
+            try:
+                chunks = []
+                sample_rate = None
+                for sample_rate, pcm in tts_client.synthesize_stream(text):
+                    chunks.append(pcm)
+                if chunks:
+                    self.put(text, sample_rate, np.concatenate(chunks))
+                    rendered += 1
+            except Exception as e:
+                log.warning("预合成失败：%s %s", text, e)
+                break
+        return rendered
+
+    def start_prerender(self, tts_client, phrases: Optional[Iterable[str]] = None) -> threading.Thread:
+        """在后台线程中预合成固定提示语"""
+        phrases = list(load_phrases() if phrases is None else phrases)
+
+        def run():
+            count = self.prerender(tts_client, phrases)
+            log.info("预合成完成：新增 %d 条，共 %d 条 %dKB", count, len(self._index), self.size // 1024)
+
+        thread = threading.Thread(target=run, name="tts-prerender", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+可取消的语音回合
+
+每段录音交给一个 Turn 处理（识别、大模型、合成、播放），由 TurnManager 在独立线程中执行并跟踪。
+用户在回复过程中再次开口（打断）时取消当前回合：回合登记的取消回调立即关闭进行中的 HTTP 流、
+停止合成与播放，回合函数在各阶段之间调用 check() 退出。新回合不等待旧回合收尾，立即开始；
+旧回合线程阻塞在无法中断的调用（如一次转写请求）上时，返回后直接丢弃结果。
+"""
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional
+
+import logs
+import metrics
+
+log = logs.get("语音")
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+TURNS = {state: metrics.counter("voice_turns_total", "语音回合数（按结果）", outcome=state)
+         for state in (SUCCEEDED, CANCELLED, FAILED)}
+BARGE_INS = metrics.counter("voice_barge_in_total", "用户开口打断正在进行的回合的次数")
+
+
+class TurnCancelled(Exception):
+    """回合已被取消"""
+
+
+class Turn:
+    """一个可取消的语音回合"""
+
+    def __init__(self, turn_id: int, func: Callable, args: tuple):
+        self.id = turn_id
+        self.func = func
+        self.args = args
+        self.state = RUNNING
+        self.reason = None  # type: Optional[str]
+        self.started = time.monotonic()
+        self.finished = None  # type: Optional[float]
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []  # type: List[Callable[[], None]]
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def check(self):
+        """已取消时抛出 TurnCancelled（回合函数在阶段之间调用）"""
+        if self._cancelled.is_set():
+            raise TurnCancelled(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """登记取消时执行的清理（关闭 HTTP 流、停止播放等）；已取消时立即执行"""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """取消回合并执行登记的清理，立即返回；回合已结束或已取消时返回 False"""
+        with self._lock:
+            if self._cancelled.is_set() or self._done.is_set():
+                return False
+            self.reason = reason
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in reversed(callbacks):
+            self._call(callback)
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待回合线程结束"""
+        return self._done.wait(timeout)
+
+    def _call(self, callback: Callable[[], None]):
+        try:
+            callback()
+        except Exception as e:
+            log.warning("回合 %d 取消清理失败：%s", self.id, e)
+
+    def run(self):
+        try:
+            self.func(self, *self.args)
+            state = CANCELLED if self.cancelled else SUCCEEDED
+        except TurnCancelled:
+            state = CANCELLED
+        except Exception as e:
+            if self.cancelled:
+                # 取消时关闭连接会让进行中的请求抛出异常，属于正常退出
+                state = CANCELLED
+            else:
+                log.exception("回合 %d 失败：%s", self.id, e)
+                state = FAILED
+        with self._lock:
+            self.state = state
+            self.finished = time.monotonic()
+            self._callbacks = []
+            self._done.set()
+        TURNS[state].inc()
+        if state == CANCELLED:
+            log.info("回合 %d 已取消（%s，%.2fs）", self.id, self.reason, self.finished - self.started)
+
+
+class TurnManager:
+    """同一时间只有一个活动回合：开始新回合或用户打断时取消当前回合"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current = None  # type: Optional[Turn]
+        self._unwinding = []  # type: List[Turn]
+        self.barge_ins = 0
+
+    @property
+    def current(self) -> Optional[Turn]:
+        """正在进行的回合（没有时为 None）"""
+        turn = self._current
+        return turn if turn is not None and not turn.done else None
+
+    def start(self, func: Callable, *args) -> Turn:
+        """取消当前回合，在新线程中执行 func(turn, *args)，立即返回"""
+        with self._lock:
+            previous = self._current
+            turn = Turn(next(self._ids), func, args)
+            self._current = turn
+            self._unwinding = [t for t in self._unwinding if not t.done]
+        if previous is not None and previous.cancel("superseded"):
+            with self._lock:
+                self._unwinding.append(previous)
+        threading.Thread(target=turn.run, name=f"voice-turn-{turn.id}", daemon=True).start()
+        return turn
+
+    def cancel(self, reason: str = "cancelled") -> Optional[Turn]:
+        """取消当前回合，返回被取消的回合"""
+        with self._lock:
+            turn = self._current
+        if turn is None or not turn.cancel(reason):
+            return None
+        with self._lock:
+            self._unwinding.append(turn)
+        return turn
+
+    def barge_in(self) -> Optional[Turn]:
+        """用户开口打断：取消当前回合"""
+        turn = self.cancel("barge-in")
+        if turn is not None:
+            self.barge_ins += 1
+            BARGE_INS.inc()
+            log.info("打断回合 %d", turn.id)
+        return turn
+
+    def stop(self, timeout: float = 1.0):
+        """取消当前回合并等待各回合线程退出"""
+        self.cancel("shutdown")
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            turns = [t for t in self._unwinding + [self._current] if t is not None]
+        for turn in turns:
+            turn.wait(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            current = self._current
+            unwinding = sum(1 for t in self._unwinding if not t.done)
+        return {
+            "current": current.id if current is not None and not current.done else None,
+            "unwinding": unwinding,
+            "barge_ins": self.barge_ins,
+        }
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+离线上传队列
+
+结束运动时跑步记录先写入设备上的 SQLite 日志（WAL 模式，追加写入），立即返回，
+不等待网络。后台线程在后端可达时每轮取出一批记录，成功的记录在同一事务中删除；
+后端不可达时按带抖动的指数退避等待，新记录入队时会立即唤醒重试。
+越野跑等长时间断网的场景下记录不会丢失，重启后继续上传。
+
+后端的 /RunningData 每次只接收一条跑步记录（没有批量接口），所以一批记录在同一个
+keep-alive 连接上逐条 POST。连接中断后的重试可能让服务端收到同一条记录两次，
+每条记录带固定的 Idempotency-Key（记录编号 + 入队时间），服务端据此去重。
+被服务端拒绝（4xx）的记录不再重试，只保留 FAILED_RETENTION 内、最多 MAX_FAILED 条供排查，
+每轮上传前清理，长期运行时日志不会无限增长。队列深度、上传数量和耗时导出到 /metrics。
+"""
+import collections
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import http_client
+import logs
+import metrics
+import storage
+
+log = logs.get("上传")
+
+DB_NAME = "uploads.db"
+BATCH_SIZE = 20          # 每轮最多上传的记录数
+RETRY_MIN = 2.0          # 首次失败后的等待时间 (s)
+RETRY_MAX = 300.0        # 退避等待上限 (s)
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+FAILED_RETENTION = 7 * 24 * 3600.0   # 被拒绝的记录（按入队时间）保留时长 (s)
+MAX_FAILED = 100                      # 最多保留的被拒绝记录数（保留最新的）
+
+UPLOADED = metrics.counter("upload_records_total", "上传成功的记录数")
+REJECTED = metrics.counter("upload_rejected_total", "被服务端拒绝、不再重试的记录数")
+ERRORS = metrics.counter("upload_errors_total", "上传失败、等待重试的次数")
+PURGED = metrics.counter("upload_purged_total", "超过保留期限或数量而删除的被拒绝记录数")
+RECORD_TIME = metrics.histogram("upload_record_seconds", "单条记录的上传耗时", metrics.SLOW_BUCKETS)
+FLUSH_TIME = metrics.histogram("upload_flush_seconds", "一轮上传的耗时", metrics.SLOW_BUCKETS)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+
+def idempotency_key(row_id: int, created: float) -> str:
+    """记录的幂等键：同一条记录每次重试都相同，数据库重建后编号重复也能靠入队时间区分"""
+    return "%d-%d" % (row_id, int(created * 1000))
+
+
+class UploadError(Exception):
+    """服务端拒绝了记录（4xx），重试也不会成功"""
+
+
+class UploadQueue:
+    """持久化的上传队列，后台批量上传到跑步数据后端"""
+
+    def __init__(self, http: Optional[http_client.HttpClient] = None, db_path: Optional[str] = None,
+                 endpoint: str = http_client.BACKEND, batch_size: int = BATCH_SIZE):
+        self.http = http or http_client.shared()
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(db_path or storage.data_path(DB_NAME),
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")  # 记录提交后即使断电也不丢失
+        self._db.execute(_SCHEMA)
+        self._lock = threading.Lock()          # 保护数据库连接
+        self._wake = threading.Condition()
+        self._pending = False
+        self._running = False
+        self._thread = None  # type: Optional[threading.Thread]
+        self._delay = 0.0
+        self.uploaded = 0
+        self.last_error = None  # type: Optional[str]
+        self.last_flush = None  # type: Optional[float]
+        self._throughput = collections.deque(maxlen=32)  # 各轮 (记录数, 耗时)
+        metrics.gauge("upload_queue_depth", "待上传的记录数", lambda: self.depth)
+        metrics.gauge("upload_retry_delay_seconds", "当前的退避等待时间", lambda: self._delay)
+
+    def enqueue(self, payload: dict, path: str = "/RunningData") -> int:
+        """追加一条记录并唤醒上传线程，返回记录编号"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO uploads (created, path, payload) VALUES (?, ?, ?)",
+                (time.time(), path, json.dumps(payload, ensure_ascii=False)))
+            row_id = cursor.lastrowid
+        with self._wake:
+            self._pending = True
+            self._delay = 0.0
+            self._wake.notify()
+        return row_id
+
+    @property
+    def depth(self) -> int:
+        """待上传的记录数"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM uploads WHERE failed = 0").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth, failed = self._db.execute(
+                "SELECT COALESCE(SUM(failed = 0), 0), COALESCE(SUM(failed), 0) FROM uploads").fetchone()
+        sent = sum(n for n, _ in self._throughput)
+        elapsed = sum(t for _, t in self._throughput)
+        return {
+            "depth": depth,
+            "failed": failed,
+            "uploaded": self.uploaded,
+            "records_per_s": sent / elapsed if elapsed > 0 else None,
+            "retry_in_s": self._delay,
+            "last_flush": self.last_flush,
+            "last_error": self.last_error,
+        }
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._pending = True
+        self._thread = threading.Thread(target=self._run, name="upload-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._wake:
+            self._running = False
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def purge_failed(self, now: Optional[float] = None) -> int:
+        """删除入队超过 FAILED_RETENTION 或超出 MAX_FAILED 条的被拒绝记录，返回删除数量"""
+        cutoff = (time.time() if now is None else now) - FAILED_RETENTION
+        with self._lock:
+            self._db.execute("BEGIN")
+            purged = self._db.execute("DELETE FROM uploads WHERE failed = 1 AND created < ?", (cutoff,)).rowcount
+            purged += self._db.execute(
+                "DELETE FROM uploads WHERE failed = 1 AND id NOT IN "
+                "(SELECT id FROM uploads WHERE failed = 1 ORDER BY id DESC LIMIT ?)", (MAX_FAILED,)).rowcount
+            self._db.execute("COMMIT")
+        if purged:
+            PURGED.inc(purged)
+            log.info("清理被拒绝的记录 %d 条", purged)
+        return purged
+
+    def flush(self) -> int:
+        """上传一批记录，返回成功数量；网络错误时抛出异常，已成功的部分已删除"""
+        self.purge_failed()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, created, path, payload FROM uploads WHERE failed = 0 ORDER BY id LIMIT ?",
+                (self.batch_size,)).fetchall()
+        done = []
+        started = time.monotonic()
+        try:
+            for row_id, created, path, payload in rows:
+                try:
+                    with RECORD_TIME.time():
+                        self._send(path, payload, idempotency_key(row_id, created))
+                except UploadError as e:
+                    log.warning("记录 %s 被拒绝，不再重试：%s", row_id, e)
+                    REJECTED.inc()
+                    self._mark(row_id, str(e), failed=True)
+                    continue
+                except Exception as e:
+                    ERRORS.inc()
+                    self._mark(row_id, str(e))
+                    raise
+                done.append(row_id)
+        finally:
+            if done:
+                with self._lock:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("DELETE FROM uploads WHERE id = ?", [(i,) for i in done])
+                    self._db.execute("COMMIT")
+                self.uploaded += len(done)
+                UPLOADED.inc(len(done))
+                self._throughput.append((len(done), time.monotonic() - started))
+                self.last_flush = time.time()
+            if rows:
+                FLUSH_TIME.observe(time.monotonic() - started)
+        return len(done)
+
+    def _send(self, path: str, payload: str, key: str):
+        response = self.http.post(self.endpoint, path, data=payload.encode("utf-8"),
+                                  headers={"Content-Type": "application/json", IDEMPOTENCY_HEADER: key})
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise UploadError(f"{response.status_code} {response.text[:200]}")
+        if response.status_code >= 300:
+            raise RuntimeError(f"请求失败：{response.status_code}")
+
+    def _mark(self, row_id: int, error: str, failed: bool = False):
+        self.last_error = error
+        with self._lock:
+            self._db.execute("UPDATE uploads SET attempts = attempts + 1, last_error = ?, failed = ? WHERE id = ?",
+                             (error, int(failed), row_id))
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._running and not self._pending:
+                    self._wake.wait()
+                if not self._running:
+                    return
+                self._pending = False
+            try:
+                sent = self.flush()
+            except Exception as e:
+                # 后端不可达：退避后重试，新记录入队时提前唤醒
+                self._delay = min(RETRY_MAX, max(RETRY_MIN, self._delay * 2))
+                delay = random.uniform(self._delay / 2, self._delay)
+                log.warning("上传失败，%.0fs 后重试（待上传 %d 条）：%s", delay, self.depth, e)
+                with self._wake:
+                    if not self._pending:
+                        self._wake.wait(delay)
+                    self._pending = True
+                continue
+            self._delay = 0.0
+            depth = self.depth
+            if sent:
+                log.info("已上传 %d 条，待上传 %d 条", sent, depth)
+            if depth:
+                self._pending = True
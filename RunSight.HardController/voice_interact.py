@@ -1,62 +1,86 @@
 import numpy as np
 import sounddevice as sd
 import webrtcvad
-from scipy.io.wavfile import write
-import collections, sys, time, uuid
-import threading
+import collections, time
+import audio_codec
+import logs
+import metrics
 
 # 常量配置
 SAMPLE_RATE = 16000              # 支持的采样率：8000, 16000, 32000, 48000
 FRAME_DURATION_MS = 30           # 帧长（ms），只能是 10, 20, 30
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)  # 样本数
 BYTES_PER_FRAME = FRAME_SIZE * 2  # 16 位 PCM，每个样本 2 字节
+MAX_FRAMES = 1000                # 单次录音最大帧数（30 秒）
+MIN_FRAMES = 50                  # 不超过该帧数的录音视为咳嗽、风噪等，忽略
+BARGE_IN_FRAMES = 15             # 近端人声累计达到该帧数（约 0.45 秒）才确认是在说话，可以打断回复
 
 vad = webrtcvad.Vad(3)  # 攻击性模式 0~3，值越大越严格
 
+# 音频回调里只创建日志记录，格式化和输出由日志线程完成
+log = logs.get("音频")
+CALLBACK_TIME = metrics.histogram("vad_callback_seconds", "音频回调（VAD 与录音）的耗时", metrics.FAST_BUCKETS)
+
 # 全局变量
-input_paused = False
-pause_lock = threading.Lock()
-
-def speech_captured(filename): ...
-
-def write_file(filename, recording):
-    print(f"写入文件：{filename}")
-    # 将字节数据合并
-    wav_data = b"".join(recording)
-    # 转换为 numpy 数组
-    audio_array = np.frombuffer(wav_data, dtype=np.int16)
-    # 写入 WAV 文件
-    write(filename, SAMPLE_RATE, audio_array)
-    return filename
-
-def pause_input():
-    """暂停音频输入"""
-    global input_paused
-    with pause_lock:
-        input_paused = True
-    print("[音频] 输入已暂停")
-
-def resume_input():
-    """恢复音频输入"""
-    global input_paused
-    with pause_lock:
-        input_paused = False
-    print("[音频] 输入已恢复")
+end_requested = False  # 由识别方请求提前结束当前录音
+echo_gate = None       # 回复播放期间的回声抑制（echo.EchoGate），由使用方设置；麦克风在播放时保持开启
+
+class Utterance:
+    """一段录音：内存中的单声道 int16 PCM"""
+    
+    def __init__(self, pcm: np.ndarray, sample_rate: int = SAMPLE_RATE):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+    
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / self.sample_rate
+    
+    def encode(self, codec: str = audio_codec.DEFAULT_CODEC) -> audio_codec.EncodedAudio:
+        """在内存中编码，用于上传"""
+        return audio_codec.encode(self.pcm, self.sample_rate, codec)
+
+def speech_started():
+    """检测到新的语音，开始录音（在音频回调线程中调用，必须尽快返回）"""
+
+def speech_confirmed():
+    """
+    本段录音的近端人声累计达到 BARGE_IN_FRAMES 帧（在音频回调线程中调用，必须尽快返回）
+
+    回复播放中时即为用户打断；VAD 刚触发时可能只是咳嗽或风噪，不在 speech_started 中打断。
+    """
+
+def speech_chunk(pcm: np.ndarray):
+    """录音过程中的每一帧（在音频回调线程中调用，必须尽快返回）"""
+
+def speech_captured(utterance: Utterance):
+    """一段录音结束（在音频回调线程中调用，必须尽快返回，识别和回复交给后台回合处理）"""
+
+def request_end():
+    """提前结束当前录音（如部分识别已得到完整指令），不再等待静默超时"""
+    global end_requested
+    end_requested = True
 
 def work():
-    recording = []
+    # 预分配录音缓冲区，回调里只做切片拷贝，不拼接字节串
+    recording = np.zeros(MAX_FRAMES * FRAME_SIZE, dtype=np.int16)
+    recorded = 0  # 已录制帧数
     silent_count = 0
+    voiced = 0  # 本段录音中的近端人声帧数
     threshold_frames=8  # 增加判断人声的帧数阈值
     silence_frames=20   # 增加判断静默的帧数阈值
     buffer = collections.deque(maxlen=threshold_frames)
     in_speech = False
     def callback(indata, frames, time_info, status):
-        nonlocal in_speech, silent_count
-        
-        # 检查是否暂停处理
-        with pause_lock:
-            if input_paused:
-                return
+        start = time.perf_counter()
+        try:
+            process(indata)
+        finally:
+            CALLBACK_TIME.observe(time.perf_counter() - start)
+    
+    def process(indata):
+        global end_requested
+        nonlocal in_speech, silent_count, recorded, voiced
         
         # 将 float32 转为 int16 PCM，并打包成字节
         audio_int16 = (indata.flatten() * 32767).astype(np.int16)  # 单通道
@@ -71,42 +95,40 @@ def work():
         except webrtcvad.Error:
             # 非法帧，忽略
             return  
+        # 回复播放期间，电平不超过回声估计的帧视为扬声器回声
+        if is_speech and echo_gate is not None and not echo_gate.near_end(audio_int16):
+            is_speech = False
         buffer.append(is_speech)
 
         if not in_speech and sum(buffer) > (threshold_frames // 2):
             in_speech = True
-            print("检测到人声，开始录音…")
-            recording.clear()
+            log.info("检测到人声，开始录音…")
+            recorded = 0
+            voiced = 0
+            end_requested = False
+            speech_started()
 
         if in_speech:
-            recording.append(audio_bytes)
+            recording[recorded * FRAME_SIZE:(recorded + 1) * FRAME_SIZE] = audio_int16
+            recorded += 1
+            speech_chunk(audio_int16)
             if not is_speech:
                 silent_count += 1
             else:
                 silent_count = 0
-            if silent_count > silence_frames or len(recording) > 1000:
-                print("检测到静默，结束录音。")
+                voiced += 1
+                if voiced == BARGE_IN_FRAMES:
+                    speech_confirmed()
+            if silent_count > silence_frames or recorded >= MAX_FRAMES or end_requested:
+                log.info("已识别到指令，提前结束录音" if end_requested else "检测到静默，结束录音")
                 in_speech = False
-                if len(recording) <= 50:
-                    print("录音太短，忽略")
+                silent_count = 0
+                if recorded <= MIN_FRAMES:
+                    log.info("录音太短，忽略（%d 帧）", recorded)
                     return
-                
-                # 暂停音频处理
-                pause_input()
-                
-                # 处理音频
-                tmp_file = "/tmp/" + str(uuid.uuid4())
-                write_file(tmp_file, recording)
-                
-                # 使用线程处理回调，避免阻塞
-                def process_callback():
-                    try:
-                        speech_captured(tmp_file)
-                    finally:
-                        # 无论是否出错，都恢复音频
-                        resume_input()
-                
-                threading.Thread(target=process_callback).start()
+
+                # 录音留在内存中交给回合处理；输入不暂停，回复过程中用户可以随时打断
+                speech_captured(Utterance(recording[:recorded * FRAME_SIZE].copy()))
                 
     # 启动流
     with sd.InputStream(channels=1,
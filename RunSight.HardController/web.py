@@ -1,62 +1,99 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import time
 import threading
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-from typing import Optional
-import os
+from typing import List, Optional
+
+import config
+import jobs
+import logs
+import metrics
+import network
+import telemetry
+
+log = logs.get("API")
 
 
 # 配置模型
 class Configure(BaseModel):
-    SpeedThreshold: Optional[float]
+    SpeedThreshold: Optional[float] = None
     WifiSSID: Optional[str] = None
     WifiPassword: Optional[str] = None
     UID: Optional[int] = None
+    TriggerTime: Optional[float] = None
+    DebounceTime: Optional[float] = None
+    BufferSeconds: Optional[float] = None
+    DecelThreshold: Optional[float] = None
+    MinStopSpeed: Optional[float] = None
+    ForwardAxis: Optional[str] = None  # +X / -X / +Y / -Y
 
 # 响应模型
 class Response(BaseModel):
     RetCode: int  # 0: 成功，1: 失败
     Message: str
+    JobId: Optional[str] = None  # 触发了后台任务（如重新配置网络）时的任务编号
+
+# 后台任务状态
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    state: str  # queued / running / succeeded / failed
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    coalesced: int = 0
+    result: Optional[str] = None
+    error: Optional[str] = None
 
 # 创建 FastAPI 应用
 app = FastAPI(title="RunSight 硬件控制器 API")
 
-# 全局配置
-current_config = Configure(
-    SpeedThreshold=-5.5,
-    WifiSSID="",
-    WifiPassword="",
-    UID=0
-)
+# 配置存储（与控制器共享，更新后控制器立即生效）
+store = config.shared()
+# 耗时操作在后台执行，不阻塞事件循环
+runner = jobs.shared()
+# 实时遥测（数据源由控制器接入）
+hub = telemetry.shared()
+# 运行指标（各模块在导入时注册）
+registry = metrics.shared()
+
 
 @app.get("/configure", response_model=Configure)
 async def get_configure():
     """获取当前配置"""
-    return current_config
+    settings = store.current
+    return Configure(**{name: getattr(settings, name) for name in config.FIELDS})
 
 @app.post("/configure", response_model=Response)
-async def update_configure(configure: Configure):
-    """更新配置"""
+def update_configure(configure: Configure):
+    """更新配置（在线程池中执行，写配置文件不占用事件循环）"""
     try:
         # 记录接收到的配置
-        print(f"[API] 接收到配置更新请求：{configure}")
+        fields = {name: getattr(configure, name) for name in config.FIELDS if getattr(configure, name) is not None}
+        if "WifiPassword" in fields:
+            fields["WifiPassword"] = "******"
+        log.info("接收到配置更新请求：%s", fields)
+        
+        # 校验并更新配置（未提供的字段保持不变），WiFi 变化由 network.watch 注册的回调提交后台任务
+        try:
+            old = store.current
+            new = store.update(**{name: getattr(configure, name) for name in config.FIELDS})
+        except ValueError as e:
+            return Response(RetCode=1, Message=str(e))
         
-        # 验证配置
-        if configure.SpeedThreshold is not None and not isinstance(configure.SpeedThreshold, (int, float)):
+        changes = config.diff(old, new)
+        if "WifiSSID" in changes or "WifiPassword" in changes:
+            job = runner.latest(network.WIFI_JOB)
             return Response(
-                RetCode=1,
-                Message=f"SpeedThreshold 必须是数字类型，收到：{type(configure.SpeedThreshold)}"
+                RetCode=0,
+                Message=f"配置更新成功，网络将在 {network.WIFI_DELAY:.0f} 秒后重新连接",
+                JobId=job.id if job is not None else None
             )
         
-        # 更新配置
-        global current_config
-        prev_config = current_config
-        current_config = configure
-        if prev_config.WifiSSID != current_config.WifiSSID or prev_config.WifiPassword != current_config.WifiPassword:
-            update_wifi()
-        
         # 返回成功响应
         return Response(
             RetCode=0,
@@ -64,9 +101,7 @@ async def update_configure(configure: Configure):
         )
     except Exception as e:
         # 记录详细错误信息
-        print(f"[API] 配置更新失败：{str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("配置更新失败：%s", e)
         
         # 返回失败响应
         return Response(
@@ -74,12 +109,78 @@ async def update_configure(configure: Configure):
             Message=f"配置更新失败：{str(e)}"
         )
 
+@app.get("/jobs", response_model=List[JobStatus])
+async def list_jobs():
+    """最近的后台任务"""
+    return [job.to_dict() for job in runner.jobs()]
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """查询后台任务状态"""
+    job = runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在：{job_id}")
+    return job.to_dict()
+
+@app.get("/telemetry")
+async def get_telemetry():
+    """遥测客户端和丢帧统计"""
+    return hub.stats()
+
+@app.websocket("/telemetry/ws")
+async def telemetry_ws(websocket: WebSocket, rate: Optional[float] = None, binary: bool = False,
+                       queue: int = telemetry.QUEUE_FRAMES):
+    """
+    实时遥测（WebSocket）
+
+    rate: 样本频率 (Hz)，默认原始采样率，0 表示只要状态和事件
+    binary: 样本帧用二进制消息发送（格式见 telemetry 模块）
+    queue: 客户端队列长度，处理不过来时丢弃最旧的帧
+    """
+    await websocket.accept()
+    client = f"ws {websocket.client.host}:{websocket.client.port}" if websocket.client else "ws"
+    encoding = telemetry.BINARY if binary else telemetry.JSON
+    subscriber = hub.subscribe(telemetry.Subscriber(rate, encoding, max(1, queue), asyncio.get_running_loop(), client))
+    try:
+        while not subscriber.closed:
+            frame = await subscriber.next()
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+
+@app.get("/telemetry/sse")
+async def telemetry_sse(request: Request, rate: Optional[float] = 10.0, queue: int = telemetry.QUEUE_FRAMES):
+    """实时遥测（Server-Sent Events，JSON 帧）"""
+    client = f"sse {request.client.host}:{request.client.port}" if request.client else "sse"
+    subscriber = hub.subscribe(telemetry.Subscriber(rate, telemetry.JSON, max(1, queue), asyncio.get_running_loop(), client))
+    
+    async def stream():
+        try:
+            while not subscriber.closed and not await request.is_disconnected():
+                frame = await subscriber.next()
+                yield f"data: {frame}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """运行指标（Prometheus 文本格式）"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/log")
+async def get_metrics_log(n: Optional[int] = 60):
+    """设备本地环形日志中最近 n 条指标记录"""
+    return registry.log.recent(n)
+
 def start_server(host: str = "0.0.0.0", port: int = 8000):
     """启动 FastAPI 服务器"""
+    network.watch(store, runner)
     uvicorn.run(app, host=host, port=port)
-    
-def update_wifi():
-    os.system("nmcli connection modify wifi 802-11-wireless-security.psk \"{}\"".format(current_config.WifiPassword))
-    os.system("nmcli connection modify wifi 802-11-wireless.ssid \"{}\"".format(current_config.WifiSSID))
-    os.system("nmcli connection down wifi")
-    os.system("nmcli connection up wifi")
\ No newline at end of file
@@ -1,62 +1,49 @@
 # -*- coding: utf-8 -*-
-import time
-from pinpong.board import Board
-from pinpong.extension.unihiker import accelerometer
-
-# 初始化开发板
-Board().begin()
+import hal
+from sampler import Sampler, COL_Z
+from detectors import DetectorPipeline, SmoothedStopDetector, StopEvent, alpha_for_rate
 
 # 急停检测参数（基于运动生物力学实验）
 Z_THRESHOLD = -4.5       # 急停阈值（m/s²）
-GRAVITY = 9.81           # 标准重力加速度
-BUFFER_SIZE = 8          # 数据窗口大小（0.4秒@20Hz采样）
-FILTER_FACTOR = 0.3      # 滤波系数
+SAMPLE_RATE = 20         # 采样率（Hz）
+TRIGGER_SAMPLES = 3      # 连续超阈值的样本数
+FILTER_FACTOR = 0.3      # 滤波系数（20Hz 下）
 
-class EmergencyStopDetector:
-    def __init__(self):
-        self.buffer = []
-        self.base_z = GRAVITY
-        self._calibrate()
-        
-    def _calibrate(self):
-        """静态校准获取基准Z轴值"""
-        print("校准中...保持设备静止")
-        samples = [accelerometer.get_z() for _ in range(50)]
-        self.base_z = sum(samples)/len(samples)
-        print(f"基准重力: {self.base_z:.1f}m/s²")
-    
-    def _process_z(self, raw_z):
-        """信号处理：滤波+去重力"""
-        return FILTER_FACTOR*(raw_z - self.base_z) + (1-FILTER_FACTOR)*self.base_z
-    
-    def check_stop(self):
-        """急停检测逻辑"""
-        processed_z = self._process_z(accelerometer.get_z())
-        net_z = processed_z - self.base_z
-        
-        # 维护数据缓冲
-        self.buffer.append(net_z)
-        if len(self.buffer) > BUFFER_SIZE:
-            self.buffer.pop(0)
-        
-        # 简化输出（单行刷新）
-        status = "NORMAL" if net_z > Z_THRESHOLD else "STOP!"
-        print(f"Z轴加速度: {net_z:6.2f}m/s² | 状态: {status.ljust(6)}", end='\r')
-        
-        # 触发条件：连续3次超阈值
-        return len(self.buffer)>=3 and all(z < Z_THRESHOLD for z in self.buffer[-3:])
+def calibrate(accelerometer):
+    """静态校准获取基准Z轴值"""
+    print("校准中...保持设备静止")
+    samples = [accelerometer.get_z() for _ in range(50)]
+    base_z = sum(samples)/len(samples)
+    print(f"基准重力: {base_z:.1f}m/s²")
+    return base_z
 
 def main():
-    detector = EmergencyStopDetector()
+    backend = hal.create_backend()
+    backend.begin()
+    accelerometer = backend.accelerometer()
+    
+    sampler = Sampler(accelerometer, SAMPLE_RATE)
+    pipeline = DetectorPipeline(sampler.buffer)
+    detector = pipeline.register(SmoothedStopDetector(
+        Z_THRESHOLD, TRIGGER_SAMPLES, alpha_for_rate(FILTER_FACTOR, SAMPLE_RATE), cooldown=0.0,
+        base_z=calibrate(accelerometer)))
+    pipeline.subscribe(StopEvent, lambda event: print("\n\033[41m! 急停检测 !\033[0m"))
+    
     print("=== 急停检测模式 ===")
-    print(f"阈值: {Z_THRESHOLD}m/s² 采样率: 20Hz")
+    print(f"阈值: {Z_THRESHOLD}m/s² 采样率: {SAMPLE_RATE}Hz")
     
+    sampler.start()
     try:
         while True:
-            if detector.check_stop():
-                print("\n\033[41m! 急停检测 !\033[0m")
-            time.sleep(0.05)
+            count = sampler.wait(pipeline.seq, timeout=0.5)
+            if count == pipeline.seq:
+                continue  # 超时未收到新样本（如采样尚未开始）
+            pipeline.process(count)
+            net_z = sampler.buffer.window(1)[0, COL_Z] - detector.base_z
+            status = "NORMAL" if net_z > Z_THRESHOLD else "STOP!"
+            print(f"Z轴加速度: {net_z:6.2f}m/s² | 状态: {status.ljust(6)}", end='\r')
     except KeyboardInterrupt:
+        sampler.stop()
         print("\n检测结束")
 
 if __name__ == "__main__":